@@ -3,14 +3,31 @@
 
 import sys
 import shutil
+import threading
 from PySide6 import QtWidgets, QtGui, QtCore
 from PySide6.QtWidgets import (
-    QMainWindow, QApplication, QMenu, QFileDialog, QListWidget, QDockWidget, QMessageBox, QLabel, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLineEdit, QTextEdit, QProgressBar, QFrame)
+    QMainWindow, QApplication, QMenu, QFileDialog, QListWidget, QDockWidget, QMessageBox, QLabel, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLineEdit, QTextEdit, QProgressBar, QFrame,
+    QDialog, QPlainTextEdit)
 from PySide6.QtGui import QIcon, QActionGroup, QAction, QKeySequence, QPixmap, QMovie
 from PySide6.QtCore import Qt, QProcess, QTimer, QPropertyAnimation, QEasingCurve, QRect
 from pymol._gui import PyMOLDesktopGUI
 from view import PymolGLWidget
 from styles import PROFESSIONAL_THEME, MAIN_COLORS, LOADING_ANIMATION_STYLE, get_loading_spinner_html
+from scheduler import (DockingScheduler, DOCKING_PRESETS, default_worker_count, find_report_directory,
+    next_output_directory, is_screening_preset, job_environment)
+from jobstore import JobStore, find_resumable_campaign, JOB_DB_NAME
+from ingest import ingest_campaign
+from sharding import create_shard_jobs, merge_shards, list_shard_outputs
+from costmodel import CostModel
+from joblog import LogHub, JOB_LOG_NAME
+from progress import format_eta
+from resultcache import ResultCache
+from ligprep import LigandPreparation, PREPARED_FOLDER
+from backend import DataBackend
+from ingest import load_complex
+from posebrowser import PoseQuery, PoseCursor, POSE_COLUMNS, find_campaign_database
+from snapshot import SnapshotService
+from sdfindex import LibraryIndex, is_library, safe_record_name
 import os
 from Bio.PDB import PDBParser, PDBIO, Select
 import subprocess
@@ -33,6 +50,18 @@ footer = os.path.join(mainpath, "Images", "Bluefooter.png")
 sphere = os.path.join(mainpath, "Images", "Sphere.png")
 pandapng = os.path.join(mainpath, "Images", "logo_new.png")
 pandapos = os.path.join(mainpath, "Images", "Pandaposter.png")
+
+# Docking output is buffered per job and written to the log dock in batches
+JOB_LOG_LINES = 2000
+LOG_FLUSH_MS = 200
+LOG_VIEW_BLOCKS = 5000
+
+# The campaign database is checkpointed and saved in a background thread
+CHECKPOINT_SECONDS = 30
+SNAPSHOT_POLL_MS = 200
+
+# Members of an SDF library listed in the object list, read by offset from its index
+LIBRARY_LIST_LIMIT = 1000
 template = os.path.join(mainpath, "Templates")
 
 class ImageDialog(QtWidgets.QDialog):
@@ -108,12 +137,17 @@ def show_stylish_messagebox(parent, title, message, icon=QMessageBox.Information
     msg_box.exec_()
 
 class QTextEditLogger(QtCore.QObject):
-    """Redirects sys.stdout/sys.stderr to a QTextEdit."""
+    """Redirects sys.stdout/sys.stderr to a QTextEdit, one insert per flush."""
     write_signal = QtCore.Signal(str)
 
-    def __init__(self, text_edit):
+    def __init__(self, text_edit, interval=LOG_FLUSH_MS):
         super().__init__()
         self.text_edit = text_edit
+        self.pending = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self._flush_text)
         self.write_signal.connect(self._append_text)
 
     def write(self, text):
@@ -123,9 +157,385 @@ class QTextEditLogger(QtCore.QObject):
         pass
 
     def _append_text(self, text):
-        self.text_edit.moveCursor(QtGui.QTextCursor.End)
-        self.text_edit.insertPlainText(text)
-        self.text_edit.moveCursor(QtGui.QTextCursor.End)
+        self.pending.append(text)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def _flush_text(self):
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        cursor = QtGui.QTextCursor(self.text_edit.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText(text)
+        scroll_bar = self.text_edit.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+class QProcessScheduler(DockingScheduler):
+    """Runs each docking job as a QProcess owned by the main window."""
+
+    def __init__(self, parent, max_workers=None, store=None, cost_model=None, cache=None):
+        super().__init__(max_workers, store=store, cost_model=cost_model, cache=cache)
+        self.parent = parent
+        self.logs = parent.job_logs
+
+    def launch(self, job):
+        process = QProcess(self.parent)
+        process.setProgram(self.program)
+        process.setArguments(job.arguments)
+        process.setProcessChannelMode(QProcess.MergedChannels)  # Merge stdout and stderr
+        # Each process gets its share of the cores, derived from the worker count
+        env = job_environment(self.job_threads())
+        process.setEnvironment(["{}={}".format(name, value) for name, value in env.items()])
+
+        # Output goes to the job log, the main window flushes it to the log dock on a timer
+        self.logs.open(job.output, job.name, os.path.join(job.output, JOB_LOG_NAME))
+        def on_output():
+            lines = self.logs.write(job.output, process.readAllStandardOutput().data().decode(errors="replace"))
+            self.update_progress(job, lines)
+
+        process.readyReadStandardOutput.connect(on_output)
+
+        def on_error(err):
+            if job.cancelled:
+                return
+            self.parent.log_text_edit.append("<span style='color:red;'>Process error: {}</span>".format(err))
+            # A process that never started will not emit finished
+            if err == QProcess.FailedToStart:
+                self.logs.close(job.output)
+                self.job_finished(job, -1)
+
+        def on_finished(exit_code, exit_status):
+            self.logs.close(job.output)
+            self.job_finished(job, exit_code if exit_status == QProcess.NormalExit else -1)
+
+        process.errorOccurred.connect(on_error)
+        process.finished.connect(on_finished)
+        job.process = process
+        process.start()
+
+    def process_id(self, job):
+        return job.process.processId()
+
+    def terminate(self, job):
+        if job.process is not None:
+            job.process.kill()
+
+class JobControlDialog(QDialog):
+    """Pause, resume, cancel and reorder the jobs of the running campaign."""
+
+    COLUMNS = ["Ligand", "State", "Progress", "Elapsed"]
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.main_window = parent
+        self.jobs = []
+        self.setWindowTitle("Docking Job Control")
+        self.resize(700, 500)
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+
+        job_buttons = QHBoxLayout()
+        for text, slot in [("Pause", self.pause_jobs), ("Resume", self.resume_jobs),
+                           ("Cancel", self.cancel_jobs), ("Move to Front", self.move_jobs_to_front)]:
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            job_buttons.addWidget(button)
+
+        campaign_buttons = QHBoxLayout()
+        for text, slot in [("Pause All", self.pause_all), ("Resume All", self.resume_all),
+                           ("Cancel All", self.cancel_all)]:
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            campaign_buttons.addWidget(button)
+        campaign_buttons.addWidget(QLabel("Workers"))
+        self.spinBox_workers = QtWidgets.QSpinBox()
+        self.spinBox_workers.setRange(1, max(1, os.cpu_count() or 1))
+        self.spinBox_workers.setValue(self.scheduler.max_workers if self.scheduler else default_worker_count())
+        self.spinBox_workers.valueChanged.connect(self.set_workers)
+        campaign_buttons.addWidget(self.spinBox_workers)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addLayout(job_buttons)
+        layout.addLayout(campaign_buttons)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    @property
+    def scheduler(self):
+        return getattr(self.main_window, "scheduler", None)
+
+    def refresh(self):
+        scheduler = self.scheduler
+        if scheduler is None:
+            return
+        self.jobs = list(scheduler.running) + list(scheduler.pending) + list(scheduler.completed)
+        selected = set(self.selected_jobs())
+        self.table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            values = [job.name, job.state, "{:.0f}%".format(job.progress * 100), format_eta(job.elapsed)]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+            if job in selected:
+                self.table.selectRow(row)
+
+    def selected_jobs(self):
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        return [self.jobs[row] for row in sorted(rows) if row < len(self.jobs)]
+
+    def pause_jobs(self):
+        for job in self.selected_jobs():
+            if job in self.scheduler.running and not self.scheduler.pause(job):
+                self.main_window.status_bar.showMessage("Pausing jobs is not supported on this platform")
+        self.refresh()
+
+    def resume_jobs(self):
+        for job in self.selected_jobs():
+            if job in self.scheduler.running:
+                self.scheduler.resume(job)
+        self.refresh()
+
+    def cancel_jobs(self):
+        for job in self.selected_jobs():
+            self.scheduler.cancel(job)
+        self.refresh()
+
+    def move_jobs_to_front(self):
+        self.scheduler.move_to_front([job for job in self.selected_jobs() if job in self.scheduler.pending])
+        self.refresh()
+
+    def pause_all(self):
+        if self.scheduler is None:
+            return
+        if not self.scheduler.pause():
+            self.main_window.status_bar.showMessage("Pausing jobs is not supported on this platform")
+        self.refresh()
+
+    def resume_all(self):
+        if self.scheduler is None:
+            return
+        self.scheduler.resume()
+        self.refresh()
+
+    def cancel_all(self):
+        if self.scheduler is None:
+            return
+        reply = QMessageBox.question(self, "Cancel Docking", "Cancel all unfinished docking jobs?")
+        if reply == QMessageBox.Yes:
+            self.main_window.cancel_docking()
+        self.refresh()
+
+    def set_workers(self, value):
+        if self.scheduler:
+            self.scheduler.set_max_workers(value)
+
+class JobLogDialog(QDialog):
+    """Shows the tail of a docking job log on demand."""
+
+    def __init__(self, job_logs, parent=None, lines=500):
+        super().__init__(parent)
+        self.job_logs = job_logs
+        self.lines = lines
+        self.setWindowTitle("Docking Job Logs")
+        self.resize(900, 600)
+
+        self.job_list = QListWidget()
+        self.job_list.currentItemChanged.connect(self.show_tail)
+        self.log_view = QPlainTextEdit()
+        self.log_view.setReadOnly(True)
+        self.log_view.setMaximumBlockCount(lines)
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh)
+
+        views = QHBoxLayout()
+        views.addWidget(self.job_list, 1)
+        views.addWidget(self.log_view, 3)
+        layout = QVBoxLayout(self)
+        layout.addLayout(views)
+        layout.addWidget(refresh_button)
+        self.refresh()
+
+    def refresh(self):
+        current = self.job_list.currentItem()
+        key = current.data(Qt.UserRole) if current else None
+        self.job_list.clear()
+        for job_key, name in self.job_logs.names():
+            campaign = os.path.basename(os.path.dirname(job_key))
+            item = QtWidgets.QListWidgetItem("{}/{}".format(campaign, name))
+            item.setData(Qt.UserRole, job_key)
+            self.job_list.addItem(item)
+            if job_key == key:
+                self.job_list.setCurrentItem(item)
+        if key is None and self.job_list.count():
+            self.job_list.setCurrentRow(self.job_list.count() - 1)
+
+    def show_tail(self, item, previous=None):
+        if item is None:
+            return
+        self.log_view.setPlainText("\n".join(self.job_logs.tail(item.data(Qt.UserRole), self.lines)))
+        self.log_view.moveCursor(QtGui.QTextCursor.End)
+
+class PoseTableModel(QtCore.QAbstractTableModel):
+    """Poses of a campaign database, fetched a page at a time while scrolling."""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.query = PoseQuery(db)
+        self.cursor = PoseCursor(self.query)
+        self.shown = 0
+
+    def reset(self):
+        self.beginResetModel()
+        self.cursor = PoseCursor(self.query)
+        self.shown = 0
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.shown
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(POSE_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.TextAlignmentRole):
+            return None
+        row = self.cursor.row(index.row())
+        value = row[index.column()] if row else None
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter) if isinstance(value, (int, float)) else None
+        if isinstance(value, float):
+            return "{:.3f}".format(value)
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return POSE_COLUMNS[section][2]
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self.cursor.can_fetch_more()
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        count = self.cursor.fetch_more()
+        if count:
+            self.beginInsertRows(QtCore.QModelIndex(), self.shown, self.shown + count - 1)
+            self.shown += count
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Sorting is done by SQL, the rows are fetched again from the first page
+        self.query.sort = POSE_COLUMNS[column][0]
+        self.query.descending = order == Qt.DescendingOrder
+        self.reset()
+
+    def set_filters(self, filters, best_only=False):
+        self.query.filters = filters
+        self.query.best_only = best_only
+        self.reset()
+
+    def pose(self, row):
+        return self.cursor.row(row)
+
+class PoseBrowserDialog(QDialog):
+    """Sort and filter all poses of a campaign and load them into PyMOL."""
+
+    def __init__(self, db_file, parent=None):
+        super().__init__(parent)
+        self.db_file = db_file
+        self.db = DataBackend()
+        self.db.connect(db_file, pool=True)
+        self.setWindowTitle("Pose Browser - {}".format(os.path.basename(os.path.dirname(db_file))))
+        self.resize(1000, 650)
+
+        self.model = PoseTableModel(self.db, self)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn([name for name, _, _ in POSE_COLUMNS].index("energy"), Qt.AscendingOrder)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.doubleClicked.connect(self.load_pose)
+
+        self.lineEdit_ligand = QLineEdit()
+        self.lineEdit_ligand.setPlaceholderText("Ligand contains")
+        self.lineEdit_energy = QLineEdit()
+        self.lineEdit_energy.setPlaceholderText("Energy <=")
+        self.lineEdit_le = QLineEdit()
+        self.lineEdit_le.setPlaceholderText("LE >=")
+        self.lineEdit_hits = QLineEdit()
+        self.lineEdit_hits.setPlaceholderText("Active site hits >=")
+        self.checkBox_best = QtWidgets.QCheckBox("Best pose per ligand")
+        apply_button = QPushButton("Apply")
+        apply_button.clicked.connect(self.apply_filters)
+        self.count_label = QLabel()
+
+        filters = QHBoxLayout()
+        for widget in (self.lineEdit_ligand, self.lineEdit_energy, self.lineEdit_le, self.lineEdit_hits,
+                       self.checkBox_best, apply_button):
+            filters.addWidget(widget)
+        layout = QVBoxLayout(self)
+        layout.addLayout(filters)
+        layout.addWidget(self.table)
+        layout.addWidget(self.count_label)
+        self.update_count()
+
+    def apply_filters(self):
+        filters = []
+        if self.lineEdit_ligand.text().strip():
+            filters.append(("ligand", "LIKE", "%{}%".format(self.lineEdit_ligand.text().strip())))
+        for line_edit, column, operator in [(self.lineEdit_energy, "energy", "<="),
+                                            (self.lineEdit_le, "le", ">="),
+                                            (self.lineEdit_hits, "hits", ">=")]:
+            text = line_edit.text().strip()
+            if not text:
+                continue
+            try:
+                filters.append((column, operator, float(text)))
+            except ValueError:
+                show_stylish_messagebox(self, "Invalid Filter", "{} is not a number: {}".format(line_edit.placeholderText(), text))
+                return
+        self.model.set_filters(filters, self.checkBox_best.isChecked())
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.setText("{} poses".format(self.model.query.count()))
+
+    def load_pose(self, index):
+        pose = self.model.pose(index.row())
+        if pose is None:
+            return
+        text = load_complex(self.db, pose[0])
+        if not text:
+            show_stylish_messagebox(self, "No Complex", "No structure was stored for this pose.")
+            return
+        name = "Output-{}_pose{}".format(os.path.splitext(os.path.basename(pose[1] or "pose"))[0], pose[2])
+        folder = os.path.join(os.path.dirname(self.db_file), "browser")
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, name + ".pdb")
+        with open(filename, "w") as fw:
+            fw.write(text)
+        CMD.load(filename, name)
+        CMD.show("cartoon", name)
+        CMD.orient(name)
+        CMD.disable("all")
+        CMD.enable(name)
+        if not OBJ.findItems(name, Qt.MatchExactly):
+            item = QtWidgets.QListWidgetItem(name)
+            item.setData(Qt.UserRole, filename)
+            OBJ.addItem(item)
+
+    def done(self, result):
+        self.db.close()
+        super().done(result)
 
 class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
     def __init__(self):
@@ -362,6 +772,17 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
         self.stdout_logger = QTextEditLogger(self.log_text_edit)
         sys.stdout = self.stdout_logger
         sys.stderr = self.stdout_logger
+
+        # Bounded per-job docking logs, flushed to the log dock in batches
+        self.log_text_edit.document().setMaximumBlockCount(LOG_VIEW_BLOCKS)
+        self.job_logs = LogHub(JOB_LOG_LINES)
+        self.library_indexes = {}
+        # Ligand preparation feeding the scheduler, see prepare_ligands
+        self.preparation = None
+        self.preparation_timer = None
+        self.log_flush_timer = QTimer(self)
+        self.log_flush_timer.timeout.connect(self.flush_job_logs)
+        self.log_flush_timer.start(LOG_FLUSH_MS)
         print("\n" + "═"*60)
         print("🚀 Welcome to PandaDock - Molecular Docking Suite")
         print("Version 2.0 - Professional GUI Edition")
@@ -480,6 +901,16 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
                     self.ligand_button.setStyleSheet(self.enabled_button_style)
                     self.protein_button.setEnabled(False)
                     self.binding_site_button.setEnabled(False)
+
+                    # Offer to pick up a docking run interrupted by a crash or reboot
+                    resumable = find_resumable_campaign(main_directory)
+                    if resumable:
+                        reply = QMessageBox.question(self, "Resume Docking",
+                            "An unfinished docking run was found in {}.\nDo you want to resume it?".format(resumable))
+                        if reply == QMessageBox.Yes:
+                            self.resume_campaign(resumable)
+                            self.results_button.setEnabled(True)
+                            self.results_button.setStyleSheet(self.enabled_button_style)
                    
                     
 
@@ -508,6 +939,16 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
                         # Copy the ligand file to the Ligand folder
                         shutil.copy(file, new_folder)
                         file_name = os.path.basename(file)
+                        library_file = os.path.join(new_folder, file_name)
+                        if file_name.lower().endswith(".sdf") and is_library(library_file):
+                            # List the library members from its index instead of parsing it
+                            index = self.open_library_index(library_file)
+                            for i, name in enumerate(index.names(count=LIBRARY_LIST_LIMIT)):
+                                item = QtWidgets.QListWidgetItem("Ligand-" + (safe_record_name(name) or str(i + 1)))
+                                item.setData(Qt.UserRole, (library_file, i))
+                                self.object_list.addItem(item)
+                            print("Indexed library {}: {} molecules".format(file_name, len(index)))
+                            continue
                         real_file_name = os.path.splitext(file_name)[0]
                         final_name = "Ligand-" + real_file_name
                         # Add the file path as a hidden data attribute to the object list item
@@ -679,6 +1120,7 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
 
                     if os.path.exists(output_dir):
                       try:
+                        resultdir = find_report_directory(output_dir)
                         dialogxreport()
                       except Exception as e:
                         show_stylish_messagebox(self, "Error", "An error occurred while viewing results: {}".format(str(e)))
@@ -820,117 +1262,233 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
 
     
     def run_exe_vs(self ,args, ligand_path, protein_file, output_directory, x, y, z, radius):
-          
-        process = QProcess(self)
-        process.setProgram("pandadock")
-        process.setArguments(args + [
-            "--protein", protein_file,
-            "--screen", ligand_path,
-            "--center", str(x), str(y), str(z),
-            "--size", "20", "20", "20",
-            "--out", output_directory
-        ])
-        process.setProcessChannelMode(QProcess.MergedChannels)
-        process.readyReadStandardOutput.connect(lambda: self.log_text_edit.append(process.readAllStandardOutput().data().decode()))
-        process.readyReadStandardError.connect(lambda: self.log_text_edit.append("<span style='color:red;'>{}</span>".format(process.readAllStandardError().data().decode())))
-        process.errorOccurred.connect(lambda err: self.log_text_edit.append("<span style='color:red;'>Process error: {}</span>".format(err)))
-        def on_finished():
-            self.log_text_edit.append("<span style='color:green;'>Process finished.</span>")
-            show_stylish_messagebox(self, "Simulation Complete", "Simulation Complete.")
-        process.finished.connect(on_finished)
-        process.start()
-        if not hasattr(self, "processes"):
-            self.processes = []
-        self.processes.append(process)
+        self.run_screen(args, ligand_path, protein_file, output_directory, (x, y, z))
 
     def run_exe_vs_pocket(self ,args, ligand_path, protein_file, output_directory):
-          
-        process = QProcess(self)
-        process.setProgram("pandadock")
-        process.setArguments(args + [
-            "--protein", protein_file,
-            "--screen", ligand_path,
-            "--out", output_directory 
-            ])
-        process.setProcessChannelMode(QProcess.MergedChannels)
-        process.readyReadStandardOutput.connect(lambda: self.log_text_edit.append(process.readAllStandardOutput().data().decode()))
-        process.readyReadStandardError.connect(lambda: self.log_text_edit.append("<span style='color:red;'>{}</span>".format(process.readAllStandardError().data().decode())))
-        process.errorOccurred.connect(lambda err: self.log_text_edit.append("<span style='color:red;'>Process error: {}</span>".format(err)))
-        def on_finished():
-            self.log_text_edit.append("<span style='color:green;'>Process finished.</span>")
+        self.run_screen(args, ligand_path, protein_file, output_directory)
+
+    def run_screen(self, args, ligand_path, protein_file, output_directory, center=None):
+            # A screen is one job of output_N/pandadock.db like a shard, so it is resumed and ingested the same way
+            os.makedirs(output_directory, exist_ok=True)
+            store = JobStore(output_directory)
+            store.save_campaign(args, protein_file, center)
+            self.scheduler = QProcessScheduler(self, 1, store)
+            self.campaign_directory = output_directory
+            self.scheduler.submit(self.scheduler.create_screening_job(
+                args, ligand_path, protein_file, output_directory, center))
+            self.start_scheduler()
+
+    def run_ligand_queue(self, args, ligand_queue, protein_file, output_directory, center=None, max_workers=None, prepare=False):
+            # Every queued ligand is recorded in output_N/pandadock.db so the run can be resumed
+            store = JobStore(output_directory)
+            store.save_campaign(args, protein_file, center)
+            # Start the slowest ligands first, predicted from earlier runs of this session
+            cost_model = CostModel.from_history(os.path.dirname(output_directory))
+            # Ligands docked before with the same protein, box and arguments come from the cache
+            scheduler = QProcessScheduler(self, max_workers, store, cost_model, ResultCache())
+            self.scheduler = scheduler
+            self.campaign_directory = output_directory
+
+            def create_job(ligand_path):
+                return scheduler.create_job(args, ligand_path, protein_file, output_directory, center)
+
+            if prepare:
+                prepared_folder = os.path.join(os.path.dirname(output_directory), PREPARED_FOLDER)
+                self.prepare_ligands(ligand_queue, prepared_folder, create_job)
+            else:
+                scheduler.submit_many(create_job(ligand_path) for ligand_path in ligand_queue)
+            self.start_scheduler()
+
+    def prepare_ligands(self, ligand_queue, prepared_folder, create_job, ph=7.4, job_ids=None):
+            # Dock every ligand as soon as the preparation pool has it ready
+            scheduler = self.scheduler
+            # Preparation gets the cores the docking slots leave free
+            preparation = LigandPreparation(ligand_queue, prepared_folder, scheduler.spare_cores(), ph=ph, job_ids=job_ids)
+            # Queued ligands get their jobs rows now, so a crash during preparation can be resumed
+            preparation.start(scheduler.store)
+            scheduler.open_feed()
+            self.preparation = preparation
+            print("Preparing {} ligands in {}".format(len(ligand_queue), prepared_folder))
+
+            def feed():
+                if preparation.feed(scheduler, create_job):
+                    return
+                self.preparation_timer.stop()
+                if preparation.failed:
+                    print("{} ligands could not be prepared, see {}".format(
+                        len(preparation.failed), preparation.manifest))
+
+            self.preparation_timer = QTimer(self)
+            self.preparation_timer.timeout.connect(feed)
+            self.preparation_timer.start(250)
+
+    def resume_campaign(self, output_directory, max_workers=None):
+            store = JobStore(output_directory)
+            cost_model = CostModel.from_history(os.path.dirname(output_directory))
+            self.scheduler = QProcessScheduler(self, max_workers, store, cost_model, ResultCache())
+            self.campaign_directory = output_directory
+            count = store.resume(self.scheduler)
+            print("Resuming {}: {} interrupted ligands requeued".format(output_directory, count))
+            # Ligands that were still waiting for preparation are prepared again
+            unprepared = store.unprepared()
+            if unprepared:
+                args, protein_file, center = store.load_campaign()
+                prepared_folder, ph, _ = store.load_preparation()
+                def create_job(ligand_path):
+                    return self.scheduler.create_job(args, ligand_path, protein_file, output_directory, center)
+                self.prepare_ligands(list(unprepared), prepared_folder, create_job, ph, unprepared)
+            self.start_scheduler(self.merge_shard_outputs if store.load_shards() else None)
+
+    def run_sharded_screen(self, args, ligand_path, protein_file, output_directory, center=None, shards=2):
+            # Split the library into balanced shards, screen them in parallel and merge into output_N
+            os.makedirs(output_directory, exist_ok=True)
+            # Shards are jobs rows like ligands, so a sharded screen can be resumed and cached
+            store = JobStore(output_directory)
+            store.save_campaign(args, protein_file, center, shards)
+            cost_model = CostModel.from_history(os.path.dirname(output_directory))
+            self.scheduler = QProcessScheduler(self, shards, store, cost_model, ResultCache())
+            self.campaign_directory = output_directory
+            self.scheduler.submit_many(create_shard_jobs(
+                self.scheduler, args, ligand_path, protein_file, output_directory, center, shards, cost_model))
+            self.start_scheduler(self.merge_shard_outputs)
+
+    def merge_shard_outputs(self):
+            # Shards finished before a resume are merged too
+            output_directory = self.campaign_directory
+            shard_outputs = list_shard_outputs(output_directory)
+            skipped = merge_shards(output_directory, shard_outputs)
+            print("Merged {} shards into {}".format(len(shard_outputs) - len(skipped), output_directory))
+            if skipped:
+                print("Not merged, failed or incomplete: {}".format(', '.join(skipped)))
+            self.on_docking_complete()
+
+    def ingest_results(self, output_directory):
+            # Store poses and scores in output_N/pandadock.db without blocking the GUI
+            def ingest():
+                count = ingest_campaign(output_directory)
+                print("Stored {} poses in {}".format(count, os.path.join(output_directory, JOB_DB_NAME)))
+
+            threading.Thread(target=ingest, daemon=True).start()
+
+    def cancel_docking(self):
+            # Nothing prepared after the cancel is docked
+            if self.preparation_timer is not None:
+                self.preparation_timer.stop()
+            if self.preparation is not None:
+                self.preparation.cancel()
+                self.preparation = None
+            self.scheduler.cancel()
+
+    def start_scheduler(self, on_complete=None):
+            self.scheduler.on_started = lambda job: print("Docking Ligand: {}".format(job.ligand))
+            self.scheduler.on_finished = self.on_docking_job_finished
+            self.scheduler.on_progress = self.on_docking_progress
+            self.scheduler.on_complete = on_complete or self.on_docking_complete
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(0)
+            self.progress_bar.setVisible(True)
+            print("Docking {} ligands with {} concurrent workers".format(
+                self.scheduler.total, self.scheduler.max_workers))
+            self.start_checkpoints()
+            self.scheduler.start()
+
+            if self.scheduler.idle():
+                self.scheduler.on_complete()
+
+    def on_docking_job_finished(self, job):
+            if job.cancelled:
+                print("Docking cancelled for {}".format(job.name))
+            elif not job.succeeded:
+                self.log_text_edit.append("<span style='color:red;'>Docking failed for {} (exit code {})</span>".format(job.name, job.exit_code))
+
+            summary = self.scheduler.summary()
+            print(summary)
+            self.status_bar.showMessage(summary)
+            self.progress_bar.setValue(int(self.scheduler.progress() * 100))
+
+    def on_docking_progress(self, job):
+            self.progress_bar.setValue(int(self.scheduler.progress() * 100))
+            self.status_bar.showMessage("Docking {}: {:.0f}% (ETA {}) | Campaign {:.0f}% (ETA {})".format(
+                job.name, job.progress * 100, format_eta(self.scheduler.job_eta(job)),
+                self.scheduler.progress() * 100, format_eta(self.scheduler.eta())))
+
+    def start_checkpoints(self):
+            # Job status commits stay fast, WAL checkpoints run in the snapshot thread
+            self.stop_checkpoints()
+            if self.scheduler.store is None:
+                return
+            self.scheduler.store.db.pragma('wal_autocheckpoint', 0)
+            self.checkpoint_service = SnapshotService(self.scheduler.store.db, interval=CHECKPOINT_SECONDS)
+            self.checkpoint_service.start()
+
+    def stop_checkpoints(self):
+            service = getattr(self, "checkpoint_service", None)
+            if service is not None:
+                service.stop(wait=False)
+                self.checkpoint_service = None
+
+    def save_results_database(self):
+            db_file = find_campaign_database(getattr(self, "campaign_directory", None))
+            if db_file is None:
+                self.status_bar.showMessage("No docking results to save")
+                return
+            if getattr(self, "snapshot_service", None) is not None and self.snapshot_service.running:
+                self.status_bar.showMessage("The results database is already being saved")
+                return
+            target, _ = QFileDialog.getSaveFileName(self, "Save Results Database", db_file, "SQLite Database (*.db)")
+            if not target or os.path.abspath(target) == os.path.abspath(db_file):
+                return
+            db = DataBackend()
+            db.connect(db_file, pool=True)
+            self.snapshot_service = SnapshotService(db, target)
+            self.snapshot_service.start()
+
+            def poll():
+                service = self.snapshot_service
+                if service.running:
+                    self.status_bar.showMessage("Saving results database: {:.0f}%".format(service.progress * 100))
+                    return
+                self.snapshot_timer.stop()
+                db.close()
+                if service.error is not None:
+                    show_stylish_messagebox(self, "Error", "Could not save the results database: {}".format(service.error))
+                else:
+                    self.status_bar.showMessage("Results database saved to {}".format(target))
+
+            self.snapshot_timer = QTimer(self)
+            self.snapshot_timer.timeout.connect(poll)
+            self.snapshot_timer.start(SNAPSHOT_POLL_MS)
+
+    def on_docking_complete(self):
+            self.stop_checkpoints()
+            self.progress_bar.setVisible(False)
+            print("Simulation Has Been Completed.")
+            print(self.scheduler.summary())
+            self.ingest_results(self.campaign_directory)
             show_stylish_messagebox(self, "Simulation Complete", "Simulation Complete.")
-        process.finished.connect(on_finished)
-        process.start()
-        if not hasattr(self, "processes"):
-            self.processes = []
-        self.processes.append(process)
-   
 
-    def run_exe(self ,args, ligand_path, protein_file, output_directory, x, y, z, radius, ligand_queue):
-            # Example: Replace with your actual .exe path
-            process = QProcess(self)
-            process.setProgram("pandadock")
-            process.setArguments(args + [
-            "--ligand", ligand_path,
-            "--protein", protein_file,
-            "--center", str(x), str(y), str(z),
-            "--size", "20", "20", "20",
-            "--out", output_directory
-             ])
-            process.setProcessChannelMode(QProcess.MergedChannels)  # Merge stdout and stderr
-
-            # Connect signals
-            process.readyReadStandardOutput.connect(lambda: self.log_text_edit.append(process.readAllStandardOutput().data().decode()))
-            process.readyReadStandardError.connect(lambda: self.log_text_edit.append("<span style='color:red;'>{}</span>".format(process.readAllStandardError().data().decode())))
-            process.finished.connect(lambda: self.process_next_ligand(args, ligand_queue, protein_file, output_directory, x, y, z, radius))
-            process.start()
-            self.current_process = process
-    def run_exe_pocket(self ,args, ligand_path, protein_file, output_directory, ligand_queue):
-            # Example: Replace with your actual .exe path
-            process = QProcess(self)
-            process.setProgram("pandadock")
-            process.setArguments(args + [
-            "--ligand", ligand_path,
-            "--protein", protein_file,
-            "--out", output_directory
-             ])
-            process.setProcessChannelMode(QProcess.MergedChannels)  # Merge stdout and stderr
-
-            # Connect signals
-            process.readyReadStandardOutput.connect(lambda: self.log_text_edit.append(process.readAllStandardOutput().data().decode()))
-            process.readyReadStandardError.connect(lambda: self.log_text_edit.append("<span style='color:red;'>{}</span>".format(process.readAllStandardError().data().decode())))
-            process.finished.connect(lambda: self.process_next_ligand_pocket(args, ligand_queue, protein_file, output_directory, x, y, z, radius))
-            process.start()
-            self.current_process = process
+    def flush_job_logs(self):
+            text = self.job_logs.drain()
+            if text:
+                self.stdout_logger.write(text + "\n")
 
-    
-
-  
+    def show_job_logs(self):
+            JobLogDialog(self.job_logs, self).exec_()
 
-        # Connect buttons to their respective functions
-    def process_next_ligand(self, args, ligand_queue, protein_file, output_directory, x, y, z, radius):
-            if not ligand_queue:
-                print("Simulation Has Been Completed.")
-                show_stylish_messagebox(self, "Simulation Complete", "Simulation Complete.")
+    def show_job_control(self):
+            if not hasattr(self, "scheduler"):
+                self.status_bar.showMessage("No docking campaign is running")
                 return
-            
-            
-            ligand_path = ligand_queue.pop(0)
-            print("Docking Ligand: {}".format(ligand_path))
-            self.run_exe( args, ligand_path, protein_file, output_directory, x, y, z, radius, ligand_queue)
-
-    def process_next_ligand_pocket(self,args, ligand_queue, protein_file, output_directory, x, y, z, radius):
-            if not ligand_queue:
-                print("Simulation Has Been Completed.")
-                show_stylish_messagebox(self, "Simulation Complete", "Simulation Complete.")
+            self.job_control_dialog = JobControlDialog(self)
+            self.job_control_dialog.show()
+
+    def show_pose_browser(self, directory=None):
+            db_file = find_campaign_database(directory or getattr(self, "campaign_directory", None))
+            if db_file is None:
+                self.status_bar.showMessage("No docking results to browse")
                 return
-            
-            
-            ligand_path = ligand_queue.pop(0)
-            print("Docking Ligand: {}".format(ligand_path))
-            self.run_exe_pocket(args, ligand_path, protein_file, output_directory, ligand_queue)
+            PoseBrowserDialog(db_file, self).exec_()
 
-                
     def create_shortcuts(self):
         undo_action = QAction("Undo", self)
         undo_action.setShortcut(QKeySequence("Ctrl+Z")) # Press Ctrl+Z to Undo
@@ -940,6 +1498,22 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
         orient_action.setShortcut(QKeySequence("Ctrl+O")) # Press Ctrl+Shift+O to Orietn Properly
         orient_action.triggered.connect(self.orient_current_object)
         self.addAction(orient_action)
+        job_logs_action = QAction("Docking Job Logs", self)
+        job_logs_action.setShortcut(QKeySequence("Ctrl+L")) # Press Ctrl+L to view the tail of a job log
+        job_logs_action.triggered.connect(self.show_job_logs)
+        self.addAction(job_logs_action)
+        job_control_action = QAction("Docking Job Control", self)
+        job_control_action.setShortcut(QKeySequence("Ctrl+J")) # Press Ctrl+J to pause, cancel or reorder docking jobs
+        job_control_action.triggered.connect(self.show_job_control)
+        self.addAction(job_control_action)
+        pose_browser_action = QAction("Pose Browser", self)
+        pose_browser_action.setShortcut(QKeySequence("Ctrl+B")) # Press Ctrl+B to sort and filter the docked poses
+        pose_browser_action.triggered.connect(lambda: self.show_pose_browser())
+        self.addAction(pose_browser_action)
+        save_database_action = QAction("Save Results Database", self)
+        save_database_action.setShortcut(QKeySequence("Ctrl+Shift+S")) # Press Ctrl+Shift+S to copy the results database in the background
+        save_database_action.triggered.connect(self.save_results_database)
+        self.addAction(save_database_action)
 
     def show_file_viewer(self, file_path):
         """Show a simple file viewer dialog for text files"""
@@ -963,6 +1537,23 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
         dialog.setIcon(QMessageBox.Information)
         dialog.exec_()
 
+    def open_library_index(self, library_file):
+        # One open index per library, reopened when the library was copied again
+        index = self.library_indexes.get(library_file)
+        if index is None or index.stale():
+            if index is not None:
+                index.close()
+            index = self.library_indexes[library_file] = LibraryIndex.open(library_file)
+        return index
+
+    def load_object(self, file_path, obj_name):
+        # Library members are stored as (library, index) and read by offset
+        if isinstance(file_path, tuple):
+            library_file, i = file_path
+            self.cmd.read_sdfstr(self.open_library_index(library_file).read(i), obj_name)
+        else:
+            self.cmd.load(file_path, obj_name)
+
     def on_object_selected(self, item):
         try:
             # Get the file path stored in the item's data
@@ -971,7 +1562,7 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
 
             # Check if the object is already loaded in PyMOL
             if obj_name not in self.cmd.get_object_list():
-                self.cmd.load(file_path, obj_name)  # Load the file into PyMOL
+                self.load_object(file_path, obj_name)  # Load the file into PyMOL
 
             # Determine the representation based on the object type
             if obj_name.startswith("Ligand-"):
@@ -1052,7 +1643,7 @@ class PyMOLOnlyWindow(QMainWindow, PyMOLDesktopGUI):
 
         # Check if the object is already loaded in PyMOL
         if obj_name not in self.cmd.get_object_list():
-            self.cmd.load(file_path, obj_name)  # Load the file into PyMOL
+            self.load_object(file_path, obj_name)  # Load the file into PyMOL
             self.cmd.show("sticks", obj_name)  # Show the object in "sticks" representation
             print("Loaded object: {}".format(obj_name))
 
@@ -1968,20 +2559,8 @@ class Ui_Formdock(object):
         self.listWidget.addItem(item)
         item = QtWidgets.QListWidgetItem()
         def run_exe_vs(parent, args ,ligand_path, protein_file, output_directory, x, y, z, radius):
-            # Example: Replace with your actual .exe path
-            if not hasattr(parent, "processes"):
-              parent.processes = []
-            process = QProcess(parent)
-            process.setProgram("pandadock")
-            process.setArguments(args + ["--ligand-library", ligand_path,"-p", protein_file, "-o", output_directory, "-s", str(x), str(y), str(z), "--grid-radius", str(radius)])
-            print(process.arguments())
-            process.setProcessChannelMode(QProcess.MergedChannels)
-            process.readyReadStandardOutput.connect(lambda: log_text_edit.append(process.readAllStandardOutput().data().decode()))
-            process.readyReadStandardError.connect(lambda: log_text_edit.append("<span style='color:red;'>{}</span>".format(process.readAllStandardError().data().decode())))
-            process.errorOccurred.connect(lambda err: log_text_edit.append("<span style='color:red;'>Process error: {}</span>".format(err)))
-            process.finished.connect(lambda: log_text_edit.append("<span style='color:green;'>Process finished.</span>"))
-            process.start()
-            parent.processes.append(process)
+            # The main window runs the screen, its output goes through the job logs
+            parent.run_exe_vs(args, ligand_path, protein_file, output_directory, x, y, z, radius)
 
         self.listWidget.addItem(item)
         self.listWidget.setStyleSheet("""
@@ -2054,18 +2633,7 @@ class Ui_Formdock(object):
     }
 """)
         
-        self.dictx = { 
-            "Fast Mode - PandaCore": "--mode fast --scoring pandacore --num-poses 9 --exhaustiveness 8",
-            "Balanced Mode - PandaML": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --ml-rescoring",
-            "Precise Mode - PandaPhysics": "--mode precise --scoring pandaphysics --num-poses 50 --exhaustiveness 32 --side-chain-flexibility",
-            "Virtual Screening - Fast": "--mode fast --scoring pandacore --num-poses 5 --exhaustiveness 4 --save-poses",
-            "Virtual Screening - Balanced": "--mode balanced --scoring pandaml --num-poses 10 --exhaustiveness 8 --ml-rescoring --save-poses",
-            "High-Precision Docking": "--mode precise --scoring pandaphysics --num-poses 100 --exhaustiveness 64 --side-chain-flexibility --save-complex",
-            "Flexible Residue Docking": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --side-chain-flexibility --ml-rescoring",
-            "GPU-Accelerated Docking": "--mode fast --scoring pandacore --num-poses 20 --exhaustiveness 16 --gpu",
-            "Complete Analysis Suite": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --ml-rescoring --pandamap --pandamap-3d --all-outputs --plots --interaction-maps",
-            "Metal Complex Docking": "--mode precise --scoring pandaphysics --num-poses 50 --exhaustiveness 32 --side-chain-flexibility --save-complex --pandamap",
-        }
+        self.dictx = dict(DOCKING_PRESETS)
         font = QtGui.QFont()
         font.setPointSize(11)
         self.plainTextEdit.setFont(font)
@@ -2106,24 +2674,23 @@ class Ui_Formdock(object):
                 command = self.plainTextEdit.toPlainText()
                 
                 # Check if this is a virtual screening task
-                is_virtual_screening = "Virtual Screening" in self.listWidget.currentItem().text() if self.listWidget.currentItem() else False
+                is_virtual_screening = is_screening_preset(self.listWidget.currentItem().text()) if self.listWidget.currentItem() else False
                 
                 if is_virtual_screening:
                     # For virtual screening, use --screen parameter
                     ligand_path = os.path.join(main_directory, 'Ligand')
                     protein_file = os.path.join(protein_folder, os.listdir(protein_folder)[0])
-                    if os.path.exists(os.path.join(main_directory, 'output')):
-                         num = 0
-                         for file in os.listdir(main_directory):
-                            if file.startswith("output"):
-                                 num += 1
-                         output_directory = os.path.join(main_directory, 'output_{}'.format(num))
-                    else:
-
-                       output_directory = os.path.join(main_directory, 'output')
+                    output_directory = next_output_directory(main_directory)
                     dialogdockx.close()
                     main_window = dock.parent()  # dock is the dialog, its parent is the main window
-                    if main_window:
+                    workers = self.spinBox_workers.value()
+                    if main_window and workers > 1:
+                        # Shard the library over several --screen processes
+                        center = None if sitemethod == 'Detect' else (x, y, z)
+                        main_window.run_sharded_screen(
+                            command.split(), ligand_path, protein_file, output_directory, center, workers
+                        )
+                    elif main_window:
                         if sitemethod == 'Detect':
                             main_window.run_exe_vs_pocket(
                                 command.split(), ligand_path, protein_file, output_directory
@@ -2135,15 +2702,7 @@ class Ui_Formdock(object):
                         
                 else:
                     # For single ligand docking, use --ligand parameter
-                    if os.path.exists(os.path.join(main_directory, 'output')):
-                         num = 0
-                         for file in os.listdir(main_directory):
-                            if file.startswith("output"):
-                                 num += 1
-                         output_directory = os.path.join(main_directory, 'output_{}'.format(num))
-                    else:
-
-                       output_directory = os.path.join(main_directory, 'output')
+                    output_directory = next_output_directory(main_directory)
                     protein_file = os.path.join(protein_folder, os.listdir(protein_folder)[0])
                    
                     if os.path.exists(output_directory):
@@ -2158,10 +2717,12 @@ class Ui_Formdock(object):
                     dialogdockx.close()
                     main_window = dock.parent() 
                     if main_window:
+                        workers = self.spinBox_workers.value()
+                        prepare = self.checkBox_prepare.isChecked()
                         if sitemethod == 'Detect':
-                            main_window.process_next_ligand_pocket( command.split(), ligand_queue , protein_file, output_directory ) 
+                            main_window.run_ligand_queue( command.split(), ligand_queue , protein_file, output_directory, max_workers=workers, prepare=prepare )
                         else:
-                            main_window.process_next_ligand( command.split(), ligand_queue , protein_file, output_directory, x, y, z, radius )
+                            main_window.run_ligand_queue( command.split(), ligand_queue , protein_file, output_directory, (x, y, z), max_workers=workers, prepare=prepare )
             
         self.pushButton = QtWidgets.QPushButton(dock)
         self.pushButton.setGeometry(QtCore.QRect(740, 480, 93, 28))
@@ -2186,6 +2747,19 @@ class Ui_Formdock(object):
         self.radioButton = QtWidgets.QRadioButton(dock)
         self.radioButton.setGeometry(QtCore.QRect(140, 320, 95, 31))
         self.radioButton.setObjectName("radioButton")
+        self.label_workers = QtWidgets.QLabel(dock)
+        self.label_workers.setGeometry(QtCore.QRect(260, 320, 71, 31))
+        self.label_workers.setObjectName("label_workers")
+        self.spinBox_workers = QtWidgets.QSpinBox(dock)
+        self.spinBox_workers.setGeometry(QtCore.QRect(330, 320, 61, 31))
+        self.spinBox_workers.setRange(1, max(1, os.cpu_count() or 1))
+        self.spinBox_workers.setValue(default_worker_count())
+        self.spinBox_workers.setToolTip("Number of pandadock processes to run at the same time")
+        self.spinBox_workers.setObjectName("spinBox_workers")
+        self.checkBox_prepare = QtWidgets.QCheckBox(dock)
+        self.checkBox_prepare.setGeometry(QtCore.QRect(410, 320, 141, 31))
+        self.checkBox_prepare.setToolTip("Protonate and add hydrogens and charges to the ligands before docking")
+        self.checkBox_prepare.setObjectName("checkBox_prepare")
         self.pushButton_2 = QtWidgets.QPushButton(dock)
         self.pushButton_2.setGeometry(QtCore.QRect(30, 320, 93, 10))
         self.pushButton_2.setObjectName("pushButton_2")
@@ -2241,6 +2815,8 @@ class Ui_Formdock(object):
         self.listWidget.setSortingEnabled(__sortingEnabled)
         self.pushButton.setText(_translate("dock", "Execute"))
         self.radioButton.setText(_translate("dock", "GPU"))
+        self.label_workers.setText(_translate("dock", "Workers"))
+        self.checkBox_prepare.setText(_translate("dock", "Prepare ligands"))
         self.pushButton_2.setText(_translate("dock", "Choose"))
         
 
@@ -2514,6 +3090,11 @@ class Ui_Dialogreport(object):
             }
         """)
         self.pushButton_4.clicked.connect(show_png_interactions)
+        self.pushButton_5 = QtWidgets.QPushButton(Dialogreport)
+        self.pushButton_5.setGeometry(QtCore.QRect(610, 560, 111, 28))
+        self.pushButton_5.setObjectName("pushButton_5")
+        self.pushButton_5.setStyleSheet(self.pushButton_4.styleSheet())
+        self.pushButton_5.clicked.connect(lambda: Dialogreport.parent().show_pose_browser(resultdir))
         self.retranslateUi(Dialogreport)
         self.tabWidget.setCurrentIndex(0)
         QtCore.QMetaObject.connectSlotsByName(Dialogreport)
@@ -2529,6 +3110,7 @@ class Ui_Dialogreport(object):
         self.pushButton_2.setText(_translate("Dialogreport", "Add Output"))
         self.pushButton_3.setText(_translate("Dialogreport", "Refine PNG"))
         self.pushButton_4.setText(_translate("Dialogreport", "Show Interactions"))
+        self.pushButton_5.setText(_translate("Dialogreport", "Browse Poses"))
 
 
 class dialogreport(QtWidgets.QDialog):
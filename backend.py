@@ -1,13 +1,39 @@
+import os
+import time
+import zlib
+import threading
+import operator
+import itertools
+import collections
+import urllib.parse
+
 import apsw
+import numpy as np
 
 __all__ = ['DB']
 
+#milliseconds a connection waits for another writer before apsw.BusyError
+BUSY_TIMEOUT = 30000
+
+#statements written per transaction by CommitGroup
+COMMIT_GROUP_SIZE = 1000
+
+#prepared statements kept per connection, keyed by their SQL text
+STATEMENT_CACHE_SIZE = 256
+
+#rows transposed at a time by the column fetch helpers
+FETCH_CHUNK = 10000
+
+#bytes of the file a snapshot reader maps, the mapped pages are shared
+#through the OS page cache by all reader processes
+SNAPSHOT_MMAP_SIZE = 1 << 30
+
 DB_TABLES = {
 	'molecular': [
 		('id', 'INTEGER PRIMARY KEY'),
 		('name', 'TEXT'),
 		('type', 'INTEGER'),
-		('content', 'TEXT'),
+		('content', 'BLOB'),
 		('format', 'TEXT'),
 		('atoms', 'INTEGER'),
 		('bonds', 'INTEGER'),
@@ -55,7 +81,9 @@ DB_TABLES = {
 		('progress', 'REAL'),
 		('started', 'INTEGER'),
 		('finished', 'INTEGER'),
-		('message', 'TEXT')
+		('message', 'TEXT'),
+		('ligand', 'TEXT'),
+		('output', 'TEXT')
 	],
 	'pose': [
 		('id', 'INTEGER PRIMARY KEY'),
@@ -72,18 +100,28 @@ DB_TABLES = {
 		('lelp', 'REAL'),
 		('ki', 'TEXT'),
 		('mode', 'TEXT'),
-		('complex', 'TEXT'),
-		('actives', 'TEXT')
+		('complex', 'BLOB'),
+		('actives', 'TEXT'),
+		('rid', 'INTEGER')
 	],
 	'best': [
 		('id', 'INTEGER PRIMARY KEY'),
-		('pid', 'INTEGER')
+		('pid', 'INTEGER'),
+		('jid', 'INTEGER')
+	],
+	'ligand_summary': [
+		('id', 'INTEGER PRIMARY KEY'),
+		('jid', 'INTEGER'),
+		('poses', 'INTEGER'),
+		('min_energy', 'REAL'),
+		('best_le', 'REAL'),
+		('hits', 'INTEGER')
 	],
 	'logs': [
 		('id', 'INTEGER PRIMARY KEY'),
 		('jid', 'INTEGER'),
 		('name', 'TEXT'),
-		('content', 'TEXT')
+		('content', 'BLOB')
 	],
 	'option': [
 		('id', 'INTEGER PRIMARY KEY'),
@@ -104,10 +142,12 @@ DB_TABLES = {
 		('distance_ha', 'REAL'),
 		('distance_da', 'REAL'),
 		('donor_angle', 'REAL'),
-		('protein_donor', 'TEXT'),
-		('side_chain', 'TEXT'),
-		('donor_atom', 'TEXT'),
-		('acceptor_atom', 'TEXT'),
+		('protein_donor', 'INTEGER'),
+		('side_chain', 'INTEGER'),
+		('donor_atom', 'INTEGER'),
+		('donor_type', 'TEXT'),
+		('acceptor_atom', 'INTEGER'),
+		('acceptor_type', 'TEXT'),
 		('active_site', 'INTEGER')
 	],
 	'halogen_bond': [
@@ -119,8 +159,10 @@ DB_TABLES = {
 		('distance', 'REAL'),
 		('donor_angle', 'REAL'),
 		('acceptor_angle', 'REAL'),
-		('donor_atom', 'TEXT'),
-		('acceptor_atom', 'TEXT'),
+		('donor_atom', 'INTEGER'),
+		('donor_type', 'TEXT'),
+		('acceptor_atom', 'INTEGER'),
+		('acceptor_type', 'TEXT'),
 		('active_site', 'INTEGER')
 	],
 	'hydrophobic_interaction': [
@@ -157,8 +199,10 @@ DB_TABLES = {
 		('donor_angle', 'REAL'),
 		('water_angle', 'REAL'),
 		('protein_donor', 'INTEGER'),
-		('donor_atom', 'REAL'),
-		('acceptor_atom', 'REAL'),
+		('donor_atom', 'INTEGER'),
+		('donor_type', 'TEXT'),
+		('acceptor_atom', 'INTEGER'),
+		('acceptor_type', 'TEXT'),
 		('water_atom', 'INTEGER'),
 		('active_site', 'INTEGER')
 	],
@@ -195,16 +239,183 @@ DB_TABLES = {
 		('residue', 'INTEGER'),
 		('amino_acid', 'TEXT'),
 		('metal', 'INTEGER'),
+		('metal_type', 'TEXT'),
 		('target', 'INTEGER'),
+		('target_type', 'TEXT'),
 		('distance', 'REAL'),
 		('location', 'TEXT'),
 		('active_site', 'INTEGER')
+	],
+	'residue': [
+		('id', 'INTEGER PRIMARY KEY'),
+		('chain', 'TEXT'),
+		('number', 'INTEGER'),
+		('amino_acid', 'TEXT')
+	],
+	'pose_residue_contact': [
+		('id', 'INTEGER PRIMARY KEY'),
+		('pid', 'INTEGER'),
+		('bid', 'INTEGER'),
+		('resid', 'INTEGER'),
+		('kind', 'INTEGER'),
+		('distance', 'REAL'),
+		('active_site', 'INTEGER')
 	]
 }
 
+INTERACTION_TABLES = ['hydrogen_bond', 'halogen_bond', 'hydrophobic_interaction',
+	'salt_bridge', 'water_bridge', 'pi_stacking', 'pi_cation', 'metal_complex'
+]
+
+#pose_residue_contact.kind of every interaction table and its distance column
+INTERACTION_KINDS = {table: kind for kind, table in enumerate(INTERACTION_TABLES, 1)}
+
+CONTACT_DISTANCE = {
+	'hydrogen_bond': 'distance_ha',
+	'halogen_bond': 'distance',
+	'hydrophobic_interaction': 'distance',
+	'salt_bridge': 'distance',
+	'water_bridge': 'distance_aw',
+	'pi_stacking': 'distance',
+	'pi_cation': 'distance',
+	'metal_complex': 'distance'
+}
+
+def _active_hits(actives):
+	return ("(CASE WHEN {0} IS NULL OR {0}='' THEN 0 "
+		"ELSE length({0})-length(replace({0}, ';', ''))+1 END)").format(actives)
+
+#number of active site interactions of a pose, pose.actives joins them with ';'
+ACTIVE_HITS = _active_hits('actives')
+
+#secondary indexes, name: (table, columns, unique)
+DB_INDEXES = {
+	'molecular_type': ('molecular', ('type',), False),
+	'flex_rid': ('flex', ('rid',), False),
+	'active_rid': ('active', ('rid',), False),
+	'grid_rid': ('grid', ('rid',), False),
+	'jobs_status': ('jobs', ('status',), False),
+	'jobs_lid': ('jobs', ('lid',), False),
+	'jobs_output': ('jobs', ('output', 'ligand'), False),
+	'pose_jid_run': ('pose', ('jid', 'run'), True),
+	'pose_jid_energy': ('pose', ('jid', 'energy'), False),
+	'pose_energy': ('pose', ('energy',), False),
+	'pose_le': ('pose', ('le',), False),
+	'pose_hits': ('pose', (ACTIVE_HITS,), False),
+	'best_pid': ('best', ('pid',), False),
+	'best_jid': ('best', ('jid',), True),
+	'summary_jid': ('ligand_summary', ('jid',), True),
+	'summary_energy': ('ligand_summary', ('min_energy',), False),
+	'summary_le': ('ligand_summary', ('best_le',), False),
+	'summary_hits': ('ligand_summary', ('hits',), False),
+	'logs_jid': ('logs', ('jid',), False),
+	'option_name': ('option', ('name',), True),
+	'binding_site_pid': ('binding_site', ('pid',), False),
+	'residue_key': ('residue', ('chain', 'number', 'amino_acid'), True),
+	'contact_residue': ('pose_residue_contact', ('resid', 'kind', 'distance'), False),
+	'contact_pid': ('pose_residue_contact', ('pid',), False),
+	'contact_bid': ('pose_residue_contact', ('bid',), False)
+}
+
+for _table in INTERACTION_TABLES:
+	DB_INDEXES['{}_bid'.format(_table)] = (_table, ('bid',), False)
+
+def _refresh_ligand(jid):
+	#recomputes best and ligand_summary of one job from its few poses
+	return (
+		"DELETE FROM best WHERE jid={0};"
+		"INSERT INTO best (jid, pid) SELECT jid, id FROM pose "
+		"WHERE jid={0} AND energy IS NOT NULL ORDER BY energy, run, id LIMIT 1;"
+		"DELETE FROM ligand_summary WHERE jid={0};"
+		"INSERT INTO ligand_summary (jid, poses, min_energy, best_le, hits) "
+		"SELECT jid, COUNT(1), MIN(energy), MAX(le), MAX({1}) FROM pose WHERE jid={0} GROUP BY jid;"
+	).format(jid, ACTIVE_HITS)
+
+#keep best, the lowest energy pose of every job, and ligand_summary
+#current while poses are written, inserts are applied incrementally
+DB_TRIGGERS = {
+	'pose_insert_summary': (
+		"AFTER INSERT ON pose WHEN NEW.jid IS NOT NULL BEGIN "
+		"INSERT INTO best (jid, pid) SELECT NEW.jid, NEW.id WHERE NEW.energy IS NOT NULL "
+		"ON CONFLICT(jid) DO UPDATE SET pid=excluded.pid WHERE NOT EXISTS (SELECT 1 FROM pose AS p "
+		"WHERE p.id=best.pid AND (p.energy<NEW.energy OR (p.energy=NEW.energy AND (p.run<NEW.run "
+		"OR (p.run IS NULL AND NEW.run IS NOT NULL) OR (p.run IS NEW.run AND p.id<NEW.id)))));"
+		"INSERT INTO ligand_summary (jid, poses, min_energy, best_le, hits) "
+		"VALUES (NEW.jid, 1, NEW.energy, NEW.le, {0}) ON CONFLICT(jid) DO UPDATE SET poses=poses+1, "
+		"min_energy=coalesce(min(min_energy, excluded.min_energy), min_energy, excluded.min_energy), "
+		"best_le=coalesce(max(best_le, excluded.best_le), best_le, excluded.best_le), "
+		"hits=max(hits, excluded.hits);"
+		"END"
+	).format(_active_hits('NEW.actives')),
+	'pose_update_summary': (
+		"AFTER UPDATE OF jid, run, energy, le, actives ON pose BEGIN {}{} END"
+	).format(_refresh_ligand('OLD.jid'), _refresh_ligand('NEW.jid')),
+	'pose_delete_summary': (
+		"AFTER DELETE ON pose BEGIN {} END"
+	).format(_refresh_ligand('OLD.jid'))
+}
+
+#columns holding whole files, stored as zlib blobs
+DB_COMPRESSED = {
+	'molecular': ('content',),
+	'pose': ('complex',),
+	'logs': ('content',)
+}
+
+#level 6 compresses PDB text nearly as well as 9 in half the time
+COMPRESS_LEVEL = 6
+
+def compress_text(text):
+	if text is None or isinstance(text, bytes):
+		return text
+
+	return zlib.compress(text.encode(), COMPRESS_LEVEL)
+
+def decompress_text(value):
+	#text written before DB_COMPRESSED is returned as it is
+	if isinstance(value, bytes):
+		return zlib.decompress(value).decode()
+
+	return value
+
+def snapshot_uri(db_file, immutable=False):
+	path = urllib.parse.quote(os.path.abspath(db_file))
+	return "file:{}?mode=ro{}".format(path, '&immutable=1' if immutable else '')
+
 def get_fields(table):
 	return [field[0] for field in DB_TABLES[table]]
 
+def _row_class(table):
+	name = ''.join(part.title() for part in table.split('_')) + 'Row'
+	fields = get_fields(table)
+	row_class = collections.namedtuple(name, fields)
+
+	if table not in DB_COMPRESSED:
+		return row_class
+
+	#compressed fields are decompressed when they are read
+	namespace = {'__slots__': ()}
+	for field in DB_COMPRESSED[table]:
+		getter = operator.itemgetter(fields.index(field))
+		namespace[field] = property(lambda row, getter=getter: decompress_text(getter(row)))
+
+	return type(name, (row_class,), namespace)
+
+#compact row objects of every table, a tuple with named fields and no dict
+ROW_CLASSES = {table: _row_class(table) for table in DB_TABLES}
+
+def _to_array(values, field_type):
+	if field_type == 'REAL':
+		return np.array(values, dtype=float)
+
+	if field_type.startswith('INTEGER'):
+		#NULL has no integer value, such columns are returned as float with nan
+		if None in values:
+			return np.array(values, dtype=float)
+		return np.array(values, dtype=np.int64)
+
+	return values
+
 class DataRow(dict):
 	def __getattr__(self, attr):
 		return self[attr]
@@ -214,23 +425,36 @@ def row_factory(cursor, row):
 	return DataRow(zip(fields, row))
 
 class DataBackend:
-	conn = None
 	file = None
+	pool = False
+	busy_timeout = BUSY_TIMEOUT
 
 	def __init__(self):
-		#self.connect()
-		pass
+		self._conn = None
+		self.local = threading.local()
+		self.connections = []
+		self.pragmas = {}
+		self.lock = threading.Lock()
+		self.options = OptionStore(self)
+		self.uri = None
+		self.shared_cache = False
 
 	def __del__(self):
-		if self.conn:
-			self.conn.close()
+		self.close()
 
 	def __getstate__(self):
-		return self.file
+		return (self.file, self.pool, self.pragmas, self.uri, self.shared_cache)
 
 	def __setstate__(self, state):
-		self.file = state
-		self.reconnect()
+		self.__init__()
+		self.file, pool, pragmas, self.uri, self.shared_cache = state
+
+		#a worker process writes, or reads a snapshot, through its own connections
+		if pool:
+			self.pool = True
+			self.pragmas = pragmas
+		else:
+			self.reconnect()
 
 	#def __enter__(self):
 	#	self.reconnect()
@@ -238,20 +462,69 @@ class DataBackend:
 	#def __exit__(self):
 	#	self.close()
 
+	@property
+	def conn(self):
+		if not self.pool:
+			return self._conn
+
+		#every thread of a pool gets its own connection, opened on first use
+		conn = getattr(self.local, 'conn', None)
+
+		if conn is None:
+			conn = self.local.conn = self._open()
+
+		return conn
+
+	def _open(self, flags=apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE):
+		if self.uri:
+			flags = apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI
+
+			#ignored by SQLite builds without shared cache
+			if self.shared_cache:
+				flags |= apsw.SQLITE_OPEN_SHAREDCACHE
+
+		conn = apsw.Connection(self.uri or self.file, flags=flags, statementcachesize=STATEMENT_CACHE_SIZE)
+
+		conn.setbusytimeout(self.busy_timeout)
+
+		#SELECT unzip(complex) FROM pose reads compressed columns as text
+		conn.create_scalar_function('zip', compress_text, 1, deterministic=True)
+		conn.create_scalar_function('unzip', decompress_text, 1, deterministic=True)
+
+		for name, value in self.pragmas.items():
+			conn.cursor().execute("PRAGMA {}={}".format(name, value))
+
+		with self.lock:
+			self.connections.append(conn)
+
+		return conn
+
 	def _optimize_writting(self):
-		#self.query("PRAGMA journal_mode=WAL")
-		#self.query("PRAGMA synchronous=normal")
+		if self.pool:
+			#readers keep reading the last commit while a writer appends to the log
+			self.query("PRAGMA journal_mode=WAL")
+			self.pragma('synchronous', 'NORMAL')
+		else:
+			self.pragma('synchronous', 'OFF')
 		#self.query("PRAGMA temp_store=memory")
 		#self.query("PRAGMA mmap_size=3000000000")
-		self.query("PRAGMA synchronous=OFF")
 		#self.query("BEGIN")
 
+	def pragma(self, name, value):
+		#also applied to connections opened later by other threads
+		self.pragmas[name] = value
+		self.query("PRAGMA {}={}".format(name, value))
+
 	def begin(self):
-		self.query("BEGIN")
+		#a deferred transaction of a pool can fail to get the write lock halfway
+		self.query("BEGIN IMMEDIATE" if self.pool else "BEGIN")
 
 	def commit(self):
 		self.query("COMMIT")
 
+	def rollback(self):
+		self.query("ROLLBACK")
+
 	def changed(self):
 		if self.active():
 			return self.conn.changes() > 0
@@ -260,6 +533,10 @@ class DataBackend:
 	def cursor(self):
 		return self.conn.cursor()
 
+	def cache_stats(self):
+		"""Statement cache hits and misses of the connection of this thread"""
+		return self.conn.cache_stats()
+
 	def query(self, sql, paras=None):
 		if paras is None:
 			return self.cursor.execute(sql)
@@ -272,33 +549,190 @@ class DataBackend:
 			sql = "CREATE TABLE IF NOT EXISTS {} ({})".format(table, columns)
 			self.query(sql)
 
+			#columns added to DB_TABLES after the database was created
+			existing = self.get_field(table)
+			for field in fields:
+				if field[0] not in existing:
+					self.query("ALTER TABLE {} ADD COLUMN {} {}".format(table, *field))
+
+	def _create_indexes(self):
+		for name, (table, columns, unique) in DB_INDEXES.items():
+			sql = "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+				'UNIQUE ' if unique else '', name, table, ','.join(columns))
+			self.query(sql)
+
+	def _dedupe_options(self):
+		#older versions could write an option twice, keep the first row
+		if not self.get_exists("SELECT 1 FROM sqlite_master WHERE type='index' AND name='option_name'"):
+			self.query("DELETE FROM option WHERE id NOT IN (SELECT MIN(id) FROM option GROUP BY name)")
+
+	def _create_triggers(self):
+		existing = dict(self.query("SELECT name, sql FROM sqlite_master WHERE type='trigger'"))
+		missing = [name for name, body in DB_TRIGGERS.items()
+			if existing.get(name) != "CREATE TRIGGER {} {}".format(name, body)]
+
+		#triggers of older versions are replaced
+		for name in missing:
+			self.query("DROP TRIGGER IF EXISTS {}".format(name))
+			self.query("CREATE TRIGGER {} {}".format(name, DB_TRIGGERS[name]))
+
+		#poses written before the triggers existed or changed
+		if missing:
+			self.rebuild_summaries()
+
+	def rebuild_summaries(self):
+		"""Recompute best and ligand_summary from all poses"""
+		self.begin()
+		self.query("DELETE FROM best")
+		self.query("DELETE FROM ligand_summary")
+		self.query(
+			"INSERT INTO best (jid, pid) SELECT jid, id FROM ("
+			"SELECT jid, id, ROW_NUMBER() OVER (PARTITION BY jid ORDER BY energy, run, id) AS r "
+			"FROM pose WHERE jid IS NOT NULL AND energy IS NOT NULL) WHERE r=1"
+		)
+		self.query(
+			"INSERT INTO ligand_summary (jid, poses, min_energy, best_le, hits) "
+			"SELECT jid, COUNT(1), MIN(energy), MAX(le), MAX({}) FROM pose "
+			"WHERE jid IS NOT NULL GROUP BY jid".format(ACTIVE_HITS)
+		)
+		self.commit()
+
 	def reconnect(self):
 		self.close()
-		self.conn = apsw.Connection(self.file, flags = apsw.SQLITE_OPEN_READONLY)
-		#self.conn.setbusytimeout(100000)
-		#self._optimize_writting()
+		self._conn = self._open(apsw.SQLITE_OPEN_READONLY)
 
-	def connect(self, db_file=':memory:'):
+	def connect(self, db_file=':memory:', pool=False):
+		"""Open db_file and create the missing tables, indexes and triggers
+
+		With pool the file is switched to WAL journaling and every thread,
+		or unpickled copy in a worker process, gets its own connection, so
+		workers can write while the GUI reads. Writers wait up to
+		busy_timeout milliseconds for each other.
+		"""
 		self.close()
-		self.conn = apsw.Connection(db_file)
-		#self.conn.setbusytimeout(1000000)
+
+		if pool and db_file == ':memory:':
+			raise ValueError("A connection pool needs a database file")
+
 		self.file = db_file
+		self.pool = pool
+		self.pragmas = {}
+
+		if not pool:
+			self._conn = self._open()
+
 		#self.conn.setrowtrace(row_factory)
 		self._create_tables()
+		self._dedupe_options()
+		self._create_indexes()
+		self._create_triggers()
 		self._optimize_writting()
 
+	def open_snapshot(self, db_file, immutable=False, mmap_size=SNAPSHOT_MMAP_SIZE, shared_cache=True):
+		"""Open db_file read only for the workers of a process pool
+
+		Every thread, and every unpickled copy in a worker process, opens
+		its own connection with mode=ro and query_only, and reads through
+		mmap_size bytes of memory mapped file, so workers share the pages
+		of the OS page cache instead of copying them. With shared_cache the
+		threads of a process also share one SQLite page cache.
+
+		immutable skips all locking and change detection, only use it for
+		files nothing writes to anymore, e.g. a finished campaign or a
+		SnapshotService copy. It also ignores pages still in the WAL, see
+		reader.
+		"""
+		self.close()
+		self.file = db_file
+		self.uri = snapshot_uri(db_file, immutable)
+		self.shared_cache = shared_cache
+		self.pool = True
+		self.pragmas = {'query_only': 1, 'mmap_size': mmap_size}
+
+	def reader(self, immutable=False, mmap_size=SNAPSHOT_MMAP_SIZE, shared_cache=True):
+		"""Return a snapshot mode DataBackend of the file of this database
+
+		The result is meant to be pickled to worker processes. For an
+		immutable reader of a pooled database the WAL is checkpointed into
+		the file first.
+		"""
+		if immutable and self.pool:
+			self.query("PRAGMA wal_checkpoint(TRUNCATE)")
+
+		db = DataBackend()
+		db.open_snapshot(self.file, immutable, mmap_size, shared_cache)
+		return db
+
 	def close(self):
-		if self.conn:
-			self.conn.close()
-			self.conn = None
+		if self.active() and not self.uri:
+			self.options.flush()
+
+		self.options.clear()
+
+		with self.lock:
+			connections, self.connections = self.connections, []
+
+		for conn in connections:
+			conn.close()
+
+		self._conn = None
+		self.pool = False
+		self.uri = None
+		self.local = threading.local()
 
 	def active(self):
-		return self.conn is not None
+		return self.pool or self._conn is not None
+
+	def release(self):
+		"""Close the connection of the calling thread of a pool"""
+		conn = getattr(self.local, 'conn', None)
+
+		if not self.pool or conn is None:
+			return
+
+		self.local.conn = None
+
+		with self.lock:
+			if conn in self.connections:
+				self.connections.remove(conn)
+
+		conn.close()
+
+	def save(self, db_file, step_pages=-1, progress=None):
+		"""Copy the database to db_file
 
-	def save(self, db_file):
+		The copy is made step_pages at a time, all at once by default, and
+		progress(fraction) is called after every step. See
+		snapshot.SnapshotService to save without blocking the caller.
+		"""
 		target = apsw.Connection(db_file)
-		with target.backup('main', self.conn, 'main') as b:
-			b.step()
+
+		try:
+			with target.backup('main', self.conn, 'main') as b:
+				while not b.done:
+					b.step(step_pages)
+
+					if progress and b.pagecount:
+						progress(1 - b.remaining / b.pagecount)
+		finally:
+			target.close()
+
+	def compress_columns(self):
+		"""Compress the DB_COMPRESSED columns of an older database
+
+		Returns the number of values compressed. Run VACUUM afterwards to
+		give the space back to the file system.
+		"""
+		count = 0
+		self.begin()
+
+		for table, fields in DB_COMPRESSED.items():
+			for field in fields:
+				self.query("UPDATE {0} SET {1}=zip({1}) WHERE typeof({1})='text'".format(table, field))
+				count += self.conn.changes()
+
+		self.commit()
+		return count
 
 	def clear_table(self, table):
 		self.query("DELETE FROM {}".format(table))
@@ -340,6 +774,47 @@ class DataBackend:
 	def get_set(self, sql, paras=None):
 		return {row[0] for row in self.query(sql, paras)}
 
+	def get_rows(self, table, where='', paras=None):
+		"""Iterate rows of table as ROW_CLASSES objects
+
+		where is appended to the query, e.g. "WHERE jid=? ORDER BY energy".
+		"""
+		row_class = ROW_CLASSES[table]
+		sql = "SELECT {} FROM {} {}".format(','.join(row_class._fields), table, where)
+		make = row_class._make
+
+		for row in self.query(sql, paras):
+			yield make(row)
+
+	def get_columns(self, sql, paras=None):
+		"""Return the result of a query as one list per column
+
+		Only FETCH_CHUNK rows are held as tuples at a time. Returns a list
+		of column lists, empty if the query has no rows.
+		"""
+		cursor = self.query(sql, paras)
+		columns = None
+
+		while True:
+			chunk = list(itertools.islice(cursor, FETCH_CHUNK))
+
+			if not chunk:
+				return columns or []
+
+			if columns is None:
+				columns = [[] for _ in chunk[0]]
+
+			for column, values in zip(columns, zip(*chunk)):
+				column.extend(values)
+
+	def get_arrays(self, table, fields=None, where='', paras=None):
+		"""Return {field: column} of table, numeric columns as numpy arrays"""
+		fields = fields or get_fields(table)
+		types = dict(DB_TABLES[table])
+		sql = "SELECT {} FROM {} {}".format(','.join(fields), table, where)
+		columns = self.get_columns(sql, paras) or [[] for _ in fields]
+		return {f: _to_array(c, types[f]) for f, c in zip(fields, columns)}
+
 	def get_count(self, table):
 		if self.table_exists(table):
 			return self.get_one("SELECT COUNT(1) FROM {}".format(table))
@@ -357,15 +832,142 @@ class DataBackend:
 		return self.get_column(sql, ('table',))
 
 	def get_option(self, name):
-		sql = "SELECT value FROM option WHERE name=? LIMIT 1"
-		return self.get_one(sql, (name,))
+		return self.options.get(name)
 
 	def set_option(self, name, val):
-		if self.get_option(name) is not None:
-			sql = "UPDATE option SET value=? WHERE name=?"
-			self.query(sql, (str(val), name))
-		else:
-			sql = "INSERT INTO option VALUES (?,?,?)"
-			self.query(sql, (None, name, str(val)))
+		self.options.set(name, val)
+
+class OptionStore:
+	"""The option table of a DataBackend cached in memory
+
+	The table is read once and get is a dict lookup. set writes through
+	with one upsert, or, inside a with block, all changes are written
+	with one executemany when the block ends. Options written by another
+	process are seen after reload.
+	"""
+
+	def __init__(self, db):
+		self.db = db
+		self.values = None
+		self.pending = {}
+		self.depth = 0
+		self.lock = threading.Lock()
+
+	def __enter__(self):
+		self.depth += 1
+		return self
+
+	def __exit__(self, *args):
+		self.depth -= 1
+
+		if not self.depth:
+			self.flush()
+
+	def clear(self):
+		self.values = None
+		self.pending = {}
+
+	def reload(self):
+		values = {}
+
+		#the first row of a name wins, as in databases with duplicates
+		for name, value in self.db.query("SELECT name, value FROM option ORDER BY id DESC"):
+			values[name] = value
+
+		values.update(self.pending)
+		self.values = values
+
+	def get(self, name, default=None):
+		if self.values is None:
+			self.reload()
+
+		return self.values.get(name, default)
+
+	def set(self, name, value):
+		if self.values is None:
+			self.reload()
+
+		with self.lock:
+			self.values[name] = self.pending[name] = str(value)
+
+		if not self.depth:
+			self.flush()
+
+	def flush(self):
+		with self.lock:
+			pending, self.pending = self.pending, {}
+
+		if not pending:
+			return
+
+		sql = "INSERT INTO option (name, value) VALUES (?,?) ON CONFLICT(name) DO UPDATE SET value=excluded.value"
+
+		#joins a transaction of the caller instead of nesting one
+		if self.db.conn.in_transaction:
+			self.db.cursor.executemany(sql, pending.items())
+			return
+
+		self.db.begin()
+
+		try:
+			self.db.cursor.executemany(sql, pending.items())
+		except:
+			self.db.rollback()
+			raise
+
+		self.db.commit()
+
+class CommitGroup:
+	"""Buffer the writes of a worker and commit them in groups
+
+	One transaction per row keeps the write lock busy all the time. The
+	statements are written size at a time, or every interval seconds, in
+	one transaction so other writers get the lock in between, and readers
+	of a pooled DataBackend are never blocked.
+	"""
+
+	def __init__(self, db, size=COMMIT_GROUP_SIZE, interval=1.0):
+		self.db = db
+		self.size = size
+		self.interval = interval
+		self.statements = []
+		self.committed = 0
+		self.flushed = time.monotonic()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.flush()
+
+	def add(self, sql, paras=()):
+		self.statements.append((sql, paras))
+
+		if len(self.statements) >= self.size or time.monotonic() - self.flushed >= self.interval:
+			self.flush()
+
+	def add_many(self, sql, rows):
+		for paras in rows:
+			self.add(sql, paras)
+
+	def flush(self):
+		statements, self.statements = self.statements, []
+		self.flushed = time.monotonic()
+
+		if not statements:
+			return
+
+		self.db.begin()
+
+		try:
+			cursor = self.db.cursor
+			for sql, group in itertools.groupby(statements, key=lambda s: s[0]):
+				cursor.executemany(sql, [paras for _, paras in group])
+		except:
+			self.db.rollback()
+			raise
+
+		self.db.commit()
+		self.committed += len(statements)
 
 DB = DataBackend()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Index Test for PandaDOCK
+Verifies the declared secondary indexes are created and used by lookups
+"""
+
+from backend import DataBackend, DB_INDEXES
+from db_benchmark import fill_database, run_queries
+
+
+def test_indexes_are_created_idempotently():
+    """Connecting twice to a database keeps one copy of every index"""
+    db = DataBackend()
+    db.connect()
+    db._create_indexes()
+    names = db.get_column("SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%'")
+    assert sorted(names) == sorted(DB_INDEXES)
+    db.close()
+
+
+def test_lookups_use_indexes():
+    """No benchmark lookup scans a whole table"""
+    db = DataBackend()
+    db.connect()
+    fill_database(db, 2000)
+
+    for name, plan, _ in run_queries(db, repeat=1):
+        assert "SCAN pose" not in plan and "TEMP B-TREE" not in plan, name
+        if name != "top 100 ligands":
+            assert "SCAN" not in plan, name
+
+    db.close()
+
+
+if __name__ == "__main__":
+    test_indexes_are_created_idempotently()
+    test_lookups_use_indexes()
+    print("✓ All index tests passed!")
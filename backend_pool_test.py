@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Connection Pool Test for PandaDOCK
+Verifies workers can write to a pooled database while it is being read
+"""
+
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import apsw
+import pytest
+
+from backend import DataBackend, CommitGroup, SNAPSHOT_MMAP_SIZE
+from jobstore import JobStore, JOB_DB_NAME
+
+INSERT_POSE = "INSERT INTO pose (jid, run, energy) VALUES (?,?,?)"
+
+
+def test_writers_and_reader_share_a_pool():
+    """Threads stream poses in commit groups while the main thread reads"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db = DataBackend()
+        db.connect(os.path.join(workdir, "pool.db"), pool=True)
+        assert db.get_one("PRAGMA journal_mode") == "wal"
+        errors = []
+
+        def write(jid):
+            try:
+                with CommitGroup(db, size=50) as group:
+                    for run in range(1, 1001):
+                        group.add(INSERT_POSE, (jid, run, -run / 100.0))
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(jid,)) for jid in range(1, 5)]
+        for writer in writers:
+            writer.start()
+
+        counts = []
+        while any(writer.is_alive() for writer in writers):
+            counts.append(db.get_count("pose"))
+        for writer in writers:
+            writer.join()
+
+        assert not errors
+        assert counts == sorted(counts)
+        assert db.get_count("pose") == 4000
+        assert len(db.connections) == 5
+        db.close()
+
+
+def test_failed_group_is_rolled_back():
+    """A commit group is written completely or not at all"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db = DataBackend()
+        db.connect(os.path.join(workdir, "pool.db"), pool=True)
+        group = CommitGroup(db)
+        group.add(INSERT_POSE, (1, 1, -5.0))
+        group.add("INSERT INTO missing VALUES (?)", (1,))
+
+        with pytest.raises(apsw.SQLError):
+            group.flush()
+        assert db.get_count("pose") == 0
+        db.close()
+
+
+def test_pickled_pool_stays_writable():
+    """A worker process gets its own writable connection to the pool"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        worker_db = pickle.loads(pickle.dumps(store.db))
+        worker_db.query(INSERT_POSE, (1, 1, -7.0))
+
+        assert worker_db.conn is not store.db.conn
+        assert worker_db.get_one("PRAGMA synchronous") == 2
+        assert store.db.get_count("pose") == 1
+        worker_db.close()
+        store.close()
+        assert os.path.exists(os.path.join(output_directory, JOB_DB_NAME))
+
+
+def count_poses(db):
+    return db.get_count("pose"), db.get_one("PRAGMA query_only"), db.get_one("PRAGMA mmap_size")
+
+
+def test_snapshot_readers_in_worker_processes():
+    """Readers pickled to a process pool read with mmap and never write"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        store.db.insert_rows(INSERT_POSE, [(1, run, -5.0) for run in range(100)])
+        reader = store.db.reader()
+
+        with ProcessPoolExecutor(2) as executor:
+            results = list(executor.map(count_poses, [reader] * 4))
+        assert results == [(100, 1, SNAPSHOT_MMAP_SIZE)] * 4
+
+        #a reader sees later commits, an immutable one of a finished campaign only the file
+        store.db.query(INSERT_POSE, (2, 1, -6.0))
+        assert reader.get_count("pose") == 101
+        with pytest.raises(apsw.ReadOnlyError):
+            reader.query(INSERT_POSE, (2, 2, -6.0))
+
+        immutable = pickle.loads(pickle.dumps(store.db.reader(immutable=True)))
+        assert immutable.get_count("pose") == 101
+        assert "immutable=1" in immutable.uri
+        immutable.close()
+        reader.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    test_writers_and_reader_share_a_pool()
+    test_failed_group_is_rolled_back()
+    test_pickled_pool_stays_writable()
+    test_snapshot_readers_in_worker_processes()
+    print("✓ All connection pool tests passed!")
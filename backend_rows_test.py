@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Row Object Test for PandaDOCK
+Verifies the compact row classes and the column fetch helpers
+"""
+
+import math
+
+from backend import DataBackend, ROW_CLASSES, FETCH_CHUNK, get_fields
+
+
+def pose_db(count):
+    db = DataBackend()
+    db.connect()
+    db.insert_rows("INSERT INTO pose (jid, run, energy, ki) VALUES (?,?,?,?)",
+                   [(i // 10 + 1, i % 10 + 1, -i / 100.0, "1 uM") for i in range(count)])
+    return db
+
+
+def test_row_classes_follow_schema():
+    """Every table has a row class with its fields and no instance dict"""
+    for table, row_class in ROW_CLASSES.items():
+        assert list(row_class._fields) == get_fields(table)
+        assert not hasattr(row_class._make(range(len(row_class._fields))), "__dict__")
+
+    db = pose_db(30)
+    rows = list(db.get_rows("pose", "WHERE jid=? ORDER BY energy", (2,)))
+    assert [row.run for row in rows] == list(range(10, 0, -1))
+    assert type(rows[0]).__name__ == "PoseRow"
+    db.close()
+
+
+def test_columns_span_fetch_chunks():
+    """Column lists hold every row of results larger than a fetch chunk"""
+    count = FETCH_CHUNK * 2 + 5
+    db = pose_db(count)
+    ids, energies = db.get_columns("SELECT id, energy FROM pose ORDER BY id")
+    assert len(ids) == count and ids[-1] == count
+    assert energies[FETCH_CHUNK] == -FETCH_CHUNK / 100.0
+    assert db.get_columns("SELECT id FROM pose WHERE id<0") == []
+
+    arrays = db.get_arrays("pose", ["jid", "energy", "rmsd1", "ki"], "ORDER BY energy LIMIT 5")
+    assert arrays["jid"].dtype.kind == "i"
+    assert arrays["energy"][0] == -(count - 1) / 100.0
+    assert math.isnan(arrays["rmsd1"][0])
+    assert arrays["ki"] == ["1 uM"] * 5
+    db.close()
+
+
+if __name__ == "__main__":
+    test_row_classes_follow_schema()
+    test_columns_span_fetch_chunks()
+    print("✓ All row object tests passed!")
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Headless batch runner for PandaDock.
+
+Runs the same docking queue as the GUI (session folder with Protein,
+Ligand and output_N directories) without importing PySide6 or PyMOL,
+so it can be used on display-less cluster nodes:
+
+	pandadock-gui-batch -p receptor.pdb -l ligands/ --center 1 2 3 \
+		--preset "Fast Mode - PandaCore" -w session/
+"""
+
+import os
+import sys
+import shutil
+import argparse
+
+from scheduler import (DOCKING_PRESETS, DEFAULT_BOX_SIZE, SubprocessScheduler, default_worker_count,
+	next_output_directory, is_screening_preset)
+from jobstore import JobStore, find_resumable_campaign, JOB_DB_NAME
+from ingest import ingest_campaign
+from sharding import create_shard_jobs, merge_shards, list_ligand_files, list_shard_outputs
+from costmodel import CostModel
+from resultcache import ResultCache
+from ligprep import LigandPreparation, PREPARED_FOLDER
+
+__all__ = ['main', 'prepare_session', 'get_cocrystal_site']
+
+def read_coordinates(mol_file):
+	fmt = os.path.splitext(mol_file)[1].lower()
+	coords = []
+
+	with open(mol_file) as fh:
+		lines = fh.read().splitlines()
+
+	if fmt == '.pdb':
+		for line in lines:
+			if line.startswith(('ATOM', 'HETATM')):
+				coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+
+	elif fmt in ('.sdf', '.mol'):
+		#V2000 counts line is the fourth line of the first record
+		atoms = int(lines[3][0:3])
+		for line in lines[4:4+atoms]:
+			cols = line.split()
+			coords.append((float(cols[0]), float(cols[1]), float(cols[2])))
+
+	else:
+		raise ValueError("Unsupported co-crystal ligand format: {}".format(fmt))
+
+	return coords
+
+def read_residue_coordinates(pdb_file, residue):
+	#residue is given as RESNAME_CHAIN, e.g. SAG_A, like in the GUI list
+	resname, chain = residue.split('_')
+	coords = []
+
+	with open(pdb_file) as fh:
+		for line in fh:
+			if not line.startswith('HETATM'):
+				continue
+
+			if line[17:20].strip() == resname and line[21] == chain:
+				coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+
+	return coords
+
+def remove_residue(pdb_file, residue):
+	resname, chain = residue.split('_')
+
+	with open(pdb_file) as fh:
+		lines = [line for line in fh if not (line.startswith('HETATM')
+			and line[17:20].strip() == resname and line[21] == chain)]
+
+	with open(pdb_file, 'w') as fw:
+		fw.writelines(lines)
+
+def get_cocrystal_site(coords, buffer=4.0):
+	"""Return the centroid and the radius (max atom distance + buffer)"""
+	if not coords:
+		raise ValueError("No atoms found for the co-crystal ligand")
+
+	n = len(coords)
+	x = sum(c[0] for c in coords) / n
+	y = sum(c[1] for c in coords) / n
+	z = sum(c[2] for c in coords) / n
+	radius = max(((c[0]-x)**2 + (c[1]-y)**2 + (c[2]-z)**2) ** 0.5 for c in coords)
+	return x, y, z, radius + buffer
+
+def split_sdf(sdf_file, out_dir):
+	stem = os.path.splitext(os.path.basename(sdf_file))[0]
+	records = []
+	lines = []
+
+	with open(sdf_file) as fh:
+		for line in fh:
+			lines.append(line)
+
+			if line.startswith('$$$$'):
+				records.append(lines)
+				lines = []
+
+	if any(l.strip() for l in lines):
+		records.append(lines)
+
+	if len(records) < 2:
+		shutil.copy(sdf_file, out_dir)
+		return
+
+	used = set()
+	for i, record in enumerate(records, 1):
+		name = record[0].strip() or "{}_{}".format(stem, i)
+		name = "".join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+		if name in used:
+			name = "{}_{}".format(name, i)
+
+		used.add(name)
+
+		with open(os.path.join(out_dir, "{}.sdf".format(name)), 'w') as fw:
+			fw.writelines(record)
+
+def prepare_session(workdir, protein_file, ligand_input, split_libraries=True):
+	"""Lay out Protein/ and Ligand/ folders the same way the GUI does
+
+	Sharded screens pass split_libraries=False, SDF libraries are then
+	copied whole and the shards read their records by offset.
+	"""
+	protein_folder = os.path.join(workdir, "Protein")
+	if os.path.exists(protein_folder):
+		shutil.rmtree(protein_folder)
+	os.makedirs(protein_folder)
+	shutil.copy(protein_file, protein_folder)
+
+	ligand_folder = os.path.join(workdir, "Ligand")
+	if os.path.exists(ligand_folder):
+		shutil.rmtree(ligand_folder)
+	os.makedirs(ligand_folder)
+
+	if os.path.isdir(ligand_input):
+		sources = [os.path.join(ligand_input, f) for f in sorted(os.listdir(ligand_input))]
+	else:
+		sources = [ligand_input]
+
+	for source in sources:
+		if source.lower().endswith('.sdf') and split_libraries:
+			split_sdf(source, ligand_folder)
+		elif source.lower().endswith(('.sdf', '.mol')):
+			shutil.copy(source, ligand_folder)
+
+	protein = os.path.join(protein_folder, os.path.basename(protein_file))
+	return protein, ligand_folder
+
+def create_parser():
+	parser = argparse.ArgumentParser(prog='pandadock-gui-batch',
+		description="Run a PandaDock docking campaign without the GUI")
+	parser.add_argument('-p', '--protein', help="receptor PDB file")
+	parser.add_argument('-l', '--ligands', help="ligand directory, SDF library or MOL file")
+	parser.add_argument('-w', '--workdir', default='.', help="session directory (default: current directory)")
+	parser.add_argument('--preset', default="Fast Mode - PandaCore",
+		help="docking template name, see --list-presets")
+	parser.add_argument('--list-presets', action='store_true', help="print the docking templates and exit")
+	parser.add_argument('--resume', action='store_true',
+		help="resume the latest interrupted run in the session directory")
+
+	site = parser.add_mutually_exclusive_group()
+	site.add_argument('--center', nargs=3, type=float, metavar=('X', 'Y', 'Z'), help="binding site center")
+	site.add_argument('--cocrystal', metavar='LIGAND',
+		help="co-crystal ligand file or a HETATM residue of the protein as RESNAME_CHAIN")
+	site.add_argument('--detect-pocket', action='store_true', help="let pandadock detect the pocket")
+
+	box = parser.add_mutually_exclusive_group()
+	box.add_argument('--size', type=float, default=None,
+		help="edge of the cubic docking box in angstrom (default: {} like the GUI, "
+		"2 x the site radius with --cocrystal)".format(DEFAULT_BOX_SIZE))
+	box.add_argument('--radius', type=float, default=None,
+		help="binding site radius, the docking box edge becomes 2 x radius")
+	parser.add_argument('--buffer', type=float, default=4.0, help="radius buffer added around a co-crystal ligand")
+	parser.add_argument('--gpu', action='store_true', help="append --gpu to the docking arguments")
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help="concurrent pandadock processes (default: cores / threads per job)")
+	parser.add_argument('--threads-per-job', type=int, default=None,
+		help="threads used by one pandadock process (default: cores / workers)")
+	parser.add_argument('--prepare', action='store_true',
+		help="protonate and add hydrogens and charges to the ligands before docking, "
+		"not available with the virtual screening presets")
+	parser.add_argument('--ph', type=float, default=7.4, help="pH used with --prepare")
+	parser.add_argument('--cache-dir', default=None,
+		help="docking result cache (default: $PANDADOCK_CACHE_DIR or ~/.pandadock/cache)")
+	parser.add_argument('--cache-size', type=float, default=5.0, help="result cache size limit in GB")
+	parser.add_argument('--no-cache', action='store_true', help="always run pandadock, do not use the result cache")
+	parser.add_argument('--no-ingest', action='store_true',
+		help="do not store poses and scores in the run database after docking")
+	parser.add_argument('--shards', type=int, default=None,
+		help="split virtual screening libraries into this many parallel --screen runs (default: workers)")
+	return parser
+
+def main(argv=None):
+	parser = create_parser()
+	opts = parser.parse_args(argv)
+
+	if opts.list_presets:
+		for name, command in DOCKING_PRESETS.items():
+			print("{}\n\t{}".format(name, command))
+		return 0
+
+	if opts.resume:
+		return resume(opts)
+
+	if not opts.protein or not opts.ligands:
+		parser.error("--protein and --ligands are required")
+
+	if opts.preset not in DOCKING_PRESETS:
+		parser.error("unknown preset: {}".format(opts.preset))
+
+	if not (opts.center or opts.cocrystal or opts.detect_pocket):
+		parser.error("one of --center, --cocrystal or --detect-pocket is required")
+
+	#pandadock --screen reads the library itself, there is no per-ligand step to prepare in
+	if opts.prepare and is_screening_preset(opts.preset):
+		parser.error("--prepare is not supported with the screening preset {}".format(opts.preset))
+
+	workdir = os.path.abspath(opts.workdir)
+	os.makedirs(workdir, exist_ok=True)
+	shards = opts.shards or opts.workers or default_worker_count(opts.threads_per_job or 1)
+	sharded = is_screening_preset(opts.preset) and shards > 1
+	protein_file, ligand_folder = prepare_session(workdir, opts.protein, opts.ligands, not sharded)
+
+	radius = opts.radius
+
+	if opts.detect_pocket:
+		center = None
+	elif opts.cocrystal:
+		if os.path.isfile(opts.cocrystal):
+			coords = read_coordinates(opts.cocrystal)
+		else:
+			coords = read_residue_coordinates(protein_file, opts.cocrystal)
+			remove_residue(protein_file, opts.cocrystal)
+
+		x, y, z, site_radius = get_cocrystal_site(coords, opts.buffer)
+		center = (x, y, z)
+		radius = radius or site_radius
+	else:
+		center = tuple(opts.center)
+
+	#the GUI docks in a DEFAULT_BOX_SIZE box, a radius asks for one around the site sphere
+	box_size = opts.size or (2 * radius if radius else DEFAULT_BOX_SIZE)
+
+	if center is not None:
+		print("Coordinates: ({}, {}, {}), Box size: {:g}".format(*center, box_size))
+
+	args = DOCKING_PRESETS[opts.preset].split()
+
+	if opts.gpu and '--gpu' not in args:
+		args.append('--gpu')
+
+	#the box is saved with the campaign arguments
+	if center is not None:
+		size = '{:g}'.format(box_size)
+		args.extend(['--size', size, size, size])
+
+	output_directory = next_output_directory(workdir)
+	os.makedirs(output_directory, exist_ok=True)
+	print("Output directory: {}".format(output_directory))
+
+	cost_model = CostModel.from_history(workdir)
+
+	if sharded:
+		#shards are jobs rows like ligands, so a sharded screen can be resumed and cached
+		store = JobStore(output_directory)
+		store.save_campaign(args, protein_file, center, shards)
+		scheduler = SubprocessScheduler(shards, opts.threads_per_job, store, cost_model,
+			cache=open_cache(opts))
+		scheduler.submit_many(create_shard_jobs(scheduler, args, ligand_folder,
+			protein_file, output_directory, center, shards, cost_model))
+		scheduler.on_complete = lambda: merge_campaign(output_directory)
+	elif is_screening_preset(opts.preset):
+		store = JobStore(output_directory)
+		store.save_campaign(args, protein_file, center)
+		scheduler = SubprocessScheduler(1, opts.threads_per_job, store)
+		scheduler.submit(scheduler.create_screening_job(args, ligand_folder,
+			protein_file, output_directory, center))
+	else:
+		store = JobStore(output_directory)
+		store.save_campaign(args, protein_file, center)
+		scheduler = SubprocessScheduler(opts.workers, opts.threads_per_job, store, cost_model,
+			cache=open_cache(opts))
+		ligand_queue = list_ligand_files(ligand_folder)
+
+		if opts.prepare:
+			status = run_prepared(scheduler, ligand_queue, os.path.join(workdir, PREPARED_FOLDER), opts.ph,
+				lambda ligand: scheduler.create_job(args, ligand, protein_file, output_directory, center))
+			return ingest_results(opts, output_directory, status)
+
+		scheduler.submit_many(
+			scheduler.create_job(args, ligand, protein_file, output_directory, center)
+			for ligand in ligand_queue
+		)
+
+	return ingest_results(opts, output_directory, run_scheduler(scheduler))
+
+def ingest_results(opts, output_directory, status):
+	if not opts.no_ingest:
+		count = ingest_campaign(output_directory)
+		print("Stored {} poses in {}".format(count, os.path.join(output_directory, JOB_DB_NAME)))
+
+	return status
+
+def run_prepared(scheduler, ligand_queue, prepared_folder, ph, create_job, job_ids=None):
+	#dock the ligands as soon as the preparation pool has them ready
+	preparation = LigandPreparation(ligand_queue, prepared_folder, scheduler.spare_cores(), ph=ph, job_ids=job_ids)
+	preparation.start(scheduler.store)
+	scheduler.open_feed()
+	scheduler.on_poll = lambda: preparation.feed(scheduler, create_job)
+	print("Preparing {} ligands in {}".format(len(ligand_queue), preparation.output_folder))
+	status = run_scheduler(scheduler)
+
+	if preparation.failed:
+		print("{} ligands could not be prepared, see {}".format(len(preparation.failed), preparation.manifest))
+		status = 1
+
+	return status
+
+def resume(opts):
+	workdir = os.path.abspath(opts.workdir)
+	output_directory = find_resumable_campaign(workdir)
+
+	if not output_directory:
+		print("No interrupted docking run found in {}".format(workdir))
+		return 0
+
+	store = JobStore(output_directory)
+	cost_model = CostModel.from_history(workdir)
+	scheduler = SubprocessScheduler(opts.workers, opts.threads_per_job, store, cost_model,
+		cache=open_cache(opts))
+	count = store.resume(scheduler)
+	print("Resuming {}: {} interrupted ligands requeued".format(output_directory, count))
+	unprepared = store.unprepared()
+
+	if store.load_shards():
+		scheduler.on_complete = lambda: merge_campaign(output_directory)
+
+	#ligands that were still waiting for preparation are prepared again
+	if unprepared:
+		args, protein_file, center = store.load_campaign()
+		prepared_folder, ph, _ = store.load_preparation()
+		status = run_prepared(scheduler, list(unprepared), prepared_folder, ph,
+			lambda ligand: scheduler.create_job(args, ligand, protein_file, output_directory, center), unprepared)
+		return ingest_results(opts, output_directory, status)
+
+	return ingest_results(opts, output_directory, run_scheduler(scheduler))
+
+def merge_campaign(output_directory):
+	#shards finished before a resume are merged too
+	skipped = merge_shards(output_directory, list_shard_outputs(output_directory))
+
+	if skipped:
+		print("Not merged, failed or incomplete: {}".format(', '.join(skipped)))
+
+def open_cache(opts):
+	if opts.no_cache:
+		return None
+
+	return ResultCache(opts.cache_dir, int(opts.cache_size * 1024 ** 3))
+
+def run_scheduler(scheduler):
+	scheduler.on_started = lambda job: print("Docking Ligand: {}".format(job.ligand))
+
+	def on_finished(job):
+		if not job.succeeded:
+			print("Docking failed for {} (exit code {}), see {}".format(job.name,
+				job.exit_code, os.path.join(job.output, 'pandadock.log')))
+		print(scheduler.summary())
+
+	scheduler.on_finished = on_finished
+	print("Docking {} jobs with {} concurrent workers".format(scheduler.total, scheduler.max_workers))
+	scheduler.run()
+	print("Simulation Has Been Completed.")
+
+	return 0 if all(job.succeeded for job in scheduler.completed) else 1
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Batch Runner Test for PandaDOCK
+Verifies the headless session layout and binding site helpers
+"""
+
+import os
+import sys
+import tempfile
+
+import batch
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test")
+
+
+def test_batch_does_not_import_qt():
+    """The batch runner must start without PySide6 or the PyMOL widget"""
+    assert "PySide6" not in sys.modules
+    assert "view" not in sys.modules
+
+
+def test_prepare_session_splits_libraries():
+    """A multi-record SDF is split into one ligand file per record"""
+    with tempfile.TemporaryDirectory() as workdir:
+        library = os.path.join(workdir, "library.sdf")
+        with open(library, "w") as fw:
+            for name in ("Karanjin.sdf", "Vilangin.sdf"):
+                with open(os.path.join(TEST_DIR, name)) as fh:
+                    fw.write(fh.read())
+
+        protein = os.path.join(TEST_DIR, "Protein", "2v5z(4).pdb")
+        protein_file, ligand_folder = batch.prepare_session(workdir, protein, library)
+
+        assert os.path.exists(protein_file)
+        assert len(os.listdir(ligand_folder)) == 2
+
+
+def test_cocrystal_site():
+    """Co-crystal ligand centroid and radius follow the GUI calculation"""
+    coords = batch.read_coordinates(os.path.join(TEST_DIR, "Heteroatoms", "SAG_A.pdb"))
+    x, y, z, radius = batch.get_cocrystal_site(coords, buffer=4.0)
+
+    assert len(coords) > 0
+    assert radius > 4.0
+    assert 40 < x < 60 and 150 < y < 170
+
+
+def test_prepare_is_rejected_for_screens():
+    """--prepare has no effect on a --screen run, so it is an error there"""
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            batch.main(["-p", "rec.pdb", "-l", "Ligand", "-w", workdir, "--center", "0", "0", "0",
+                        "--preset", "Virtual Screening - Fast", "--prepare"])
+        except SystemExit as e:
+            assert e.code == 2
+        else:
+            assert False, "--prepare was accepted for a screening preset"
+        assert os.listdir(workdir) == []
+
+    opts = batch.create_parser().parse_args(["--size", "24"])
+    assert opts.size == 24 and opts.radius is None
+
+
+if __name__ == "__main__":
+    test_batch_does_not_import_qt()
+    test_prepare_session_splits_libraries()
+    test_cocrystal_site()
+    test_prepare_is_rejected_for_screens()
+    print("✓ All batch runner tests passed!")
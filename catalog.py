@@ -0,0 +1,172 @@
+import os
+
+import apsw
+
+from backend import DataBackend
+from jobstore import JOB_DB_NAME
+from ingest import ligand_name
+
+__all__ = ['CampaignCatalog', 'list_campaigns', 'CATALOG_VIEWS']
+
+#per shard select of the campaign_ligands view, {schema} is the attached
+#shard and {campaign} the quoted name of its output directory, ligand jobs
+#hold the ligand path and screens the name, ligand_name() makes them match
+CAMPAIGN_LIGANDS = (
+	"SELECT {campaign} AS campaign, ligand_name(j.ligand) AS ligand, s.jid AS jid, b.pid AS pid, s.poses AS poses, "
+	"s.min_energy AS min_energy, s.best_le AS best_le, s.hits AS hits FROM {schema}.ligand_summary AS s "
+	"LEFT JOIN {schema}.jobs AS j ON j.id=s.jid LEFT JOIN {schema}.best AS b ON b.jid=s.jid"
+)
+
+#views over campaign_ligands, the row of MIN() is kept for the bare columns
+CATALOG_VIEWS = {
+	'best_per_ligand': (
+		"SELECT ligand, MIN(min_energy) AS min_energy, campaign, jid, pid, COUNT(1) AS campaigns "
+		"FROM campaign_ligands WHERE min_energy IS NOT NULL GROUP BY ligand"
+	),
+	'campaign_totals': (
+		"SELECT campaign, COUNT(1) AS ligands, SUM(poses) AS poses, MIN(min_energy) AS min_energy "
+		"FROM campaign_ligands GROUP BY campaign"
+	)
+}
+
+def list_campaigns(main_directory):
+	"""Return {output directory name: database file} of the campaigns of a session"""
+	campaigns = {}
+
+	if not main_directory or not os.path.isdir(main_directory):
+		return campaigns
+
+	for entry in sorted(os.scandir(main_directory), key=lambda e: e.name):
+		db_file = os.path.join(entry.path, JOB_DB_NAME)
+
+		if entry.is_dir() and os.path.exists(db_file):
+			campaigns[entry.name] = db_file
+
+	return campaigns
+
+def _quote(text):
+	return "'{}'".format(text.replace("'", "''"))
+
+class CampaignCatalog:
+	"""Query the databases of all campaigns of a session together
+
+	Every docking run writes its own output_N/pandadock.db, so campaigns
+	never wait for each other's writes. The catalog is an in memory
+	database that attaches the shards on demand and has temporary views
+	over them: campaign_ligands has one row per ligand and campaign, read
+	from the trigger maintained ligand_summary, and CATALOG_VIEWS are
+	built on it, e.g. SELECT * FROM best_per_ligand ORDER BY min_energy.
+
+	SQLite attaches at most max_attached databases, attach picks the
+	campaigns to query if a session has more.
+	"""
+
+	def __init__(self, main_directory):
+		self.main_directory = main_directory
+		self.db = DataBackend()
+		self.db.connect()
+		self.db.conn.createscalarfunction('ligand_name', ligand_name, 1, deterministic=True)
+		self.attached = {}
+		self.serial = 0
+
+	@property
+	def max_attached(self):
+		return self.db.conn.limit(apsw.SQLITE_LIMIT_ATTACHED)
+
+	def close(self):
+		self.db.close()
+
+	def campaigns(self):
+		return list_campaigns(self.main_directory)
+
+	def _upgrade(self, db_file):
+		#shards written before ligand_summary get it when opened once
+		shard = DataBackend()
+		shard.connect(db_file)
+		shard.close()
+
+	def attach(self, names=None):
+		"""Attach the shards of names, all campaigns by default, and rebuild the views"""
+		campaigns = self.campaigns()
+		names = list(campaigns) if names is None else list(names)
+
+		if len(names) > self.max_attached:
+			raise ValueError("At most {} campaigns can be attached".format(self.max_attached))
+
+		for name in list(self.attached):
+			if name not in names or name not in campaigns:
+				self.detach(name)
+
+		for name in names:
+			if name in self.attached:
+				continue
+
+			self.serial += 1
+			schema = 'shard{}'.format(self.serial)
+
+			self.db.query("ATTACH DATABASE ? AS {}".format(schema), (campaigns[name],))
+
+			if not self.db.get_exists("SELECT 1 FROM {}.sqlite_master WHERE name='ligand_summary'".format(schema)):
+				self.db.query("DETACH DATABASE {}".format(schema))
+				self._upgrade(campaigns[name])
+				self.db.query("ATTACH DATABASE ? AS {}".format(schema), (campaigns[name],))
+
+			self.attached[name] = schema
+
+		self._create_views()
+
+	def detach(self, name):
+		schema = self.attached.pop(name, None)
+
+		if schema is not None:
+			self._drop_views()
+			self.db.query("DETACH DATABASE {}".format(schema))
+
+	def _drop_views(self):
+		for view in list(CATALOG_VIEWS) + ['campaign_ligands']:
+			self.db.query("DROP VIEW IF EXISTS temp.{}".format(view))
+
+	def _create_views(self):
+		self._drop_views()
+
+		selects = [CAMPAIGN_LIGANDS.format(campaign=_quote(name), schema=schema)
+			for name, schema in self.attached.items()]
+
+		#an empty catalog still has the columns of the views
+		if not selects:
+			selects = ["SELECT NULL AS campaign, NULL AS ligand, NULL AS jid, NULL AS pid, NULL AS poses, "
+				"NULL AS min_energy, NULL AS best_le, NULL AS hits WHERE 0"]
+
+		self.db.query("CREATE TEMP VIEW campaign_ligands AS {}".format(' UNION ALL '.join(selects)))
+
+		for view, sql in CATALOG_VIEWS.items():
+			self.db.query("CREATE TEMP VIEW {} AS {}".format(view, sql))
+
+	def query(self, sql, paras=None):
+		"""Run sql on the catalog, attaching all campaigns on first use"""
+		if not self.attached:
+			self.attach()
+
+		return self.db.query(sql, paras)
+
+	def best_per_ligand(self, limit=100):
+		"""Return (ligand, min energy, campaign, job id, pose id, campaigns) rows, best first"""
+		sql = "SELECT * FROM best_per_ligand ORDER BY min_energy LIMIT ?"
+		return list(self.query(sql, (limit,)))
+
+	def drop_campaign(self, name):
+		"""Remove the database of a campaign, its output files are kept"""
+		db_file = self.campaigns().get(name)
+		self.detach(name)
+
+		if db_file is None:
+			return False
+
+		for path in (db_file, db_file + '-wal', db_file + '-shm'):
+			if os.path.exists(path):
+				os.remove(path)
+
+		if self.attached:
+			self._create_views()
+
+		return True
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Campaign Catalog Test for PandaDOCK
+Verifies campaign databases are queried together and dropped as files
+"""
+
+import os
+import tempfile
+
+import pytest
+
+from jobstore import JobStore, JOB_DB_NAME
+from catalog import CampaignCatalog, list_campaigns
+
+
+def make_campaign(main_directory, name, energies):
+    output_directory = os.path.join(main_directory, name)
+    os.makedirs(output_directory)
+    store = JobStore(output_directory)
+    store.db.insert_rows("INSERT INTO jobs (id, ligand) VALUES (?,?)",
+                         [(i, ligand) for i, ligand in enumerate(energies, 1)])
+    store.db.insert_rows("INSERT INTO pose (jid, run, energy) VALUES (?,?,?)",
+                         [(i, run, energy) for i, ligand in enumerate(energies, 1)
+                          for run, energy in enumerate(energies[ligand], 1)])
+    store.close()
+    return os.path.join(output_directory, JOB_DB_NAME)
+
+
+def test_best_score_per_ligand_across_campaigns():
+    """The best pose of every ligand is found over all campaign databases"""
+    with tempfile.TemporaryDirectory() as main_directory:
+        make_campaign(main_directory, "output_1", {"lig1": [-6.0, -7.5], "lig2": [-5.0]})
+        make_campaign(main_directory, "output_2", {"lig2": [-8.0, -4.0], "lig3": [None]})
+        os.makedirs(os.path.join(main_directory, "Prepared"))
+        assert list(list_campaigns(main_directory)) == ["output_1", "output_2"]
+
+        catalog = CampaignCatalog(main_directory)
+        assert catalog.best_per_ligand() == [("lig2", -8.0, "output_2", 1, 1, 2), ("lig1", -7.5, "output_1", 1, 2, 1)]
+        assert sorted(catalog.query("SELECT * FROM campaign_totals")) == [("output_1", 2, 3, -7.5), ("output_2", 2, 3, -8.0)]
+
+        catalog.attach(["output_1"])
+        assert [row[0] for row in catalog.best_per_ligand()] == ["lig1", "lig2"]
+        catalog.close()
+
+
+def test_ligand_paths_and_names_match():
+    """A ligand job stores its path and a screen the bare name, both are the same ligand"""
+    with tempfile.TemporaryDirectory() as main_directory:
+        make_campaign(main_directory, "output_1", {"/session/Ligand/lig1.sdf": [-6.0], "lig2.pdbqt": [-5.0]})
+        make_campaign(main_directory, "output_2", {"lig1": [-7.0], "lig2": [-4.0]})
+
+        catalog = CampaignCatalog(main_directory)
+        assert [row[:3] + row[5:] for row in catalog.best_per_ligand()] == [
+            ("lig1", -7.0, "output_2", 2), ("lig2", -5.0, "output_1", 2)]
+        catalog.close()
+
+
+def test_drop_campaign_deletes_its_database():
+    """Dropping a campaign removes its shard and it leaves the views"""
+    with tempfile.TemporaryDirectory() as main_directory:
+        make_campaign(main_directory, "output_1", {"lig1": [-6.0]})
+        db_file = make_campaign(main_directory, "output_2", {"lig1": [-9.0]})
+
+        catalog = CampaignCatalog(main_directory)
+        assert catalog.best_per_ligand()[0][:3] == ("lig1", -9.0, "output_2")
+        assert catalog.drop_campaign("output_2")
+        assert not os.path.exists(db_file)
+        assert os.path.isdir(os.path.dirname(db_file))
+        assert catalog.best_per_ligand()[0][:3] == ("lig1", -6.0, "output_1")
+
+        assert catalog.drop_campaign("output_1")
+        assert catalog.best_per_ligand() == []
+        assert not catalog.drop_campaign("output_1")
+        catalog.close()
+
+
+def test_attach_limit():
+    """Asking for more campaigns than SQLite can attach is an error"""
+    with tempfile.TemporaryDirectory() as main_directory:
+        catalog = CampaignCatalog(main_directory)
+        with pytest.raises(ValueError):
+            catalog.attach(["output_{}".format(i) for i in range(catalog.max_attached + 1)])
+        catalog.close()
+
+
+if __name__ == "__main__":
+    test_best_score_per_ligand_across_campaigns()
+    test_ligand_paths_and_names_match()
+    test_drop_campaign_deletes_its_database()
+    test_attach_limit()
+    print("✓ All campaign catalog tests passed!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compressed Storage Test for PandaDOCK
+Verifies file columns are stored compressed and the receptor only once
+"""
+
+import os
+import tempfile
+
+from backend import DataBackend, compress_text, decompress_text
+from jobstore import JobStore
+from ingest import ingest_campaign, load_complex, receptor_block
+from db_compress import migrate_database
+from scheduler import DockingScheduler
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test")
+PROTEIN = os.path.join(TEST_DIR, "2v5z(4).pdb")
+
+LIGAND = "HETATM 9001  C1  LIG L   1      10.000  10.000  10.000  1.00  0.00           C\n"
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def make_complex(run):
+    with open(PROTEIN) as fh:
+        atoms = "".join(line + "\n" for line in receptor_block(fh.read()))
+    return "REMARK score -{}.5\n{}{}END\n".format(run, atoms, LIGAND)
+
+
+def test_compress_round_trip():
+    """Old text values and new blobs read back the same"""
+    text = make_complex(1)
+    blob = compress_text(text)
+    assert isinstance(blob, bytes) and len(blob) < len(text) / 3
+    assert decompress_text(blob) == text
+    assert decompress_text(text) == text
+    assert compress_text(None) is None
+
+
+def test_ingested_complexes_share_the_receptor():
+    """Poses keep only the ligand, the receptor is put back when loaded"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        store.save_campaign([], PROTEIN)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        scheduler.submit_many([scheduler.create_job([], "a.sdf", PROTEIN, output_directory)])
+        scheduler.start()
+        job = scheduler.running[0]
+        os.makedirs(os.path.join(job.output, "poses"))
+        for run in (1, 2):
+            with open(os.path.join(job.output, "poses", "pose_{}.pdb".format(run)), "w") as fw:
+                fw.write(make_complex(run))
+        scheduler.job_finished(job, 0)
+        store.close()
+
+        assert ingest_campaign(output_directory) == 2
+
+        store = JobStore(output_directory)
+        db = store.db
+        assert db.get_one("SELECT COUNT(1) FROM molecular WHERE content IS NOT NULL") == 1
+        assert db.get_one("SELECT COUNT(DISTINCT rid) FROM pose") == 1
+        assert db.get_one("SELECT MAX(length(complex)) FROM pose") < 200
+        pose = next(db.get_rows("pose", "WHERE run=2"))
+        assert LIGAND in pose.complex and "ATOM" not in pose.complex
+        assert load_complex(db, pose.id) == make_complex(2)
+        store.close()
+
+
+def test_migrate_old_database():
+    """Text complexes of an older database are compressed and deduplicated"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "pandadock.db")
+        db = DataBackend()
+        db.connect(db_file)
+        db.set_option("protein", PROTEIN)
+        db.insert_rows("INSERT INTO pose (jid, run, complex) VALUES (?,?,?)",
+                       [(1, run, make_complex(run)) for run in range(1, 21)])
+        db.close()
+
+        report = migrate_database(db_file)
+        assert report["compressed"] == 20 and report["receptor"] == 20
+        assert report["size_after"] * 10 < report["size_before"]
+
+        db.connect(db_file)
+        assert load_complex(db, 3) == make_complex(3)
+        assert db.get_one("SELECT unzip(complex) FROM pose WHERE id=3").startswith("REMARK score -3.5")
+        db.close()
+
+
+if __name__ == "__main__":
+    test_compress_round_trip()
+    test_ingested_complexes_share_the_receptor()
+    test_migrate_old_database()
+    print("✓ All compressed storage tests passed!")
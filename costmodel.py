@@ -0,0 +1,285 @@
+import os
+
+import numpy as np
+
+__all__ = ['CostModel', 'get_ligand_descriptors', 'molfile_descriptors', 'molecule_information']
+
+#predicted seconds = intercept + rotors, heavy atoms and atoms weights,
+#only used for ordering until enough jobs have finished to refit
+PRIOR_WEIGHTS = (10.0, 8.0, 1.0, 0.1)
+
+DESCRIPTORS = ('rotors', 'hvyatoms', 'atoms')
+
+def _find_bridges(n, edges):
+	#bonds whose removal disconnects the graph, i.e. not in a ring
+	graph = [[] for _ in range(n)]
+	for i, (a, b) in enumerate(edges):
+		graph[a].append((b, i))
+		graph[b].append((a, i))
+
+	order = [-1] * n
+	low = [0] * n
+	bridges = set()
+	counter = 0
+
+	for root in range(n):
+		if order[root] != -1:
+			continue
+
+		order[root] = low[root] = counter
+		counter += 1
+		stack = [(root, -1, iter(graph[root]))]
+
+		while stack:
+			node, via, neighbors = stack[-1]
+			advanced = False
+
+			for nxt, edge in neighbors:
+				if edge == via:
+					continue
+
+				if order[nxt] == -1:
+					order[nxt] = low[nxt] = counter
+					counter += 1
+					stack.append((nxt, edge, iter(graph[nxt])))
+					advanced = True
+					break
+
+				low[node] = min(low[node], order[nxt])
+
+			if not advanced:
+				stack.pop()
+
+				if stack:
+					parent = stack[-1][0]
+					low[parent] = min(low[parent], low[node])
+
+					if low[node] > order[parent]:
+						bridges.add(via)
+
+	return bridges
+
+def _read_molfile_graph(lines):
+	#elements, bonds and bond orders of the first record of a mol/sdf file
+	if 'V3000' in lines[3]:
+		elements = []
+		edges = []
+		orders = []
+		block = None
+
+		for line in lines[4:]:
+			if not line.startswith('M  V30'):
+				if line.startswith('M  END'):
+					break
+				continue
+
+			cols = line.split()[2:]
+
+			if cols[0] == 'BEGIN':
+				block = cols[1]
+			elif cols[0] == 'END':
+				block = None
+			elif block == 'ATOM':
+				elements.append(cols[1])
+			elif block == 'BOND':
+				orders.append(int(cols[1]))
+				edges.append((int(cols[2]) - 1, int(cols[3]) - 1))
+
+		return elements, edges, orders
+
+	natoms = int(lines[3][0:3])
+	nbonds = int(lines[3][3:6])
+	elements = [line[31:34].strip() for line in lines[4:4+natoms]]
+	edges = []
+	orders = []
+
+	for line in lines[4+natoms:4+natoms+nbonds]:
+		edges.append((int(line[0:3]) - 1, int(line[3:6]) - 1))
+		orders.append(int(line[6:9]))
+
+	return elements, edges, orders
+
+def _read_molfile_descriptors(mol_file):
+	#light V2000/V3000 reader used when Open Babel is not available
+	with open(mol_file) as fh:
+		lines = fh.read().splitlines()
+
+	return molfile_descriptors(lines)
+
+def molfile_descriptors(lines):
+	"""Rotors, heavy atoms and atoms of the first record of mol/sdf lines"""
+	elements, edges, orders = _read_molfile_graph(lines)
+	natoms = len(elements)
+	heavy = [e not in ('H', 'D') for e in elements]
+
+	degree = [0] * natoms
+	for a, b in edges:
+		if heavy[a] and heavy[b]:
+			degree[a] += 1
+			degree[b] += 1
+
+	bridges = _find_bridges(natoms, edges)
+	rotors = 0
+
+	for i, (a, b) in enumerate(edges):
+		if orders[i] == 1 and i in bridges and heavy[a] and heavy[b] \
+			and degree[a] > 1 and degree[b] > 1:
+			rotors += 1
+
+	return {'rotors': rotors, 'hvyatoms': sum(heavy), 'atoms': natoms}
+
+_open_babel = None
+
+def _load_open_babel():
+	#only Open Babel, utils would also pull in PyMOL and PLIP
+	global _open_babel
+
+	if _open_babel is None:
+		try:
+			from openbabel import openbabel
+			_open_babel = openbabel
+		except ImportError:
+			_open_babel = False
+
+	return _open_babel
+
+def molecule_information(mol, mol_format, from_string=False):
+	"""Return the counts, formula, energy, weight and logP of a molecule
+
+	mol is a file, or its content with from_string. Returns None when
+	Open Babel is not installed, raises ValueError if it cannot be read.
+	"""
+	ob = _load_open_babel()
+
+	if not ob:
+		return None
+
+	obc = ob.OBConversion()
+	obc.SetInFormat(mol_format)
+	molecule = ob.OBMol()
+	read = obc.ReadString if from_string else obc.ReadFile
+
+	if not read(molecule, mol) or not molecule.NumAtoms():
+		raise ValueError("cannot read {} molecule".format(mol_format))
+
+	log_p = ob.OBDescriptor.FindType('logP')
+
+	return {
+		'atoms': molecule.NumAtoms(),
+		'bonds': molecule.NumBonds(),
+		'hvyatoms': molecule.NumHvyAtoms(),
+		'residues': molecule.NumResidues(),
+		'rotors': molecule.NumRotors(),
+		'formula': molecule.GetFormula(),
+		'energy': molecule.GetEnergy(),
+		'weight': molecule.GetMolWt(),
+		'logp': log_p.Predict(molecule) if log_p else None
+	}
+
+def get_ligand_descriptors(ligand_path):
+	mol_format = os.path.splitext(ligand_path)[1].lstrip('.').lower()
+	info = molecule_information(ligand_path, mol_format)
+
+	if info is None:
+		return _read_molfile_descriptors(ligand_path)
+
+	return {'rotors': info['rotors'], 'hvyatoms': info['hvyatoms'], 'atoms': info['atoms']}
+
+class CostModel:
+	"""Predict ligand docking wall time from rotors, heavy atoms and atoms
+
+	The model starts from PRIOR_WEIGHTS and is refit by least squares on
+	the observed wall times of finished jobs, so the scheduler can start
+	the slowest ligands first.
+	"""
+
+	min_observations = 8
+
+	def __init__(self, observations=None):
+		self.weights = np.array(PRIOR_WEIGHTS)
+		self.observations = list(observations or [])
+		self.cache = {}
+		self.fitted = False
+		self._last_fit = 0
+
+		if self.observations:
+			self.fit()
+
+	@classmethod
+	def from_history(cls, main_directory):
+		"""Seed the model with finished jobs of earlier runs in a session
+
+		The campaigns are only read, databases of older versions are not
+		upgraded, the ones without descriptors are skipped.
+		"""
+		import apsw
+		from jobstore import JobStore, JOB_DB_NAME
+
+		observations = []
+		for entry in os.scandir(main_directory):
+			if entry.is_dir() and os.path.exists(os.path.join(entry.path, JOB_DB_NAME)):
+				store = JobStore(entry.path, readonly=True)
+
+				try:
+					observations.extend(store.observations())
+				except apsw.SQLError:
+					pass
+				finally:
+					store.close()
+
+		return cls(observations)
+
+	def describe(self, ligand_path):
+		if ligand_path not in self.cache:
+			try:
+				self.cache[ligand_path] = get_ligand_descriptors(ligand_path)
+			except Exception:
+				self.cache[ligand_path] = None
+
+		return self.cache[ligand_path]
+
+	def predict(self, descriptors):
+		if not descriptors:
+			return 0.0
+
+		x = np.array([1.0] + [descriptors[d] for d in DESCRIPTORS])
+		return max(float(x @ self.weights), 0.0)
+
+	def predict_file(self, ligand_path):
+		return self.predict(self.describe(ligand_path))
+
+	def predict_molfile(self, text):
+		#a record of a library, read by offset instead of from its own file
+		try:
+			descriptors = molfile_descriptors(text.splitlines())
+		except Exception:
+			descriptors = None
+
+		return self.predict(descriptors)
+
+	def observe(self, descriptors, seconds):
+		if descriptors and seconds > 0:
+			self.observations.append((descriptors['rotors'],
+				descriptors['hvyatoms'], descriptors['atoms'], seconds))
+
+	def fit(self):
+		if len(self.observations) < self.min_observations:
+			return False
+
+		data = np.array(self.observations, dtype=float)
+		x = np.hstack([np.ones((len(data), 1)), data[:, :3]])
+		weights, _, rank, _ = np.linalg.lstsq(x, data[:, 3], rcond=None)
+
+		#collinear descriptors (e.g. identical ligands) cannot be fitted
+		if rank < x.shape[1]:
+			return False
+
+		self.weights = weights
+		self.fitted = True
+		self._last_fit = len(self.observations)
+		return True
+
+	def needs_refit(self):
+		#refit whenever the number of observations grew by a quarter
+		count = len(self.observations)
+		return count >= self.min_observations and count >= self._last_fit * 1.25
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Cost Model Test for PandaDOCK
+Verifies longest-first ordering and refitting on observed wall times
+"""
+
+import os
+
+from costmodel import CostModel, get_ligand_descriptors
+from scheduler import DockingScheduler
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test")
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def test_descriptors():
+    """Rotatable bonds and heavy atoms are read from V2000 and V3000 files"""
+    hexacosane = get_ligand_descriptors(os.path.join(TEST_DIR, "hexacosane.sdf"))
+    assert hexacosane["hvyatoms"] == 26
+    assert hexacosane["rotors"] == 23
+
+    fluoro = get_ligand_descriptors(os.path.join(TEST_DIR, "Flouro-Derivative.sdf"))
+    assert fluoro["hvyatoms"] > 0
+
+
+def test_queue_is_ordered_longest_first():
+    """The flexible hexacosane starts before the rigid karanjin"""
+    model = CostModel()
+    scheduler = RecordingScheduler(max_workers=1, cost_model=model)
+    scheduler.submit_many(
+        scheduler.create_job([], os.path.join(TEST_DIR, name), "rec.pdb", "out")
+        for name in ("Karanjin.sdf", "hexacosane.sdf", "Flouro-Derivative.sdf")
+    )
+    assert [job.name for job in scheduler.pending][0] == "hexacosane"
+    assert [job.name for job in scheduler.pending][-1] == "Karanjin"
+
+
+def test_refit_on_observations():
+    """After refitting, heavy atoms can outweigh rotors"""
+    model = CostModel()
+    for i in range(10):
+        rotors, heavy = i % 3, 10 + 3 * i
+        model.observe({"rotors": rotors, "hvyatoms": heavy, "atoms": heavy * 2 + i % 2}, 5.0 * heavy)
+
+    assert model.needs_refit()
+    assert model.fit()
+    assert model.predict({"rotors": 0, "hvyatoms": 40, "atoms": 80}) > \
+        model.predict({"rotors": 10, "hvyatoms": 10, "atoms": 20})
+
+
+if __name__ == "__main__":
+    test_descriptors()
+    test_queue_is_ordered_longest_first()
+    test_refit_on_observations()
+    print("✓ All cost model tests passed!")
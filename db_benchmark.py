@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Query plan benchmark for the PandaDock SQLite schema.
+
+Fills a synthetic database shaped like a large campaign (jobs, poses,
+best poses, logs, binding sites, interactions and grid boxes) and prints
+EXPLAIN QUERY PLAN and the median latency of the lookups used by the GUI:
+
+	python db_benchmark.py --rows 10000000 --db bench.db --compare
+"""
+
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from backend import DataBackend, DB_INDEXES, DB_TRIGGERS
+
+__all__ = ['fill_database', 'drop_indexes', 'run_queries', 'BENCHMARK_QUERIES']
+
+#name, sql and a function returning parameters for a database with n poses
+BENCHMARK_QUERIES = [
+	('grid of receptor', "SELECT 1 FROM grid WHERE rid=? LIMIT 1",
+		lambda n, r: (r.randint(1, max(1, n // 100000)),)),
+	('poses of job', "SELECT id, run, energy FROM pose WHERE jid=? ORDER BY energy",
+		lambda n, r: (r.randint(1, max(1, n // 10)),)),
+	('best pose of job', "SELECT id, energy FROM pose WHERE jid=? ORDER BY energy LIMIT 1",
+		lambda n, r: (r.randint(1, max(1, n // 10)),)),
+	('top 100 ligands', "SELECT j.ligand, s.min_energy FROM ligand_summary AS s "
+		"JOIN jobs AS j ON j.id=s.jid ORDER BY s.min_energy LIMIT 100", lambda n, r: ()),
+	('pose of best', "SELECT id FROM best WHERE pid=?",
+		lambda n, r: (r.randint(1, n),)),
+	('logs of job', "SELECT name, content FROM logs WHERE jid=?",
+		lambda n, r: (r.randint(1, max(1, n // 10)),)),
+	('binding site of pose', "SELECT id, site FROM binding_site WHERE pid=?",
+		lambda n, r: (r.randint(1, n),)),
+	('hydrogen bonds of site', "SELECT * FROM hydrogen_bond WHERE bid=?",
+		lambda n, r: (r.randint(1, n),)),
+	('h-bonds to residue', "SELECT c.pid, c.distance FROM pose_residue_contact AS c "
+		"WHERE c.resid=? AND c.kind=1 AND c.distance<=2.5",
+		lambda n, r: (r.randint(1, 300),)),
+	('unfinished jobs', "SELECT id FROM jobs WHERE status=? LIMIT 100",
+		lambda n, r: (0,)),
+	('job of ligand', "SELECT id FROM jobs WHERE output=? AND ligand=?",
+		lambda n, r: ('output_1', 'lig{}'.format(r.randint(1, max(1, n // 10))))),
+]
+
+def drop_indexes(db):
+	#the summary triggers need the unique indexes of best and ligand_summary
+	for name in DB_TRIGGERS:
+		db.query("DROP TRIGGER IF EXISTS {}".format(name))
+
+	for name in DB_INDEXES:
+		db.query("DROP INDEX IF EXISTS {}".format(name))
+
+def _batches(rows, size=100000):
+	batch = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) == size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+def fill_database(db, rows, seed=1):
+	"""Insert a campaign with rows poses, ten poses per job
+
+	Indexes and triggers are dropped during the fill and built once at
+	the end, which is much faster than maintaining them row by row.
+	"""
+	r = random.Random(seed)
+	jobs = max(1, rows // 10)
+	receptors = max(1, rows // 100000)
+	drop_indexes(db)
+
+	tables = [
+		("INSERT INTO grid (rid, x, y, z, cx, cy, cz, spacing) VALUES (?,?,?,?,?,?,?,?)",
+			((rid, 40, 40, 40, 0.0, 0.0, 0.0, 0.375) for rid in range(1, receptors + 1))),
+		("INSERT INTO jobs (id, rid, status, progress, ligand, output) VALUES (?,?,?,?,?,?)",
+			((i, 1, 0 if i % 1000 == 0 else 2, 1.0, 'lig{}'.format(i), 'output_1') for i in range(1, jobs + 1))),
+		("INSERT INTO pose (id, jid, run, energy, rmsd1, rmsd2) VALUES (?,?,?,?,?,?)",
+			((i, (i - 1) // 10 + 1, (i - 1) % 10 + 1, r.uniform(-12, -2), 0.0, 0.0) for i in range(1, rows + 1))),
+		("INSERT INTO logs (jid, name, content) VALUES (?,?,?)",
+			((i, 'pandadock.log', 'done') for i in range(1, jobs + 1))),
+		("INSERT INTO binding_site (pid, site) VALUES (?,?)",
+			((i, 'site') for i in range(1, rows + 1))),
+		("INSERT INTO hydrogen_bond (bid, chain, residue, amino_acid, distance_ha) VALUES (?,?,?,?,?)",
+			((r.randint(1, rows), 'A', r.randint(1, 300), 'SER', 2.9) for _ in range(rows))),
+		("INSERT INTO residue (id, chain, number, amino_acid) VALUES (?,?,?,?)",
+			((i, 'A', i, 'SER') for i in range(1, 301))),
+		("INSERT INTO pose_residue_contact (pid, bid, resid, kind, distance, active_site) VALUES (?,?,?,?,?,?)",
+			((i, i, r.randint(1, 300), 1, r.uniform(1.5, 4.0), 0) for i in range(1, rows + 1))),
+	]
+
+	for sql, values in tables:
+		for batch in _batches(values):
+			db.insert_rows(sql, batch)
+
+	start = time.time()
+	db._create_indexes()
+	db._create_triggers()
+	return time.time() - start
+
+def query_plan(db, sql, paras):
+	#a cached EXPLAIN statement keeps its plan after indexes are dropped
+	cur = db.cursor.execute("EXPLAIN QUERY PLAN " + sql, paras, can_cache=False)
+	return '; '.join(row[-1] for row in cur)
+
+def run_queries(db, repeat=50, seed=2):
+	"""Return (name, query plan, median ms) of every benchmark query"""
+	r = random.Random(seed)
+	rows = db.get_count('pose')
+	results = []
+
+	for name, sql, make_paras in BENCHMARK_QUERIES:
+		times = []
+
+		for _ in range(repeat):
+			paras = make_paras(rows, r)
+			start = time.perf_counter()
+			list(db.query(sql, paras))
+			times.append((time.perf_counter() - start) * 1000)
+
+		results.append((name, query_plan(db, sql, make_paras(rows, r)), statistics.median(times)))
+
+	return results
+
+def print_results(title, results):
+	print(title)
+	for name, plan, ms in results:
+		print("  {:<24} {:>10.3f} ms  {}".format(name, ms, plan))
+
+def get_parser():
+	parser = argparse.ArgumentParser(prog='db_benchmark',
+		description="Benchmark the PandaDock SQLite schema on a synthetic campaign")
+	parser.add_argument('--rows', type=int, default=10000000, help="number of pose rows (default: 10M)")
+	parser.add_argument('--db', default=None,
+		help="database file, reused if it already holds poses (default: in memory)")
+	parser.add_argument('--repeat', type=int, default=50, help="runs of every query")
+	parser.add_argument('--compare', action='store_true', help="also run the queries without the indexes")
+	return parser
+
+def main(argv=None):
+	opts = get_parser().parse_args(argv)
+	db = DataBackend()
+	db.connect(opts.db or ':memory:')
+
+	if not db.get_count('pose'):
+		start = time.time()
+		seconds = fill_database(db, opts.rows)
+		print("filled {} poses in {:.1f}s, indexes built in {:.1f}s".format(
+			opts.rows, time.time() - start, seconds))
+
+	print_results("with indexes", run_queries(db, opts.repeat))
+
+	if opts.compare:
+		drop_indexes(db)
+		#full scans are slow, a few runs are enough
+		print_results("without indexes", run_queries(db, min(opts.repeat, 3)))
+		db._create_indexes()
+
+	db.close()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
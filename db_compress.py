@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compress the file columns of PandaDock databases written by older versions.
+
+Stores molecule, complex and log text as zlib blobs, keeps the campaign
+receptor once instead of in every complex, and prints the file size and
+the latency of reading complexes before and after:
+
+	python db_compress.py session/output_1/pandadock.db
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from backend import DataBackend
+from ingest import load_complex, dedupe_receptor
+
+__all__ = ['migrate_database', 'complex_latency']
+
+def complex_latency(db, samples=200, seed=1):
+	"""Median milliseconds to read the complex of a random pose"""
+	pids = db.get_column("SELECT id FROM pose WHERE complex IS NOT NULL")
+
+	if not pids:
+		return None
+
+	r = random.Random(seed)
+	times = []
+
+	for _ in range(samples):
+		pid = r.choice(pids)
+		start = time.perf_counter()
+		load_complex(db, pid)
+		times.append((time.perf_counter() - start) * 1000)
+
+	return statistics.median(times)
+
+def migrate_database(db_file, protein_file=None, vacuum=True):
+	"""Compress db_file in place, returns a dict of the measurements
+
+	protein_file defaults to the protein of the campaign stored in the
+	option table, the receptor is only deduplicated if it can be read.
+	"""
+	report = {'size_before': os.path.getsize(db_file)}
+	db = DataBackend()
+	db.connect(db_file)
+
+	try:
+		report['latency_before'] = complex_latency(db)
+		report['compressed'] = db.compress_columns()
+		protein_file = protein_file or db.get_option('protein')
+
+		if protein_file and os.path.isfile(protein_file):
+			report['receptor'] = dedupe_receptor(db, protein_file)
+		else:
+			report['receptor'] = 0
+
+		if vacuum:
+			db.query("VACUUM")
+
+		report['latency_after'] = complex_latency(db)
+	finally:
+		db.close()
+
+	report['size_after'] = os.path.getsize(db_file)
+	return report
+
+def _ms(value):
+	return "n/a" if value is None else "{:.3f} ms".format(value)
+
+def get_parser():
+	parser = argparse.ArgumentParser(prog='db_compress',
+		description="Compress the molecule, complex and log text of PandaDock databases")
+	parser.add_argument('databases', nargs='+', help="pandadock.db files to migrate")
+	parser.add_argument('-p', '--protein', default=None,
+		help="receptor file (default: the protein recorded in the database)")
+	parser.add_argument('--no-vacuum', action='store_true', help="do not give the freed pages back to the file system")
+	return parser
+
+def main(argv=None):
+	opts = get_parser().parse_args(argv)
+
+	for db_file in opts.databases:
+		report = migrate_database(db_file, opts.protein, not opts.no_vacuum)
+		print("{}: {} values compressed, receptor removed from {} complexes".format(
+			db_file, report['compressed'], report['receptor']))
+		print("  size    {:>12,d} -> {:>12,d} bytes ({:.1f}x)".format(report['size_before'],
+			report['size_after'], report['size_before'] / max(1, report['size_after'])))
+		print("  complex {:>12} -> {:>12} median read".format(
+			_ms(report['latency_before']), _ms(report['latency_after'])))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,374 @@
+import os
+import re
+import csv
+import time
+
+from backend import compress_text, decompress_text
+from jobstore import JobStore, JOB_DONE, MOLECULE_RECEPTOR
+from sharding import get_score_column
+
+__all__ = ['PoseIngestor', 'ingest_campaign', 'read_pose_energy', 'load_complex', 'dedupe_receptor', 'ligand_name']
+
+POSE_FOLDER = 'poses'
+
+POSE_EXTENSIONS = ('.pdb', '.pdbqt', '.sdf', '.mol2')
+
+#pose table fields and the score table columns they are read from
+FIELD_COLUMNS = [
+	('run', ('pose', 'pose_id', 'pose_rank', 'rank', 'run')),
+	('energy', ('score', 'energy', 'affinity', 'binding_affinity', 'docking_score', 'binding_energy')),
+	('rmsd1', ('rmsd', 'rmsd_lb', 'rmsd_lower')),
+	('rmsd2', ('rmsd_ub', 'rmsd_upper')),
+	('logki', ('logki', 'log_ki', 'pki')),
+	('le', ('le', 'ligand_efficiency')),
+	('sile', ('sile',)),
+	('fq', ('fq',)),
+	('lle', ('lle',)),
+	('lelp', ('lelp',)),
+	('ki', ('ki', 'kd', 'ic50'))
+]
+
+LIGAND_COLUMNS = ('ligand', 'ligand_name', 'ligand_id', 'name', 'molecule', 'compound')
+
+POSE_FIELDS = ['jid', 'run'] + [field for field, _ in FIELD_COLUMNS[1:]] + ['rid', 'complex']
+
+#a pose seen in a file and a score table is merged into one row,
+#relies on the unique pose_jid_run index of backend.DB_INDEXES
+UPSERT_POSE = "INSERT INTO pose ({}) VALUES ({}) ON CONFLICT(jid, run) DO UPDATE SET {}".format(
+	','.join(POSE_FIELDS), ','.join('?' * len(POSE_FIELDS)),
+	','.join("{0}=coalesce(excluded.{0}, pose.{0})".format(f) for f in POSE_FIELDS[2:])
+)
+
+POSE_FILE_NAME = re.compile(r'^(?P<ligand>.*?)[_\-. ]*pose[_\-. ]*(?P<run>\d+)', re.I)
+
+ENERGY_REMARK = re.compile(r'(?:score|energy|affinity)\D{0,20}?(-?\d+(?:\.\d+)?)', re.I)
+
+ENERGY_PROPERTY = re.compile(r'^>.*<[^>]*(?:score|energy|affinity)[^>]*>', re.I)
+
+#stands for the receptor atoms in a stored complex, see pose.rid
+RECEPTOR_PLACEHOLDER = 'REMARK   PANDADOCK RECEPTOR'
+
+def _to_float(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return None
+
+def ligand_name(value):
+	"""Return the ligand of a path or table cell, without a molecule extension"""
+	if value is None:
+		return None
+
+	name = os.path.basename(value.strip())
+	stem, ext = os.path.splitext(name)
+	return stem if ext.lower() in POSE_EXTENSIONS + ('.mol',) else name
+
+def read_pose_energy(text):
+	"""Return the score from PDB REMARK lines or SDF properties, or None"""
+	lines = text.splitlines()
+
+	for i, line in enumerate(lines):
+		if line.startswith('REMARK'):
+			m = ENERGY_REMARK.search(line)
+
+			if m:
+				return float(m.group(1))
+
+		elif ENERGY_PROPERTY.match(line) and i + 1 < len(lines):
+			value = _to_float(lines[i + 1])
+
+			if value is not None:
+				return value
+
+	return None
+
+def receptor_block(text):
+	"""Return the atom lines of a receptor, from the first to the last atom"""
+	lines = [line.rstrip() for line in text.splitlines()]
+	atoms = [i for i, line in enumerate(lines) if line.startswith(('ATOM', 'HETATM'))]
+	return lines[atoms[0]:atoms[-1] + 1] if atoms else []
+
+def strip_receptor(text, block):
+	"""Replace the receptor block in a complex with RECEPTOR_PLACEHOLDER
+
+	Returns None if the complex does not hold the whole receptor.
+	"""
+	if not block:
+		return None
+
+	lines = text.splitlines(True)
+	size = len(block)
+
+	for i, line in enumerate(lines):
+		if line.rstrip() == block[0] and [l.rstrip() for l in lines[i:i + size]] == block:
+			return ''.join(lines[:i] + [RECEPTOR_PLACEHOLDER + '\n'] + lines[i + size:])
+
+	return None
+
+#receptor atom text by (database file, molecular.id), receptors are never updated
+_receptor_blocks = {}
+
+def _receptor_text(db, rid):
+	key = (db.file, rid)
+
+	if key not in _receptor_blocks:
+		if len(_receptor_blocks) >= 16:
+			_receptor_blocks.clear()
+
+		content = decompress_text(db.get_one("SELECT content FROM molecular WHERE id=?", (rid,)))
+		_receptor_blocks[key] = ''.join(line + '\n' for line in receptor_block(content or ''))
+
+	return _receptor_blocks[key]
+
+def join_receptor(text, block):
+	if text is None or block is None:
+		return text
+
+	return text.replace(RECEPTOR_PLACEHOLDER + '\n', block, 1)
+
+def load_complex(db, pid):
+	"""Return the complex of a pose with its receptor atoms put back"""
+	row = db.get_row("SELECT complex, rid FROM pose WHERE id=?", (pid,))
+
+	if row is None:
+		return None
+
+	text, rid = row
+	block = _receptor_text(db, rid) if rid is not None else None
+	return join_receptor(decompress_text(text), block)
+
+def dedupe_receptor(db, protein_file, batch_size=2000):
+	"""Strip the receptor from complexes stored without pose.rid
+
+	Migrates databases written before the receptor was stored once.
+	Returns the number of complexes changed.
+	"""
+	ingestor = PoseIngestor(db)
+	ingestor.set_receptor(protein_file)
+	sql = "SELECT id, complex FROM pose WHERE id>? AND rid IS NULL AND complex IS NOT NULL ORDER BY id LIMIT ?"
+	last = count = 0
+
+	while True:
+		rows = list(db.query(sql, (last, batch_size)))
+
+		if not rows:
+			return count
+
+		last = rows[-1][0]
+		updates = []
+
+		for pid, value in rows:
+			stripped = strip_receptor(decompress_text(value), ingestor.block)
+
+			if stripped is not None:
+				updates.append((ingestor.receptor, compress_text(stripped), pid))
+
+		db.insert_rows("UPDATE pose SET rid=?, complex=? WHERE id=?", updates)
+		count += len(updates)
+
+class PoseIngestor:
+	"""Stream pose files and score tables of docking outputs into pose
+
+	Rows are written with batch_size rows per DataBackend.insert_rows
+	transaction, so memory does not grow with the number of poses. A
+	pose is identified by its job and its run, the rank of the pose for
+	the ligand, so files and table rows of the same pose are merged and
+	ingesting an output twice does not duplicate it.
+	"""
+
+	def __init__(self, db, batch_size=20000):
+		self.db = db
+		self.batch_size = batch_size
+		self.rows = []
+		self.count = 0
+		self.ligand_jobs = {}
+		self.new_jobs = {}
+		self.job_ids = {}
+		self.runs = {}
+		self.receptor = None
+		self.block = None
+
+	def set_receptor(self, protein_file):
+		"""Store the receptor once, complexes holding it refer to it by rid"""
+		with open(protein_file, errors='replace') as fh:
+			content = fh.read()
+
+		name = os.path.basename(protein_file)
+		sql = "SELECT id FROM molecular WHERE type=? AND name=? AND content=?"
+		self.receptor = self.db.get_one(sql, (MOLECULE_RECEPTOR, name, compress_text(content)))
+
+		if self.receptor is None:
+			self.db.query("INSERT INTO molecular (name, type, content, format) VALUES (?,?,?,?)",
+				(name, MOLECULE_RECEPTOR, compress_text(content), os.path.splitext(name)[1].lstrip('.').lower()))
+			self.receptor = self.db.conn.last_insert_rowid()
+
+		self.block = receptor_block(content)
+
+	def add(self, jid, run, values, complex_text=None):
+		if complex_text is not None:
+			stripped = strip_receptor(complex_text, self.block)
+
+			if stripped is not None:
+				values = dict(values, rid=self.receptor)
+				complex_text = stripped
+
+		row = [jid, run] + [values.get(f) for f in POSE_FIELDS[2:-1]] + [compress_text(complex_text)]
+		self.rows.append(row)
+
+		if len(self.rows) >= self.batch_size:
+			self.flush()
+
+	def flush(self):
+		if self.rows:
+			#jobs of newly seen screen ligands are written in the transaction of their poses
+			self.db.begin()
+
+			for key, paras in self.new_jobs.items():
+				self.db.query("INSERT INTO jobs (status, progress, started, finished, ligand, output) VALUES (?,?,?,?,?,?)", paras)
+				self.job_ids[key] = self.db.conn.last_insert_rowid()
+
+			for row in self.rows:
+				row[0] = self.job_ids.get(row[0], row[0])
+
+			self.db.cursor.executemany(UPSERT_POSE, self.rows)
+			self.db.commit()
+			self.count += len(self.rows)
+			self.new_jobs = {}
+			self.rows = []
+
+	def next_run(self, jid):
+		self.runs[jid] = self.runs.get(jid, 0) + 1
+		return self.runs[jid]
+
+	def job_for_ligand(self, name, output):
+		"""Return the job of a ligand in a screen, a done job is added if missing
+
+		A missing job gets a negative key until flush inserts it with the
+		poses that refer to it.
+		"""
+		if name not in self.ligand_jobs:
+			now = int(time.time())
+			key = -len(self.job_ids) - len(self.new_jobs) - 1
+			self.new_jobs[key] = (JOB_DONE, 1, now, now, name, output)
+			self.ligand_jobs[name] = key
+
+		return self.ligand_jobs[name]
+
+	def ingest_pose_files(self, output, jid=None):
+		pose_folder = os.path.join(output, POSE_FOLDER)
+
+		if not os.path.isdir(pose_folder):
+			return
+
+		for entry in sorted(os.scandir(pose_folder), key=lambda e: e.name):
+			stem, ext = os.path.splitext(entry.name)
+
+			if not entry.is_file() or ext.lower() not in POSE_EXTENSIONS:
+				continue
+
+			m = POSE_FILE_NAME.match(stem)
+			ligand = m.group('ligand') if m else stem
+			job = jid or self.job_for_ligand(ligand or stem, output)
+			run = int(m.group('run')) if m else self.next_run(job)
+
+			with open(entry.path, errors='replace') as fh:
+				text = fh.read()
+
+			self.add(job, run, {'energy': read_pose_energy(text)}, text)
+
+	def ingest_table(self, table, output, jid=None):
+		with open(table, newline='') as fh:
+			reader = csv.DictReader(fh)
+
+			if not reader.fieldnames:
+				return
+
+			lowered = {f.strip().lower(): f for f in reader.fieldnames}
+			columns = {}
+
+			for field, names in FIELD_COLUMNS:
+				for name in names:
+					if name in lowered:
+						columns[field] = lowered[name]
+						break
+
+			if 'energy' not in columns:
+				score = get_score_column(reader.fieldnames)
+
+				if score is None:
+					return
+
+				columns['energy'] = score
+
+			ligand_column = next((lowered[n] for n in LIGAND_COLUMNS if n in lowered), None)
+
+			if jid is None and ligand_column is None:
+				return
+
+			runs = {}
+
+			for row in reader:
+				job = jid or self.job_for_ligand(ligand_name(row[ligand_column]), output)
+				run = _to_float(row.get(columns.get('run')))
+
+				#without a pose column rows are ranked in table order
+				runs[job] = int(run) if run is not None else runs.get(job, 0) + 1
+				values = {f: _to_float(row.get(c)) for f, c in columns.items() if f not in ('run', 'ki')}
+
+				if 'ki' in columns:
+					values['ki'] = row.get(columns['ki'])
+
+				self.add(job, runs[job], values)
+
+	def ingest_output(self, output, jid=None):
+		"""Ingest a pandadock output, jid is None for a --screen output"""
+		self.runs = {}
+
+		if jid is None:
+			sql = "SELECT ligand, id FROM jobs WHERE output=?"
+			self.ligand_jobs = {ligand: jid for ligand, jid in self.db.query(sql, (output,))}
+		self.ingest_pose_files(output, jid)
+
+		for entry in sorted(os.scandir(output), key=lambda e: e.name):
+			if entry.is_file() and entry.name.lower().endswith('.csv'):
+				self.ingest_table(entry.path, output, jid)
+
+	def update_best(self):
+		"""Rebuild best and ligand_summary, the pose triggers keep them current"""
+		self.db.rebuild_summaries()
+
+def ingest_campaign(output_directory, batch_size=20000):
+	"""Ingest all poses of a docking run into output_N/pandadock.db
+
+	Returns the number of pose rows written.
+	"""
+	store = JobStore(output_directory)
+
+	try:
+		#the jobs table shares the file, NORMAL keeps the WAL database intact on a crash
+		store.db.pragma('synchronous', 'NORMAL')
+		ingestor = PoseIngestor(store.db, batch_size)
+		protein_file = store.load_campaign()[1]
+
+		if protein_file and os.path.isfile(protein_file):
+			ingestor.set_receptor(protein_file)
+
+		jobs = list(store.db.query("SELECT id, output FROM jobs WHERE status=? AND output IS NOT NULL", (JOB_DONE,)))
+		ligand_jobs = [(jid, output) for jid, output in jobs
+			if output != output_directory and os.path.isdir(output)]
+
+		#shard jobs screen many ligands, their merged output is ingested instead
+		if store.load_shards():
+			ligand_jobs = []
+
+		for jid, output in ligand_jobs:
+			ingestor.ingest_output(output, jid)
+
+		#a --screen run, or sharded screens merged into output_N
+		if not ligand_jobs:
+			ingestor.ingest_output(output_directory)
+
+		ingestor.flush()
+		return ingestor.count
+	finally:
+		store.close()
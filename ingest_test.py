@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Ingestion Test for PandaDOCK
+Verifies pose files and score tables are streamed into pose and best
+"""
+
+import os
+import tempfile
+
+from ingest import ingest_campaign, read_pose_energy
+from jobstore import JobStore
+from scheduler import DockingScheduler
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fw:
+        fw.write(text)
+
+
+def test_read_pose_energy():
+    """Scores are found in PDB remarks and SDF properties"""
+    assert read_pose_energy("REMARK   Score: -7.25\nATOM\n") == -7.25
+    assert read_pose_energy("mol\n\n>  <docking_score>\n-6.5\n\n$$$$\n") == -6.5
+    assert read_pose_energy("ATOM\nEND\n") is None
+
+
+def test_ingest_ligand_campaign():
+    """Pose files and score rows of the same pose are merged, best is ranked"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        scheduler = RecordingScheduler(max_workers=2, store=store)
+        scheduler.submit_many(scheduler.create_job([], "{}.sdf".format(n), "rec.pdb", output_directory) for n in "ab")
+        scheduler.start()
+
+        for n, job in enumerate(list(scheduler.running)):
+            for run in (1, 2):
+                write(os.path.join(job.output, "poses", "pose_{}.pdb".format(run)),
+                      "REMARK score {}\nEND\n".format(-run - n))
+            write(os.path.join(job.output, "results.csv"),
+                  "pose,score,rmsd_lb,rmsd_ub\n1,{},0,0\n2,{},1.5,2.5\n".format(-5.0 - n, -4.0 - n))
+            scheduler.job_finished(job, 0)
+        store.close()
+
+        assert ingest_campaign(output_directory) == 8
+        assert ingest_campaign(output_directory) == 8
+
+        store = JobStore(output_directory)
+        db = store.db
+        assert db.get_count("pose") == 4
+        assert db.get_one("SELECT COUNT(1) FROM pose WHERE complex IS NOT NULL") == 4
+        assert db.get_row("SELECT energy, rmsd1, rmsd2 FROM pose WHERE run=2 ORDER BY jid LIMIT 1") == (-4.0, 1.5, 2.5)
+        ranked = db.get_column("SELECT p.energy FROM best AS b JOIN pose AS p ON p.id=b.pid ORDER BY p.energy")
+        assert ranked == [-6.0, -5.0]
+        store.close()
+
+
+def test_ingest_screen_in_batches():
+    """A screen table with a ligand column is split per ligand, its jobs are written with the poses"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        rows = ["ligand,score"] + ["lig{}.sdf,{}".format(i // 3, -i / 10.0) for i in range(300)]
+        write(os.path.join(output_directory, "results.csv"), "\n".join(rows) + "\n")
+
+        assert ingest_campaign(output_directory, batch_size=64) == 300
+        assert ingest_campaign(output_directory, batch_size=64) == 300
+
+        store = JobStore(output_directory)
+        assert store.db.get_count("jobs") == 100
+        assert store.db.get_count("pose") == 300
+        assert store.db.get_count("best") == 100
+        assert store.db.get_one("SELECT MAX(run) FROM pose") == 3
+        assert store.db.get_one("SELECT COUNT(1) FROM pose WHERE jid NOT IN (SELECT id FROM jobs)") == 0
+        store.close()
+
+
+if __name__ == "__main__":
+    test_read_pose_energy()
+    test_ingest_ligand_campaign()
+    test_ingest_screen_in_batches()
+    print("✓ All ingestion tests passed!")
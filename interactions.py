@@ -0,0 +1,221 @@
+from backend import get_fields, DB_TABLES, DB_INDEXES, INTERACTION_TABLES, INTERACTION_KINDS, CONTACT_DISTANCE
+
+__all__ = ['save_interactions', 'index_contacts', 'migrate_interactions',
+	'poses_with_contact', 'contact_frequency', 'parse_residue'
+]
+
+#flag columns written as 'Yes'/'No' by older versions
+FLAG_COLUMNS = {
+	'hydrogen_bond': ('protein_donor', 'side_chain'),
+	'water_bridge': ('protein_donor',),
+	'salt_bridge': ('protein_positive',),
+	'pi_cation': ('protein_charged',)
+}
+
+#atom columns written as "index [type]" by older versions and their type column
+ATOM_COLUMNS = {
+	'hydrogen_bond': (('donor_atom', 'donor_type'), ('acceptor_atom', 'acceptor_type')),
+	'halogen_bond': (('donor_atom', 'donor_type'), ('acceptor_atom', 'acceptor_type')),
+	'water_bridge': (('donor_atom', 'donor_type'), ('acceptor_atom', 'acceptor_type')),
+	'metal_complex': (('metal', 'metal_type'), ('target', 'target_type'))
+}
+
+#older versions pointed interaction rows to their binding site as "pose index:site"
+LEGACY_BID = (
+	"CASE WHEN instr(t.bid, ':')>0 THEN (SELECT MIN(b.id) FROM binding_site AS b "
+	"WHERE b.pid=CAST(substr(t.bid, 1, instr(t.bid, ':')-1) AS INTEGER) "
+	"AND b.site=substr(t.bid, instr(t.bid, ':')+1)) ELSE CAST(t.bid AS INTEGER) END"
+)
+
+def parse_residue(residue):
+	"""Split an active site residue "A:ASP:189" into (chain, number, amino acid)"""
+	chain, amino_acid, number = residue.split(':')
+	return chain, int(number), amino_acid
+
+def index_contacts(db, first_bid=0):
+	"""Fill pose_residue_contact from the interactions of binding sites from first_bid on
+
+	Runs as SQL over the interaction tables, returns the number of contacts.
+	"""
+	count = 0
+
+	for table in INTERACTION_TABLES:
+		db.query("INSERT OR IGNORE INTO residue (chain, number, amino_acid) "
+			"SELECT DISTINCT chain, residue, amino_acid FROM {} WHERE bid>=?".format(table), (first_bid,))
+
+		db.query(
+			"INSERT INTO pose_residue_contact (pid, bid, resid, kind, distance, active_site) "
+			"SELECT b.pid, t.bid, r.id, ?, t.{}, t.active_site FROM {} AS t "
+			"JOIN binding_site AS b ON b.id=t.bid "
+			"JOIN residue AS r ON r.chain=t.chain AND r.number=t.residue AND r.amino_acid=t.amino_acid "
+			"WHERE t.bid>=?".format(CONTACT_DISTANCE[table], table),
+			(INTERACTION_KINDS[table], first_bid)
+		)
+		count += db.conn.changes()
+
+	return count
+
+def save_interactions(db, pids, interactions):
+	"""Store the rows of utils.get_complex_interactions in one transaction
+
+	pids[i] is the pose id of poses[i] of get_complex_interactions, binding
+	site indexes of the interaction rows are replaced by binding site ids.
+	Returns the number of residue contacts added.
+	"""
+	db.begin()
+
+	try:
+		first_bid = None
+		bids = []
+
+		for _, i, site in interactions['binding_site']:
+			db.query("INSERT INTO binding_site (pid, site) VALUES (?,?)", (pids[i], site))
+			bids.append(db.conn.last_insert_rowid())
+
+			if first_bid is None:
+				first_bid = bids[-1]
+
+		if first_bid is None:
+			db.commit()
+			return 0
+
+		for table in INTERACTION_TABLES:
+			fields = get_fields(table)[1:]
+			sql = "INSERT INTO {} ({}) VALUES ({})".format(table, ','.join(fields), ','.join('?' * len(fields)))
+			db.cursor.executemany(sql, [[bids[row[1]]] + row[2:] for row in interactions.get(table, [])])
+
+		count = index_contacts(db, first_bid)
+	except:
+		db.rollback()
+		raise
+
+	db.commit()
+	return count
+
+def _converted_columns(table):
+	return ['bid'] + list(FLAG_COLUMNS.get(table, ())) + [atom for atom, _ in ATOM_COLUMNS.get(table, ())]
+
+def _is_legacy(db, table):
+	#columns of an older schema, or values still written as text
+	columns = [row[1] for row in db.query("PRAGMA table_info({})".format(table))]
+
+	if columns != get_fields(table):
+		return True
+
+	texts = ' OR '.join("typeof({})='text'".format(column) for column in _converted_columns(table))
+	return db.get_one("SELECT EXISTS(SELECT 1 FROM {} WHERE {})".format(table, texts)) == 1
+
+def _migrated_values(db, table):
+	#SELECT expressions over the old table, t, for each column of the new one
+	columns = {row[1] for row in db.query("PRAGMA table_info({})".format(table))}
+	values = {field: 't.' + field if field in columns else 'NULL' for field in get_fields(table)}
+	values['bid'] = LEGACY_BID
+
+	for column in FLAG_COLUMNS.get(table, ()):
+		values[column] = "CASE t.{0} WHEN 'Yes' THEN 1 WHEN 'No' THEN 0 ELSE CAST(t.{0} AS INTEGER) END".format(column)
+
+	for atom, atom_type in ATOM_COLUMNS.get(table, ()):
+		split = "typeof(t.{0})='text' AND instr(t.{0}, ' [')>0".format(atom)
+		values[atom] = "CASE WHEN {1} THEN CAST(substr(t.{0}, 1, instr(t.{0}, ' [')-1) AS INTEGER) " \
+			"ELSE CAST(t.{0} AS INTEGER) END".format(atom, split)
+		values[atom_type] = "CASE WHEN {1} THEN rtrim(substr(t.{0}, instr(t.{0}, ' [')+2), ']') " \
+			"ELSE {2} END".format(atom, split, values[atom_type])
+
+	return [values[field] for field in get_fields(table)]
+
+def _rebuild_table(db, table):
+	#copied into a table of the current schema, the column types convert the values
+	temp = table + '_migrated'
+	fields = get_fields(table)
+	columns = ','.join(["{} {}".format(*field) for field in DB_TABLES[table]])
+
+	db.query("DROP TABLE IF EXISTS {}".format(temp))
+	db.query("CREATE TABLE {} ({})".format(temp, columns))
+	db.query("INSERT INTO {} ({}) SELECT {} FROM {} AS t".format(
+		temp, ','.join(fields), ','.join(_migrated_values(db, table)), table))
+	db.query("DROP TABLE {}".format(table))
+	db.query("ALTER TABLE {} RENAME TO {}".format(temp, table))
+
+	for name, (index_table, columns, unique) in DB_INDEXES.items():
+		if index_table == table:
+			db.query("CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+				'UNIQUE ' if unique else '', name, table, ','.join(columns)))
+
+def migrate_interactions(db):
+	"""Convert interactions of older versions to numbers and index their contacts
+
+	Tables of an older schema are rebuilt with the current one: "pose
+	index:site" binding sites become binding_site ids, flags become 0/1,
+	"index [type]" atoms are split into the atom index and type columns
+	and numbers stored as text are converted. pose_residue_contact is
+	rebuilt. Returns the number of contacts.
+	"""
+	db.begin()
+
+	try:
+		for table in INTERACTION_TABLES:
+			if _is_legacy(db, table):
+				_rebuild_table(db, table)
+
+		db.clear_table('pose_residue_contact')
+		count = index_contacts(db)
+	except:
+		db.rollback()
+		raise
+
+	db.commit()
+	return count
+
+def poses_with_contact(db, residue, kind=None, max_distance=None, active_only=False, limit=None):
+	"""Return (pose id, energy, distance) of poses in contact with residue, best energy first
+
+	residue is "A:ASP:189", kind one of backend.INTERACTION_TABLES, e.g.
+	poses_with_contact(db, "A:ASP:189", 'hydrogen_bond', 2.5). A pose with
+	several such contacts is returned once with its shortest distance.
+	"""
+	conditions = ["r.chain=? AND r.number=? AND r.amino_acid=?"]
+	paras = list(parse_residue(residue))
+
+	if kind is not None:
+		conditions.append("c.kind=?")
+		paras.append(INTERACTION_KINDS[kind])
+
+	if max_distance is not None:
+		conditions.append("c.distance<=?")
+		paras.append(max_distance)
+
+	if active_only:
+		conditions.append("c.active_site=1")
+
+	sql = ("SELECT p.id, p.energy, MIN(c.distance) FROM residue AS r "
+		"JOIN pose_residue_contact AS c ON c.resid=r.id "
+		"JOIN pose AS p ON p.id=c.pid "
+		"WHERE {} GROUP BY p.id ORDER BY p.energy IS NULL, p.energy, p.id".format(' AND '.join(conditions)))
+
+	if limit:
+		sql += " LIMIT {:d}".format(limit)
+
+	return list(db.query(sql, paras))
+
+def contact_frequency(db, kind=None, best_only=False):
+	"""Return (residue, kind, poses, mean distance) rows, most contacted residues first
+
+	residue is formatted as "A:ASP:189" and kind is the interaction table.
+	"""
+	conditions = []
+	paras = []
+
+	if kind is not None:
+		conditions.append("c.kind=?")
+		paras.append(INTERACTION_KINDS[kind])
+
+	if best_only:
+		conditions.append("c.pid IN (SELECT pid FROM best)")
+
+	where = " WHERE " + " AND ".join(conditions) if conditions else ""
+	sql = ("SELECT r.chain||':'||r.amino_acid||':'||r.number, c.kind, COUNT(DISTINCT c.pid), AVG(c.distance) "
+		"FROM pose_residue_contact AS c JOIN residue AS r ON r.id=c.resid{} "
+		"GROUP BY c.resid, c.kind ORDER BY 3 DESC, 1".format(where))
+
+	return [(residue, INTERACTION_TABLES[kind - 1], poses, distance)
+		for residue, kind, poses, distance in db.query(sql, paras)]
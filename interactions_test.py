@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Interaction Storage Test for PandaDOCK
+Verifies interactions are stored as numbers and queried through residue contacts
+"""
+
+from backend import DataBackend
+from interactions import save_interactions, migrate_interactions, poses_with_contact, contact_frequency
+
+
+def hbond(bid, residue, distance, active=0):
+    chain, amino_acid, number = residue.split(":")
+    return [None, bid, chain, int(number), amino_acid, distance, 3.1, 150.0, 1, 0, 12, "O3", 40, "Nam", active]
+
+
+def hydrophobic(bid, residue, distance):
+    chain, amino_acid, number = residue.split(":")
+    return [None, bid, chain, int(number), amino_acid, distance, 7, 300, 0]
+
+
+def pose_db():
+    db = DataBackend()
+    db.connect()
+    db.insert_rows("INSERT INTO pose (id, jid, run, energy) VALUES (?,?,?,?)",
+                   [(1, 1, 1, -7.5), (2, 1, 2, -9.0), (3, 2, 1, -8.2)])
+    interactions = {
+        "binding_site": [[None, 0, "LIG:L:1"], [None, 1, "LIG:L:1"], [None, 2, "LIG:L:1"]],
+        "hydrogen_bond": [
+            hbond(0, "A:ASP:189", 2.1, 1),
+            hbond(1, "A:ASP:189", 2.9, 1),
+            hbond(1, "A:SER:190", 2.2),
+            hbond(2, "A:ASP:189", 2.4, 1),
+            hbond(2, "A:ASP:189", 1.9, 1),
+        ],
+        "hydrophobic_interaction": [hydrophobic(0, "A:ASP:189", 3.6)],
+    }
+    assert save_interactions(db, [1, 2, 3], interactions) == 6
+    return db
+
+
+def test_values_are_numbers():
+    """Distances, flags and atom indexes are stored with numeric types"""
+    db = pose_db()
+    row = db.get_row("SELECT typeof(distance_ha), typeof(protein_donor), typeof(donor_atom), donor_type, "
+                     "typeof(bid) FROM hydrogen_bond LIMIT 1")
+    assert row == ("real", "integer", "integer", "O3", "integer")
+    assert db.get_column("SELECT pid FROM binding_site ORDER BY id") == [1, 2, 3]
+    assert db.get_one("SELECT COUNT(1) FROM residue") == 2
+    db.close()
+
+
+def test_poses_with_contact():
+    """Poses are found by residue, interaction and distance, best energy first"""
+    db = pose_db()
+    assert poses_with_contact(db, "A:ASP:189", "hydrogen_bond", 2.5) == [(3, -8.2, 1.9), (1, -7.5, 2.1)]
+    assert [row[0] for row in poses_with_contact(db, "A:ASP:189")] == [2, 3, 1]
+    assert poses_with_contact(db, "A:SER:190", active_only=True) == []
+    assert poses_with_contact(db, "B:ASP:189") == []
+
+    plan = " ".join(row[-1] for row in db.query(
+        "EXPLAIN QUERY PLAN SELECT pid FROM pose_residue_contact WHERE resid=1 AND kind=1 AND distance<2.5"))
+    assert "contact_residue" in plan
+    db.close()
+
+
+def test_contact_frequency():
+    """Contacts are counted per residue and interaction in SQL"""
+    db = pose_db()
+    rows = contact_frequency(db)
+    assert rows[0][:3] == ("A:ASP:189", "hydrogen_bond", 3)
+    assert abs(rows[0][3] - (2.1 + 2.9 + 2.4 + 1.9) / 4) < 1e-9
+    assert ("A:SER:190", "hydrogen_bond", 1, 2.2) in rows
+    assert contact_frequency(db, "hydrophobic_interaction") == [("A:ASP:189", "hydrophobic_interaction", 1, 3.6)]
+    db.close()
+
+
+def test_migrate_text_interactions():
+    """Interaction tables of older versions are rebuilt with numbers and binding site ids"""
+    db = DataBackend()
+    db.connect()
+    db.query("DROP TABLE hydrogen_bond")
+    db.query("CREATE TABLE hydrogen_bond (id INTEGER PRIMARY KEY, bid INTEGER, chain TEXT, residue INTEGER, "
+             "amino_acid TEXT, distance_ha REAL, distance_da REAL, donor_angle REAL, protein_donor TEXT, "
+             "side_chain TEXT, donor_atom TEXT, acceptor_atom TEXT, active_site INTEGER)")
+    db.query("INSERT INTO pose (id, jid, run, energy) VALUES (1, 1, 1, -6.0)")
+    db.query("INSERT INTO binding_site (id, pid, site) VALUES (5, 1, 'LIG:L:1')")
+    db.query("INSERT INTO hydrogen_bond (bid, chain, residue, amino_acid, distance_ha, protein_donor, "
+             "side_chain, donor_atom, acceptor_atom, active_site) VALUES ('1:LIG:L:1', 'A', 189, 'ASP', '2.1', "
+             "'1', 'No', '12 [O3]', '40', 1)")
+
+    assert migrate_interactions(db) == 1
+    assert db.get_row("SELECT bid, distance_ha, protein_donor, side_chain, donor_atom, donor_type, acceptor_atom, "
+                      "acceptor_type FROM hydrogen_bond") == (5, 2.1, 1, 0, 12, "O3", 40, None)
+    assert db.get_row("SELECT typeof(bid), typeof(protein_donor), typeof(acceptor_atom) FROM hydrogen_bond") == (
+        "integer", "integer", "integer")
+    assert "hydrogen_bond_bid" in db.get_set("SELECT name FROM sqlite_master WHERE type='index'")
+    assert poses_with_contact(db, "A:ASP:189", "hydrogen_bond", 2.5) == [(1, -6.0, 2.1)]
+    assert migrate_interactions(db) == 1
+    db.close()
+
+if __name__ == "__main__":
+    test_values_are_numbers()
+    test_poses_with_contact()
+    test_contact_frequency()
+    test_migrate_text_interactions()
+    print("✓ All interaction storage tests passed!")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Job Control Test for PandaDOCK
+Verifies pausing, throttling, cancelling and reordering docking jobs
+"""
+
+import os
+import sys
+import signal
+import tempfile
+from concurrent.futures import Future
+
+import pytest
+
+from scheduler import DockingJob, DockingScheduler, SubprocessScheduler
+from jobstore import JobStore, JOB_CANCELLED
+from ligprep import LigandPreparation
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+    def terminate(self, job):
+        pass
+
+
+class SleepScheduler(SubprocessScheduler):
+    program = sys.executable
+
+
+def sleep_job(output_directory, name):
+    return DockingJob(name + ".sdf", os.path.join(output_directory, name), ["-c", "import time; time.sleep(30)"])
+
+
+def test_move_to_front_survives_reordering():
+    """Prioritized ligands start next even after the queue is reordered"""
+    scheduler = RecordingScheduler(max_workers=1)
+    scheduler.submit_many(scheduler.create_job([], "{}.sdf".format(n), "rec.pdb", "out") for n in "abcd")
+    scheduler.move_to_front([scheduler.pending[2], scheduler.pending[3]])
+    scheduler.order_pending()
+    assert [job.name for job in scheduler.pending] == ["c", "d", "a", "b"]
+
+
+def test_cancel_queued_job_is_recorded():
+    """A cancelled ligand is never started and is not resumed"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        scheduler.submit_many(scheduler.create_job([], "{}.sdf".format(n), "rec.pdb", output_directory) for n in "ab")
+        job = scheduler.pending[1]
+        scheduler.cancel(job)
+
+        assert job.state == "cancelled"
+        assert store.db.get_one("SELECT status FROM jobs WHERE id=?", (job.id,)) == JOB_CANCELLED
+        store.close()
+
+
+def test_cancel_stops_ligand_preparation():
+    """Ligands prepared after a cancel are not docked and the queue completes once"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        completions = []
+        scheduler.on_complete = lambda: completions.append(True)
+        ligands = ["{}.sdf".format(n) for n in "abc"]
+        preparation = LigandPreparation(ligands, os.path.join(output_directory, "Prepared"), job_ids=store.add_preparing(ligands))
+        preparation.store = store
+        # b and c are still being prepared
+        preparation.futures = {Future(): ("b.sdf", "b.sdf"), Future(): ("c.sdf", "c.sdf")}
+        create_job = lambda path: scheduler.create_job([], path, "rec.pdb", output_directory)
+
+        scheduler.open_feed()
+        scheduler.start()
+        preparation.ready = [{"ligand": "a.sdf", "prepared": "a.sdf", "status": "ok"}]
+        assert preparation.feed(scheduler, create_job)
+        scheduler.cancel()
+        scheduler.job_finished(scheduler.running[0], -1)
+        assert completions == [True]
+
+        preparation.ready = [{"ligand": "b.sdf", "prepared": "b.sdf", "status": "ok"}]
+        assert not preparation.feed(scheduler, create_job)
+        scheduler.submit(create_job("c.sdf"))
+        scheduler.close_feed()
+        assert not scheduler.pending and not scheduler.running
+        assert completions == [True]
+        assert store.db.get_column("SELECT status FROM jobs ORDER BY id") == [JOB_CANCELLED] * 3
+        store.close()
+
+
+def test_cancel_screen_keeps_the_campaign():
+    """A cancelled screen removes only its own files from the campaign folder"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        job = scheduler.create_screening_job([], "Ligand", "rec.pdb", output_directory)
+        scheduler.submit(job)
+        scheduler.start()
+
+        with open(os.path.join(output_directory, "results.csv"), "w") as fw:
+            fw.write("partial")
+        scheduler.cancel()
+        scheduler.job_finished(job, -1)
+
+        assert job.state == "cancelled"
+        assert not os.path.exists(os.path.join(output_directory, "results.csv"))
+        assert store.db.get_one("SELECT status FROM jobs WHERE id=?", (job.id,)) == JOB_CANCELLED
+        store.close()
+        assert os.path.exists(os.path.join(output_directory, "pandadock.db"))
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGSTOP"), reason="needs SIGSTOP")
+def test_pause_throttle_and_cancel_processes():
+    """Lowering the worker count stops jobs instead of killing them"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        scheduler = SleepScheduler(max_workers=2)
+        scheduler.submit_many(sleep_job(output_directory, n) for n in ("a", "b", "c"))
+        scheduler.start()
+        first, second = scheduler.running
+
+        scheduler.set_max_workers(1)
+        assert second.state == "throttled"
+        assert first.state == "running"
+
+        assert scheduler.pause()
+        assert first.state == "paused"
+        scheduler.resume()
+        assert first.state == "running"
+
+        scheduler.cancel(first)
+        first.process.wait()
+        scheduler.poll()
+        assert first.state == "cancelled"
+        assert not os.path.exists(first.output)
+        assert second.state == "running"
+
+        scheduler.cancel()
+        while scheduler.running:
+            for job in scheduler.running:
+                job.process.wait()
+            scheduler.poll()
+        assert scheduler.idle()
+        assert [job.state for job in scheduler.completed] == ["cancelled"] * 3
+
+
+if __name__ == "__main__":
+    test_move_to_front_survives_reordering()
+    test_cancel_queued_job_is_recorded()
+    test_cancel_stops_ligand_preparation()
+    test_cancel_screen_keeps_the_campaign()
+    test_pause_throttle_and_cancel_processes()
+    print("✓ All job control tests passed!")
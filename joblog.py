@@ -0,0 +1,144 @@
+import os
+from collections import deque
+
+__all__ = ['JobLog', 'LogHub', 'JOB_LOG_NAME']
+
+#full output of a docking job, next to its results
+JOB_LOG_NAME = 'pandadock.log'
+
+class JobLog:
+	"""Bounded in-memory tail of one job output with the full log on disk"""
+
+	def __init__(self, name, log_file=None, line_cap=2000):
+		self.name = name
+		self.file = log_file
+		self.lines = deque(maxlen=line_cap)
+		self.partial = ''
+		self.fh = open(log_file, 'a', encoding='utf-8') if log_file else None
+
+	def write(self, text):
+		"""Add raw process output, returns the completed lines"""
+		if self.fh:
+			self.fh.write(text)
+
+		text = self.partial + text
+		lines = text.splitlines()
+
+		if text and not text.endswith(('\n', '\r')):
+			self.partial = lines.pop()
+		else:
+			self.partial = ''
+
+		self.lines.extend(lines)
+		return lines
+
+	def tail(self, count=200):
+		#a closed log has released its buffer, read the end of the file
+		if self.fh is None and self.file and os.path.exists(self.file):
+			with open(self.file, encoding='utf-8', errors='replace') as fh:
+				return [line.rstrip('\n') for line in deque(fh, maxlen=count)]
+
+		lines = list(self.lines)
+
+		if self.partial:
+			lines.append(self.partial)
+
+		return lines[-count:]
+
+	def read(self):
+		"""Return the full log from disk, or the in-memory tail"""
+		if self.fh:
+			self.fh.flush()
+
+		if self.file and os.path.exists(self.file):
+			with open(self.file, encoding='utf-8', errors='replace') as fh:
+				return fh.read()
+
+		return '\n'.join(self.tail(len(self.lines) + 1))
+
+	def close(self):
+		if self.partial:
+			self.lines.append(self.partial)
+			self.partial = ''
+
+		if self.fh:
+			self.fh.close()
+			self.fh = None
+			self.lines.clear()
+
+class LogHub:
+	"""Collect output of concurrent jobs and hand it to the GUI in batches
+
+	Each running job keeps a ring buffer of line_cap lines and spills its
+	full output to disk, the buffer is released once the job is closed.
+	Only the closed_cap most recently closed logs are kept, running ones
+	are never dropped. Lines waiting for the next GUI flush are capped at
+	pending_cap, older ones are dropped and reported as skipped.
+	"""
+
+	def __init__(self, line_cap=2000, pending_cap=500, closed_cap=50):
+		self.line_cap = line_cap
+		self.closed_cap = closed_cap
+		self.logs = {}
+		#keys of closed logs, oldest first
+		self.closed = {}
+		self.pending = deque(maxlen=pending_cap)
+		self.skipped = 0
+
+	def open(self, key, name, log_file=None):
+		self.close(key)
+		self.closed.pop(key, None)
+		self.logs[key] = JobLog(name, log_file, self.line_cap)
+		return self.logs[key]
+
+	def write(self, key, text):
+		"""Add output of a job, returns its completed lines"""
+		log = self.logs.get(key)
+
+		#output read after the log was dropped is only in the log file
+		if log is None:
+			return []
+
+		lines = log.write(text)
+		overflow = len(self.pending) + len(lines) - self.pending.maxlen
+
+		if overflow > 0:
+			self.skipped += overflow
+
+		self.pending.extend("[{}] {}".format(log.name, line) for line in lines)
+		return lines
+
+	def close(self, key):
+		if key not in self.logs or key in self.closed:
+			return
+
+		self.logs[key].close()
+		self.closed[key] = None
+
+		while len(self.closed) > self.closed_cap:
+			oldest = next(iter(self.closed))
+			del self.closed[oldest]
+			del self.logs[oldest]
+
+	def drain(self):
+		"""Return the text gathered since the last call, or None"""
+		if not self.pending and not self.skipped:
+			return None
+
+		lines = list(self.pending)
+		self.pending.clear()
+
+		if self.skipped:
+			lines.insert(0, "... {} lines skipped, see the job logs ...".format(self.skipped))
+			self.skipped = 0
+
+		return '\n'.join(lines)
+
+	def names(self):
+		return [(key, log.name) for key, log in self.logs.items()]
+
+	def tail(self, key, count=200):
+		if key not in self.logs:
+			return []
+
+		return self.logs[key].tail(count)
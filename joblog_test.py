@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Job Log Test for PandaDOCK
+Verifies bounded per-job buffers, spill to disk and batched draining
+"""
+
+import os
+import tempfile
+
+from joblog import LogHub
+
+
+def test_ring_buffer_and_spill():
+    """Only the last lines stay in memory, the full log is on disk"""
+    with tempfile.TemporaryDirectory() as output:
+        log_file = os.path.join(output, "pandadock.log")
+        hub = LogHub(line_cap=10)
+        hub.open(output, "lig", log_file)
+
+        for i in range(100):
+            hub.write(output, "pose {}\n".format(i))
+        hub.write(output, "partial ")
+        hub.write(output, "line")
+
+        tail = hub.tail(output, 5)
+        assert tail == ["pose 96", "pose 97", "pose 98", "pose 99", "partial line"]
+        assert len(hub.logs[output].lines) == 10
+
+        hub.close(output)
+        assert not hub.logs[output].lines
+        assert hub.tail(output, 2) == ["pose 99", "partial line"]
+        with open(log_file) as fh:
+            assert len(fh.read().splitlines()) == 101
+
+
+def test_drain_is_coalesced_and_bounded():
+    """Pending lines are prefixed with the job and capped between flushes"""
+    hub = LogHub(pending_cap=3)
+    hub.open("a", "lig_a")
+    hub.open("b", "lig_b")
+    hub.write("a", "one\ntwo\n")
+    hub.write("b", "three\n")
+    assert hub.drain() == "[lig_a] one\n[lig_a] two\n[lig_b] three"
+    assert hub.drain() is None
+
+    hub.write("a", "".join("{}\n".format(i) for i in range(5)))
+    text = hub.drain().splitlines()
+    assert text[0].startswith("... 2 lines skipped")
+    assert text[1:] == ["[lig_a] 2", "[lig_a] 3", "[lig_a] 4"]
+
+
+def test_closed_logs_are_capped():
+    """Only the last closed logs are kept, running ones stay listed"""
+    hub = LogHub(closed_cap=2)
+    hub.open("running", "lig_running")
+    for n in range(5):
+        hub.open(n, "lig_{}".format(n))
+        hub.write(n, "done\n")
+        hub.close(n)
+
+    assert hub.names() == [("running", "lig_running"), (3, "lig_3"), (4, "lig_4")]
+    assert hub.tail(0) == []
+    assert hub.write(0, "late\n") == []
+
+    # a reopened log is running again and outlives the closed ones
+    hub.open(3, "lig_3")
+    hub.close("running")
+    hub.open(5, "lig_5")
+    hub.close(5)
+    assert [key for key, _ in hub.names()] == ["running", 3, 5]
+
+
+if __name__ == "__main__":
+    test_ring_buffer_and_spill()
+    test_drain_is_coalesced_and_bounded()
+    test_closed_logs_are_capped()
+    print("✓ All job log tests passed!")
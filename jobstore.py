@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import shutil
+
+import apsw
+
+from backend import DataBackend
+from sharding import read_shard_records
+
+__all__ = ['JobStore', 'find_resumable_campaign', 'is_output_complete',
+	'JOB_QUEUED', 'JOB_RUNNING', 'JOB_DONE', 'JOB_FAILED', 'JOB_CANCELLED', 'JOB_PREPARING'
+]
+
+JOB_QUEUED = 0
+JOB_RUNNING = 1
+JOB_DONE = 2
+JOB_FAILED = 3
+JOB_CANCELLED = 4
+
+#queued for ligprep.LigandPreparation, ligand is the unprepared file
+JOB_PREPARING = 5
+
+JOB_DB_NAME = 'pandadock.db'
+
+#molecular.type of receptors and docked ligands
+MOLECULE_RECEPTOR = 1
+MOLECULE_LIGAND = 2
+
+#written into a job output directory after pandadock exits cleanly
+COMPLETE_MARKER = '.pandadock_done'
+
+def is_output_complete(job_output):
+	return os.path.exists(os.path.join(job_output, COMPLETE_MARKER))
+
+def mark_output_complete(job_output):
+	with open(os.path.join(job_output, COMPLETE_MARKER), 'w') as fw:
+		fw.write(str(int(time.time())))
+
+def find_resumable_campaign(main_directory):
+	"""Return the newest output directory that still has unfinished jobs"""
+	if not main_directory or not os.path.isdir(main_directory):
+		return None
+
+	campaigns = []
+	for entry in os.scandir(main_directory):
+		db_file = os.path.join(entry.path, JOB_DB_NAME)
+
+		if entry.is_dir() and entry.name.startswith('output') and os.path.exists(db_file):
+			#recent writes are in the WAL file until a checkpoint
+			wal_file = db_file + '-wal'
+			mtime = max(os.path.getmtime(f) for f in (db_file, wal_file) if os.path.exists(f))
+			campaigns.append((mtime, entry.path))
+
+	#only the campaign that is resumed gets opened for writing
+	for _, output_directory in sorted(campaigns, reverse=True):
+		store = JobStore(output_directory, readonly=True)
+
+		try:
+			if store.unfinished():
+				return output_directory
+
+		#a campaign without a jobs table has nothing to resume
+		except apsw.SQLError:
+			continue
+		finally:
+			store.close()
+
+	return None
+
+class JobStore:
+	"""Persist a docking queue in the jobs table of output_N/pandadock.db
+
+	Every job is inserted before it is started and its status is updated
+	as it runs, so an interrupted campaign can be resumed after a crash.
+	A readonly store only reads an earlier campaign, its file is not
+	upgraded or switched to WAL.
+	"""
+
+	def __init__(self, output_directory, readonly=False):
+		self.output_directory = output_directory
+		self.db = DataBackend()
+
+		if readonly:
+			self.db.open_snapshot(os.path.join(output_directory, JOB_DB_NAME))
+			return
+
+		#the scheduler updates jobs while poses are ingested in another thread
+		self.db.connect(os.path.join(output_directory, JOB_DB_NAME), pool=True)
+
+		#status updates must survive a crash or a reboot
+		self.db.pragma('synchronous', 'FULL')
+
+	def close(self):
+		self.db.close()
+
+	def save_campaign(self, args, protein_file, center=None, shards=None):
+		with self.db.options:
+			self.db.set_option('args', json.dumps(list(args)))
+			self.db.set_option('protein', protein_file)
+			self.db.set_option('center', json.dumps(list(center) if center else None))
+			self.db.set_option('shards', json.dumps(shards))
+
+	def load_shards(self):
+		"""Return the number of --screen shards, None for a per-ligand campaign"""
+		return json.loads(self.db.get_option('shards') or 'null')
+
+	def save_preparation(self, prepared_folder, ph, outformat):
+		self.db.set_option('preparation', json.dumps([prepared_folder, ph, outformat]))
+
+	def load_preparation(self):
+		"""Return (prepared folder, ph, output format) or None without preparation"""
+		preparation = json.loads(self.db.get_option('preparation') or 'null')
+		return tuple(preparation) if preparation else None
+
+	def load_campaign(self):
+		center = json.loads(self.db.get_option('center') or 'null')
+		return (
+			json.loads(self.db.get_option('args') or '[]'),
+			self.db.get_option('protein'),
+			tuple(center) if center else None
+		)
+
+	def add_preparing(self, ligands):
+		"""Insert a jobs row for every ligand queued for preparation
+
+		Returns {ligand: job id}, the row becomes the docking job of the
+		prepared ligand, see add_many.
+		"""
+		ids = {}
+		self.db.begin()
+		for ligand in ligands:
+			self.db.query("INSERT INTO jobs (status, progress, ligand) VALUES (?,?,?)",
+				(JOB_PREPARING, 0, ligand))
+			ids[ligand] = self.db.conn.last_insert_rowid()
+		self.db.commit()
+		return ids
+
+	def preparation_failed(self, jid, message):
+		self.db.query("UPDATE jobs SET status=?, finished=?, message=? WHERE id=?",
+			(JOB_FAILED, int(time.time()), "preparation failed: {}".format(message), jid))
+
+	def cancel_preparing(self):
+		self.db.query("UPDATE jobs SET status=?, finished=?, message=? WHERE status=?",
+			(JOB_CANCELLED, int(time.time()), "cancelled", JOB_PREPARING))
+
+	def unprepared(self):
+		"""Return {ligand: job id} of the ligands that were never prepared"""
+		return dict(self.db.query("SELECT ligand, id FROM jobs WHERE status=? ORDER BY id", (JOB_PREPARING,)))
+
+	def add_many(self, jobs):
+		self.db.begin()
+		for job in jobs:
+			lid = None
+
+			#descriptors feed the cost model, see costmodel.CostModel
+			if job.descriptors:
+				name, ext = os.path.splitext(os.path.basename(job.ligand))
+				self.db.query("INSERT INTO molecular (name, type, format, atoms, hvyatoms, rotors) VALUES (?,?,?,?,?,?)",
+					(name, MOLECULE_LIGAND, ext.lstrip('.').lower(), job.descriptors['atoms'],
+					job.descriptors['hvyatoms'], job.descriptors['rotors']))
+				lid = self.db.conn.last_insert_rowid()
+
+			#a prepared ligand takes over the row it got when queued for preparation
+			if job.id is not None:
+				self.db.query("UPDATE jobs SET lid=?, status=?, progress=0, ligand=?, output=? WHERE id=?",
+					(lid, JOB_QUEUED, job.ligand, job.output, job.id))
+				continue
+
+			self.db.query("INSERT INTO jobs (lid, status, progress, ligand, output) VALUES (?,?,?,?,?)",
+				(lid, JOB_QUEUED, 0, job.ligand, job.output))
+			job.id = self.db.conn.last_insert_rowid()
+		self.db.commit()
+
+	def add(self, job):
+		self.add_many([job])
+
+	def job_started(self, job):
+		self.db.query("UPDATE jobs SET status=?, started=?, finished=NULL, message=NULL WHERE id=?",
+			(JOB_RUNNING, int(job.started), job.id))
+
+	def job_progress(self, job):
+		self.db.query("UPDATE jobs SET progress=? WHERE id=?", (job.progress, job.id))
+
+	def job_finished(self, job):
+		if job.cancelled:
+			status = JOB_CANCELLED
+			message = "cancelled"
+		elif job.succeeded:
+			mark_output_complete(job.output)
+			status = JOB_DONE
+			message = None
+		else:
+			status = JOB_FAILED
+			message = "exit code {}".format(job.exit_code)
+
+		self.db.query("UPDATE jobs SET status=?, progress=?, finished=?, message=? WHERE id=?",
+			(status, 1 if job.succeeded else None, int(job.finished), message, job.id))
+
+	def observations(self):
+		"""Descriptors and wall time in seconds of successfully docked ligands"""
+		sql = (
+			"SELECT m.rotors, m.hvyatoms, m.atoms, j.finished-j.started FROM jobs AS j "
+			"JOIN molecular AS m ON m.id=j.lid WHERE j.status=? AND j.finished>j.started"
+		)
+		return [tuple(row) for row in self.db.query(sql, (JOB_DONE,))]
+
+	def unfinished(self):
+		sql = "SELECT COUNT(1) FROM jobs WHERE status IN (?,?,?)"
+		return self.db.get_one(sql, (JOB_QUEUED, JOB_RUNNING, JOB_PREPARING))
+
+	def resume(self, scheduler):
+		"""Requeue interrupted jobs into scheduler, skipping complete ones
+
+		Jobs that were running when the campaign was interrupted lose
+		their partial output and start over, a screen keeps the campaign
+		folder holding this database. Ligands still waiting for
+		preparation are left to the caller, see unprepared(). Returns the
+		number of requeued jobs.
+		"""
+		args, protein_file, center = self.load_campaign()
+		sql = (
+			"SELECT j.id, j.status, j.ligand, j.output, m.rotors, m.hvyatoms, m.atoms "
+			"FROM jobs AS j LEFT JOIN molecular AS m ON m.id=j.lid ORDER BY j.id"
+		)
+		rows = list(self.db.query(sql))
+		jobs = []
+
+		for jid, status, ligand, output, rotors, hvyatoms, atoms in rows:
+			if status == JOB_DONE and is_output_complete(output):
+				continue
+
+			if status in (JOB_FAILED, JOB_CANCELLED, JOB_PREPARING):
+				continue
+
+			#a screen writes into the campaign folder itself, next to this database
+			screen = os.path.abspath(output) == os.path.abspath(self.output_directory)
+
+			if os.path.exists(output) and not screen:
+				shutil.rmtree(output)
+
+			if screen:
+				job = scheduler.create_screening_job(args, ligand, protein_file, output, center)
+
+			#a shard screens its ligands folder, see sharding.create_shard_jobs
+			elif os.path.isdir(ligand):
+				job = scheduler.create_screening_job(args, ligand, protein_file, output, center)
+				job.name = os.path.basename(os.path.dirname(ligand))
+				job.records = read_shard_records(ligand)
+			else:
+				job = scheduler.create_job(args, ligand, protein_file, self.output_directory, center)
+
+			job.id = jid
+
+			if rotors is not None:
+				job.descriptors = {'rotors': rotors, 'hvyatoms': hvyatoms, 'atoms': atoms}
+
+			self.db.query("UPDATE jobs SET status=?, started=NULL, progress=0 WHERE id=?",
+				(JOB_QUEUED, jid))
+			jobs.append(job)
+
+		scheduler.pending.extend(jobs)
+		scheduler.order_pending()
+		return len(jobs)
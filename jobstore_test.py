@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Job Store Test for PandaDOCK
+Verifies that an interrupted docking queue can be resumed from the jobs table
+"""
+
+import os
+import tempfile
+
+import apsw
+
+from costmodel import CostModel
+from jobstore import JobStore, find_resumable_campaign, JOB_DONE, JOB_RUNNING, JOB_QUEUED, JOB_FAILED, JOB_PREPARING
+from ligprep import LigandPreparation
+from scheduler import DockingScheduler
+from sharding import create_shard_jobs, list_shard_outputs
+
+# indexes of the test libraries are not kept in the user index directory
+INDEX_DIRECTORY = tempfile.TemporaryDirectory()
+os.environ["PANDADOCK_INDEX_DIR"] = INDEX_DIRECTORY.name
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def test_resume_after_crash():
+    """Finished ligands are skipped and interrupted ones are requeued"""
+    with tempfile.TemporaryDirectory() as session:
+        output_directory = os.path.join(session, "output")
+        os.makedirs(output_directory)
+
+        store = JobStore(output_directory)
+        store.save_campaign(["--mode", "fast"], "rec.pdb", (1.0, 2.0, 3.0))
+        scheduler = RecordingScheduler(max_workers=2, store=store)
+        scheduler.submit_many(
+            scheduler.create_job(["--mode", "fast"], "lig{}.sdf".format(i), "rec.pdb", output_directory, (1.0, 2.0, 3.0))
+            for i in range(5)
+        )
+        scheduler.start()
+        scheduler.job_finished(scheduler.running[0], 0)
+
+        statuses = store.db.get_column("SELECT status FROM jobs ORDER BY id")
+        assert statuses.count(JOB_DONE) == 1
+        assert statuses.count(JOB_RUNNING) == 2
+
+        # simulate a crash: the scheduler and its processes are gone
+        store.close()
+        assert find_resumable_campaign(session) == output_directory
+
+        store = JobStore(output_directory)
+        resumed = RecordingScheduler(max_workers=2, store=store)
+        assert store.resume(resumed) == 4
+        assert "lig0" not in [job.name for job in resumed.pending]
+        assert resumed.pending[0].arguments[:2] == ["--mode", "fast"]
+
+        resumed.start()
+        while resumed.running:
+            resumed.job_finished(resumed.running[0], 0)
+
+        assert store.unfinished() == 0
+        store.close()
+        assert find_resumable_campaign(session) is None
+
+
+def test_resume_ligands_waiting_for_preparation():
+    """Ligands queued for preparation have jobs rows and are prepared again on resume"""
+    with tempfile.TemporaryDirectory() as session:
+        output_directory = os.path.join(session, "output")
+        prepared_folder = os.path.join(session, "Prepared")
+        os.makedirs(output_directory)
+        ligands = [os.path.join(session, "lig{}.sdf".format(i)) for i in range(3)]
+
+        store = JobStore(output_directory)
+        store.save_campaign(["--mode", "fast"], "rec.pdb", None)
+        preparation = LigandPreparation(ligands, prepared_folder, ph=6.5)
+        preparation.store = store
+        store.save_preparation(prepared_folder, 6.5, "sdf")
+        preparation.job_ids = store.add_preparing(ligands)
+
+        # simulate a crash before any ligand was prepared
+        store.close()
+        assert find_resumable_campaign(session) == output_directory
+
+        store = JobStore(output_directory)
+        resumed = RecordingScheduler(max_workers=2, store=store)
+        assert store.resume(resumed) == 0
+        unprepared = store.unprepared()
+        assert list(unprepared) == ligands
+        assert store.load_preparation() == (prepared_folder, 6.5, "sdf")
+
+        #the prepared ligand takes over the row it got when queued
+        preparation = LigandPreparation(list(unprepared), prepared_folder, job_ids=unprepared)
+        preparation.store = store
+        preparation.ready = [{"ligand": ligands[0], "prepared": "p0.sdf", "status": "ok"},
+            {"ligand": ligands[1], "status": "failed", "error": "cannot read"}]
+        preparation.feed(resumed, lambda path: resumed.create_job([], path, "rec.pdb", output_directory))
+
+        rows = list(store.db.query("SELECT id, status, ligand FROM jobs ORDER BY id"))
+        assert [tuple(row) for row in rows] == [(unprepared[ligands[0]], JOB_QUEUED, "p0.sdf"),
+            (unprepared[ligands[1]], JOB_FAILED, ligands[1]), (unprepared[ligands[2]], JOB_PREPARING, ligands[2])]
+        assert resumed.pending[0].id == unprepared[ligands[0]]
+        store.close()
+
+
+def test_resume_sharded_screen():
+    """Shards are jobs rows, a resumed shard writes its library records again"""
+    with tempfile.TemporaryDirectory() as session:
+        output_directory = os.path.join(session, "output")
+        ligands = os.path.join(session, "Ligand")
+        os.makedirs(output_directory)
+        os.makedirs(ligands)
+        library = os.path.join(ligands, "library.sdf")
+        with open(library, "w") as fw:
+            fw.write("".join("lig{}\n\n\nM  END\n$$$$\n".format(i) for i in range(6)))
+
+        store = JobStore(output_directory)
+        store.save_campaign(["--mode", "fast"], "rec.pdb", None, 2)
+        scheduler = RecordingScheduler(max_workers=2, store=store)
+        scheduler.submit_many(create_shard_jobs(scheduler, ["--mode", "fast"], ligands, "rec.pdb", output_directory, None, 2))
+        assert store.db.get_one("SELECT COUNT(1) FROM jobs") == 2
+
+        # simulate a crash before the shards started
+        store.close()
+
+        store = JobStore(output_directory)
+        assert store.load_shards() == 2
+        resumed = RecordingScheduler(max_workers=2, store=store)
+        assert store.resume(resumed) == 2
+        assert sorted(job.name for job in resumed.pending) == ["shard_1", "shard_2"]
+        targets = [target for job in resumed.pending for _, _, _, target in job.records]
+        assert len(targets) == 6
+
+        resumed.start()
+        assert all(os.path.exists(target) for target in targets)
+        assert [shard.name for shard in list_shard_outputs(output_directory)] == ["shard_1", "shard_2"]
+        store.close()
+
+
+def test_resume_screen_keeps_the_campaign():
+    """A screen writes into the campaign folder, resuming it does not remove pandadock.db"""
+    with tempfile.TemporaryDirectory() as session:
+        output_directory = os.path.join(session, "output")
+        ligands = os.path.join(session, "Ligand")
+        os.makedirs(output_directory)
+        os.makedirs(ligands)
+
+        store = JobStore(output_directory)
+        store.save_campaign(["--mode", "fast"], "rec.pdb", None)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        scheduler.submit(scheduler.create_screening_job(["--mode", "fast"], ligands, "rec.pdb", output_directory))
+        scheduler.start()
+
+        # simulate a crash while screening
+        store.close()
+
+        assert find_resumable_campaign(session) == output_directory
+        store = JobStore(output_directory)
+        resumed = RecordingScheduler(max_workers=1, store=store)
+        assert store.resume(resumed) == 1
+        assert os.path.exists(os.path.join(output_directory, "pandadock.db"))
+        assert [job.name for job in resumed.pending] == ["Ligand"]
+        assert not resumed.pending[0].records
+        store.close()
+
+
+def test_old_campaigns_are_only_read():
+    """Looking for a campaign to resume or for timings does not upgrade older databases"""
+    with tempfile.TemporaryDirectory() as session:
+        output_directory = os.path.join(session, "output")
+        os.makedirs(output_directory)
+        db_file = os.path.join(output_directory, "pandadock.db")
+        conn = apsw.Connection(db_file)
+        conn.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY, status INTEGER, ligand TEXT, output TEXT)")
+        conn.execute("INSERT INTO jobs (status, ligand, output) VALUES (?,?,?)", (JOB_RUNNING, "lig.sdf", output_directory))
+        conn.close()
+
+        assert find_resumable_campaign(session) == output_directory
+        assert CostModel.from_history(session).weights is not None
+
+        conn = apsw.Connection(db_file)
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        assert tables == ["jobs"]
+        assert conn.execute("PRAGMA journal_mode").fetchall() == [("delete",)]
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_resume_after_crash()
+    test_resume_ligands_waiting_for_preparation()
+    test_resume_sharded_screen()
+    test_resume_screen_keeps_the_campaign()
+    test_old_campaigns_are_only_read()
+    print("✓ All job store tests passed!")
@@ -0,0 +1,307 @@
+import os
+import csv
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sharding import list_ligand_files
+
+__all__ = ['prepare_ligand', 'LigandPreparation', 'PREPARED_FOLDER', 'MANIFEST_NAME']
+
+#session folder of prepared ligands, shared by all docking runs
+PREPARED_FOLDER = 'Prepared'
+
+MANIFEST_NAME = 'manifest.csv'
+
+MANIFEST_COLUMNS = ['ligand', 'prepared', 'status', 'ph', 'outformat', 'atoms', 'hvyatoms', 'non_bonded', 'seconds', 'error']
+
+#tasks submitted per worker, a crashed worker fails only the tasks in flight
+TASKS_PER_WORKER = 2
+
+def prepare_ligand(infile, outfile, informat=None, outformat=None, ph=7.4):
+	"""Protonate for ph, add hydrogens and Gasteiger charges with Open Babel
+
+	The formats default to the file extensions. Returns the atom and
+	heavy atom counts and the number of atoms without a bond.
+	"""
+	from openbabel import openbabel
+
+	informat = informat or os.path.splitext(infile)[1].lstrip('.').lower()
+	outformat = outformat or os.path.splitext(outfile)[1].lstrip('.').lower()
+
+	obc = openbabel.OBConversion()
+	obc.SetInAndOutFormats(informat, outformat)
+	mol = openbabel.OBMol()
+
+	if not obc.ReadFile(mol, infile) or not mol.NumAtoms():
+		raise ValueError("cannot read {}".format(infile))
+
+	non_bond = 0
+	for atom in openbabel.OBMolAtomIter(mol):
+		if not any(True for _ in openbabel.OBAtomBondIter(atom)):
+			non_bond += 1
+
+	#correct for ph
+	mol.CorrectForPH(ph)
+
+	#add hydrogens
+	mol.AddHydrogens()
+
+	cmodel = openbabel.OBChargeModel.FindType('gasteiger')
+	cmodel.ComputeCharges(mol)
+
+	if outformat == 'pdbqt':
+		#set to be rigid
+		obc.AddOption('r')
+		obc.AddOption('x')
+		obc.AddOption('b')
+		obc.AddOption('p')
+
+	if not obc.WriteFile(mol, outfile):
+		raise ValueError("cannot write {}".format(outfile))
+
+	return {'atoms': mol.NumAtoms(), 'hvyatoms': mol.NumHvyAtoms(), 'non_bonded': non_bond}
+
+def _prepare_task(infile, outfile, ph, outformat):
+	#runs in a worker process, failures become manifest rows
+	start = time.time()
+	row = {'ligand': infile, 'prepared': outfile, 'status': 'ok', 'ph': ph, 'outformat': outformat, 'error': ''}
+
+	try:
+		row.update(prepare_ligand(infile, outfile, ph=ph))
+	except Exception as e:
+		row['status'] = 'failed'
+		row['error'] = str(e)
+
+		if os.path.exists(outfile):
+			os.remove(outfile)
+
+	row['seconds'] = round(time.time() - start, 3)
+	return row
+
+class LigandPreparation:
+	"""Prepare a ligand folder in a process pool
+
+	Prepared ligands are written to output_folder in outformat and every
+	ligand gets a row in the manifest with its atom counts or the error,
+	appended as soon as it is finished. poll() returns the rows finished
+	since the last call, so docking can start on the first ready ligands.
+	Ligands prepared by an earlier run for the same ph and outformat and
+	not modified since are taken from the manifest. Ligands with the same
+	name in different folders get numbered output files.
+
+	A worker that crashes breaks the pool, the ligands in flight get
+	failed rows and the remaining ones go to a new pool.
+
+	With a jobstore.JobStore passed to start() every ligand gets a jobs
+	row before it is prepared, so a resumed campaign still has the
+	ligands that were waiting. job_ids maps ligands to the rows they got
+	before, e.g. from JobStore.unprepared(). Next to a docking run pass
+	workers=scheduler.spare_cores(), the default uses every core.
+	"""
+
+	def __init__(self, ligands, output_folder, workers=None, outformat='sdf', ph=7.4, job_ids=None):
+		if isinstance(ligands, str):
+			ligands = list_ligand_files(ligands)
+
+		self.ligands = list(ligands)
+		self.output_folder = output_folder
+		self.workers = workers or os.cpu_count() or 1
+		self.outformat = outformat
+		self.ph = ph
+		self.manifest = os.path.join(output_folder, MANIFEST_NAME)
+		self.rows = []
+		self.ready = []
+		self.tasks = deque()
+		self.futures = {}
+		self.executor = None
+		self.manifest_fh = None
+		self.writer = None
+		self.job_ids = dict(job_ids or {})
+		self.store = None
+
+	def read_manifest(self):
+		if not os.path.exists(self.manifest):
+			return {}
+
+		with open(self.manifest, newline='') as fh:
+			return {row['ligand']: row for row in csv.DictReader(fh)}
+
+	def open_manifest(self, rows):
+		#rewritten once with the rows of earlier runs, new rows are appended
+		self.manifest_fh = open(self.manifest, 'w', newline='')
+		self.writer = csv.DictWriter(self.manifest_fh, fieldnames=MANIFEST_COLUMNS, restval='', extrasaction='ignore')
+		self.writer.writeheader()
+		self.writer.writerows(rows)
+		self.manifest_fh.flush()
+
+	def add_row(self, row):
+		self.rows.append(row)
+
+		if self.writer:
+			self.writer.writerow(row)
+			self.manifest_fh.flush()
+
+	def is_up_to_date(self, row):
+		prepared = row['prepared']
+
+		try:
+			same_ph = float(row.get('ph')) == float(self.ph)
+		except (TypeError, ValueError):
+			return False
+
+		return row['status'] == 'ok' and same_ph and row.get('outformat') == self.outformat \
+			and os.path.exists(prepared) and os.path.getmtime(prepared) >= os.path.getmtime(row['ligand'])
+
+	def output_file(self, ligand, taken):
+		name = os.path.splitext(os.path.basename(ligand))[0]
+		outfile = os.path.join(self.output_folder, "{}.{}".format(name, self.outformat))
+		n = 1
+
+		while outfile in taken:
+			n += 1
+			outfile = os.path.join(self.output_folder, "{}_{}.{}".format(name, n, self.outformat))
+
+		return outfile
+
+	def start(self, store=None):
+		os.makedirs(self.output_folder, exist_ok=True)
+
+		if store:
+			self.store = store
+			store.save_preparation(self.output_folder, self.ph, self.outformat)
+			self.job_ids.update(store.add_preparing([l for l in self.ligands if l not in self.job_ids]))
+		previous = self.read_manifest()
+		self.open_manifest(previous.values())
+		#prepared files of all ligands in the manifest, a ligand keeps its own
+		taken = {row['prepared'] for row in previous.values()}
+
+		for ligand in self.ligands:
+			row = previous.get(ligand)
+
+			if row and self.is_up_to_date(row):
+				self.rows.append(row)
+				self.ready.append(row)
+				continue
+
+			if row and os.path.splitext(row['prepared'])[1] == '.' + self.outformat:
+				outfile = row['prepared']
+			else:
+				outfile = self.output_file(ligand, taken)
+
+			taken.add(outfile)
+			self.tasks.append((ligand, outfile))
+
+		self.submit()
+
+	def submit(self):
+		#tasks are handed to the pool as it works through them
+		while self.tasks and len(self.futures) < self.workers * TASKS_PER_WORKER:
+			if self.executor is None:
+				self.executor = ProcessPoolExecutor(min(self.workers, len(self.tasks)))
+
+			ligand, outfile = self.tasks.popleft()
+			future = self.executor.submit(_prepare_task, ligand, outfile, self.ph, self.outformat)
+			self.futures[future] = (ligand, outfile)
+
+	@property
+	def done(self):
+		return not self.futures and not self.tasks and not self.ready
+
+	def poll(self, timeout=None):
+		"""Return the manifest rows finished since the last call
+
+		With a timeout, wait up to timeout seconds for the first one.
+		"""
+		if timeout and self.futures and not self.ready:
+			deadline = time.time() + timeout
+
+			while time.time() < deadline and not any(f.done() for f in self.futures):
+				time.sleep(0.05)
+
+		rows, self.ready = self.ready, []
+		broken = False
+
+		for future, (ligand, outfile) in list(self.futures.items()):
+			if not future.done():
+				continue
+
+			del self.futures[future]
+
+			try:
+				row = future.result()
+			except BrokenProcessPool as e:
+				broken = True
+				row = {'ligand': ligand, 'prepared': outfile, 'status': 'failed', 'ph': self.ph,
+					'outformat': self.outformat, 'error': "preparation process died: {}".format(e)}
+
+			self.add_row(row)
+			rows.append(row)
+
+		if broken:
+			self.executor.shutdown(wait=False)
+			self.executor = None
+
+		self.submit()
+
+		if not self.futures and not self.tasks:
+			self.close()
+
+		return rows
+
+	def feed(self, scheduler, create_job, timeout=None):
+		"""Submit jobs for the ligands ready since the last call
+
+		create_job receives the prepared ligand path. The scheduler feed
+		is closed once every ligand is prepared, returns False then. A
+		cancelled scheduler cancels the preparation.
+		"""
+		if scheduler.cancelled:
+			self.cancel()
+			return False
+
+		jobs = []
+
+		for row in self.poll(timeout):
+			jid = self.job_ids.get(row['ligand'])
+
+			if row['status'] == 'ok':
+				job = create_job(row['prepared'])
+				job.id = jid
+				jobs.append(job)
+			elif self.store and jid is not None:
+				self.store.preparation_failed(jid, row['error'])
+
+		scheduler.submit_many(jobs)
+
+		if self.done:
+			scheduler.close_feed()
+			return False
+
+		return True
+
+	def close(self):
+		if self.executor:
+			#the GUI thread must not wait for ligands being prepared
+			self.executor.shutdown(wait=False, cancel_futures=True)
+			self.executor = None
+
+		self.tasks.clear()
+		self.futures = {}
+
+		if self.manifest_fh:
+			self.manifest_fh.close()
+			self.manifest_fh = self.writer = None
+
+	def cancel(self):
+		"""Stop preparing, the jobs rows of ligands not prepared yet are cancelled"""
+		self.close()
+		self.ready = []
+
+		if self.store:
+			self.store.cancel_preparing()
+
+	@property
+	def failed(self):
+		return [row for row in self.rows if row['status'] != 'ok']
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Ligand Preparation Test for PandaDOCK
+Verifies the manifest and feeding the scheduler while ligands are prepared
+"""
+
+import os
+import csv
+import shutil
+import tempfile
+
+import ligprep
+from ligprep import LigandPreparation, MANIFEST_NAME
+from scheduler import DockingScheduler
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test")
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def test_failures_are_listed_in_manifest():
+    """A ligand that cannot be prepared is a manifest row, not an exception"""
+    with tempfile.TemporaryDirectory() as workdir:
+        broken = os.path.join(workdir, "broken.sdf")
+        with open(broken, "w") as fw:
+            fw.write("not a molecule\n")
+
+        preparation = LigandPreparation([broken], os.path.join(workdir, "Prepared"), workers=1)
+        preparation.start()
+        rows = []
+        while not preparation.done:
+            rows.extend(preparation.poll(timeout=5))
+
+        assert [row["status"] for row in rows] == ["failed"]
+        with open(os.path.join(workdir, "Prepared", MANIFEST_NAME)) as fh:
+            manifest = list(csv.DictReader(fh))
+        assert manifest[0]["ligand"] == broken
+        assert manifest[0]["error"]
+
+
+def test_prepared_ligands_feed_the_scheduler():
+    """Up to date ligands from an earlier run are docked without preparing again"""
+    with tempfile.TemporaryDirectory() as workdir:
+        prepared_folder = os.path.join(workdir, "Prepared")
+        os.makedirs(prepared_folder)
+        ligand = os.path.join(workdir, "Karanjin.sdf")
+        shutil.copy(os.path.join(TEST_DIR, "Karanjin.sdf"), ligand)
+        prepared = os.path.join(prepared_folder, "Karanjin.sdf")
+        shutil.copy(ligand, prepared)
+
+        with open(os.path.join(prepared_folder, MANIFEST_NAME), "w", newline="") as fw:
+            writer = csv.writer(fw)
+            writer.writerow(["ligand", "prepared", "status", "ph", "outformat", "atoms", "hvyatoms", "non_bonded", "seconds", "error"])
+            writer.writerow([ligand, prepared, "ok", 7.4, "sdf", 37, 22, 0, 0.1, ""])
+
+        scheduler = RecordingScheduler(max_workers=2)
+        preparation = LigandPreparation([ligand], prepared_folder)
+        preparation.start()
+        scheduler.open_feed()
+        scheduler.start()
+        assert not scheduler.idle()
+
+        create_job = lambda path: scheduler.create_job([], path, "rec.pdb", workdir)
+        assert not preparation.feed(scheduler, create_job)
+        assert [job.ligand for job in scheduler.running] == [prepared]
+
+        scheduler.job_finished(scheduler.running[0], 0)
+        assert scheduler.idle()
+
+
+def fake_prepare_task(infile, outfile, ph, outformat):
+    # stands in for Open Babel, a ligand named crash kills its worker
+    if "crash" in infile:
+        os._exit(1)
+    shutil.copy(infile, outfile)
+    return {"ligand": infile, "prepared": outfile, "status": "ok", "ph": ph, "outformat": outformat, "error": ""}
+
+
+def prepare_all(preparation):
+    if not preparation.manifest_fh:
+        preparation.start()
+    rows = []
+    while not preparation.done:
+        rows.extend(preparation.poll(timeout=5))
+    return {row["ligand"]: row for row in rows}
+
+
+def test_manifest_follows_ph_and_names():
+    """Rows are appended as ligands finish, same names get numbered files, another ph prepares again"""
+    prepare_task = ligprep._prepare_task
+    ligprep._prepare_task = fake_prepare_task
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            prepared_folder = os.path.join(workdir, "Prepared")
+            ligands = []
+            for folder in ("a", "b"):
+                os.makedirs(os.path.join(workdir, folder))
+                ligands.append(os.path.join(workdir, folder, "lig.sdf"))
+                with open(ligands[-1], "w") as fw:
+                    fw.write(folder)
+
+            rows = prepare_all(LigandPreparation(ligands, prepared_folder, workers=1))
+            assert sorted(os.path.basename(row["prepared"]) for row in rows.values()) == ["lig.sdf", "lig_2.sdf"]
+            with open(rows[ligands[1]]["prepared"]) as fh:
+                assert fh.read() == "b"
+
+            preparation = LigandPreparation(ligands, prepared_folder, workers=1)
+            preparation.start()
+            assert not preparation.tasks and not preparation.futures
+            preparation.close()
+
+            preparation = LigandPreparation(ligands, prepared_folder, workers=1, ph=6.0)
+            preparation.start()
+            # the rows of the earlier run are written before any ligand is finished
+            with open(preparation.manifest) as fh:
+                assert len(list(csv.DictReader(fh))) == 2
+            assert not preparation.done
+            rows = prepare_all(preparation)
+            assert {row["prepared"] for row in rows.values()} == {row["prepared"] for row in preparation.rows}
+            assert all(float(row["ph"]) == 6.0 for row in rows.values())
+    finally:
+        ligprep._prepare_task = prepare_task
+
+
+def test_crashed_worker_fails_only_ligands_in_flight():
+    """A broken pool gives failed rows for its ligands and the rest is prepared in a new pool"""
+    prepare_task = ligprep._prepare_task
+    ligprep._prepare_task = fake_prepare_task
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            ligands = [os.path.join(workdir, "{}.sdf".format(name)) for name in ("crash", "a", "b", "c")]
+            for ligand in ligands:
+                with open(ligand, "w") as fw:
+                    fw.write("x")
+
+            preparation = LigandPreparation(ligands, os.path.join(workdir, "Prepared"), workers=1)
+            rows = prepare_all(preparation)
+
+            assert len(rows) == 4
+            assert rows[ligands[0]]["status"] == "failed" and "died" in rows[ligands[0]]["error"]
+            assert rows[ligands[2]]["status"] == rows[ligands[3]]["status"] == "ok"
+    finally:
+        ligprep._prepare_task = prepare_task
+
+
+if __name__ == "__main__":
+    test_failures_are_listed_in_manifest()
+    test_prepared_ligands_feed_the_scheduler()
+    test_manifest_follows_ph_and_names()
+    test_crashed_worker_fails_only_ligands_in_flight()
+    print("✓ All ligand preparation tests passed!")
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import collections
+
+__all__ = ['MoleculeCache', 'MOLECULE_CACHE_ATOMS']
+
+#atoms of all cached molecules, a few receptors and many ligands
+MOLECULE_CACHE_ATOMS = 200000
+
+def count_atoms(mol):
+	#OBMol and RDKit Mol name it differently
+	for method in ('NumAtoms', 'GetNumAtoms'):
+		if hasattr(mol, method):
+			return getattr(mol, method)()
+
+	return 1
+
+class MoleculeCache:
+	"""Parsed molecules keyed by a hash of their text and format
+
+	get returns the molecule parsed before from the same text, so helpers
+	that all read the same receptor parse it once. The least recently used
+	molecules are evicted when the cache holds more than max_atoms atoms.
+	Cached molecules are shared, callers must not modify them.
+	"""
+
+	def __init__(self, max_atoms=MOLECULE_CACHE_ATOMS):
+		self.max_atoms = max_atoms
+		self.entries = collections.OrderedDict()
+		self.atoms = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+	def __len__(self):
+		return len(self.entries)
+
+	@staticmethod
+	def key(content, fmt, kind):
+		if isinstance(content, str):
+			content = content.encode()
+
+		return (hashlib.blake2b(content, digest_size=16).digest(), fmt.lower(), kind)
+
+	def get(self, content, fmt, parse, kind='openbabel'):
+		"""Return parse(content, fmt) from the cache or parse it and keep it
+
+		kind separates molecules of different toolkits parsed from the
+		same text, e.g. 'openbabel' and 'rdkit'.
+		"""
+		key = self.key(content, fmt, kind)
+
+		with self.lock:
+			entry = self.entries.get(key)
+
+			if entry is not None:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return entry[0]
+
+			self.misses += 1
+
+		mol = parse(content, fmt)
+		atoms = count_atoms(mol)
+
+		#larger than the whole cache, it would only evict everything
+		if atoms > self.max_atoms:
+			return mol
+
+		with self.lock:
+			if key not in self.entries:
+				self.entries[key] = (mol, atoms)
+				self.atoms += atoms
+
+			while self.atoms > self.max_atoms:
+				_, (_, evicted) = self.entries.popitem(last=False)
+				self.atoms -= evicted
+				self.evictions += 1
+
+		return mol
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.atoms = 0
+
+	def stats(self):
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'molecules': len(self.entries),
+			'atoms': self.atoms
+		}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Molecule Cache Test for PandaDOCK
+Verifies structures are parsed once and evicted by atom count
+"""
+
+from molcache import MoleculeCache
+
+
+class FakeMol:
+    def __init__(self, text):
+        self.text = text
+
+    def NumAtoms(self):
+        return self.text.count("ATOM")
+
+
+def pdb(atoms, tag=""):
+    return "REMARK {}\n".format(tag) + "ATOM\n" * atoms
+
+
+def make_parser(calls):
+    def parse(content, fmt):
+        calls.append((fmt, len(content)))
+        return FakeMol(content)
+    return parse
+
+
+def test_same_text_is_parsed_once():
+    """Repeated reads of a structure return the molecule parsed first"""
+    calls = []
+    cache = MoleculeCache()
+    parse = make_parser(calls)
+    receptor = pdb(100)
+
+    mol = cache.get(receptor, "pdb", parse)
+    for _ in range(5):
+        assert cache.get(receptor, "PDB", parse) is mol
+    assert cache.get(receptor, "pdbqt", parse) is not mol
+    assert cache.get(receptor, "pdb", parse, kind="rdkit") is not mol
+
+    assert len(calls) == 3
+    assert cache.stats() == {"hits": 5, "misses": 3, "evictions": 0, "molecules": 3, "atoms": 300}
+
+
+def test_least_recently_used_are_evicted_by_atoms():
+    """The cache keeps at most max_atoms atoms, oldest reads go first"""
+    calls = []
+    cache = MoleculeCache(max_atoms=250)
+    parse = make_parser(calls)
+    first, second, third = pdb(100, "a"), pdb(100, "b"), pdb(100, "c")
+
+    cache.get(first, "pdb", parse)
+    cache.get(second, "pdb", parse)
+    cache.get(first, "pdb", parse)
+    cache.get(third, "pdb", parse)
+    assert cache.atoms == 200 and cache.evictions == 1
+
+    cache.get(first, "pdb", parse)
+    cache.get(second, "pdb", parse)
+    assert len(calls) == 4
+
+    huge = pdb(1000)
+    assert cache.get(huge, "pdb", parse) is not cache.get(huge, "pdb", parse)
+    assert cache.atoms <= 250
+
+    cache.clear()
+    assert len(cache) == 0 and cache.atoms == 0
+
+
+if __name__ == "__main__":
+    test_same_text_is_parsed_once()
+    test_least_recently_used_are_evicted_by_atoms()
+    print("✓ All molecule cache tests passed!")
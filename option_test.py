@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Option Store Test for PandaDOCK
+Verifies options are read from memory and written with batched upserts
+"""
+
+import os
+import tempfile
+
+import apsw
+import pytest
+
+from backend import DataBackend
+
+
+def test_reads_are_served_from_memory():
+    """The option table is read once, later reads do not query SQLite"""
+    db = DataBackend()
+    db.connect()
+    db.set_option("protein", "a.pdb")
+    db.query("UPDATE option SET value='b.pdb'")
+    assert db.get_option("protein") == "a.pdb"
+    assert db.get_option("missing") is None
+
+    db.options.reload()
+    assert db.get_option("protein") == "b.pdb"
+    db.close()
+
+
+def test_batched_writes_use_one_transaction():
+    """Changes inside a with block are written together when it ends"""
+    db = DataBackend()
+    db.connect()
+    db.set_option("args", "[]")
+    changes = db.conn.total_changes()
+
+    with db.options:
+        db.set_option("args", '["--mode", "fast"]')
+        db.set_option("center", None)
+        assert db.get_option("center") == "None"
+        assert db.get_count("option") == 1
+
+    assert db.conn.total_changes() - changes == 2
+    assert dict(db.query("SELECT name, value FROM option")) == {"args": '["--mode", "fast"]', "center": "None"}
+
+    with pytest.raises(apsw.ConstraintError):
+        db.query("INSERT INTO option (name, value) VALUES ('args', 'x')")
+    db.close()
+
+
+def test_duplicates_of_old_databases_are_removed():
+    """The first row of a name is kept before the unique index is built"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "pandadock.db")
+        db = DataBackend()
+        db.connect(db_file)
+        db.query("DROP INDEX option_name")
+        db.insert_rows("INSERT INTO option (name, value) VALUES (?,?)", [("protein", "a.pdb"), ("protein", "b.pdb")])
+        assert db.get_option("protein") == "a.pdb"
+        db.close()
+
+        db.connect(db_file)
+        assert db.get_column("SELECT value FROM option") == ["a.pdb"]
+        db.close()
+
+
+def test_pending_writes_are_flushed_on_close():
+    """Options set in an unfinished block are written when the database closes"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "pandadock.db")
+        db = DataBackend()
+        db.connect(db_file, pool=True)
+        db.options.__enter__()
+        db.set_option("protein", "a.pdb")
+        db.close()
+
+        db = DataBackend()
+        db.connect(db_file)
+        assert db.get_option("protein") == "a.pdb"
+        db.close()
+
+
+if __name__ == "__main__":
+    test_reads_are_served_from_memory()
+    test_batched_writes_use_one_transaction()
+    test_duplicates_of_old_databases_are_removed()
+    test_pending_writes_are_flushed_on_close()
+    print("✓ All option store tests passed!")
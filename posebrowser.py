@@ -0,0 +1,195 @@
+import os
+import collections
+
+from backend import ACTIVE_HITS
+from jobstore import JOB_DB_NAME
+
+__all__ = ['PoseQuery', 'PoseCursor', 'POSE_COLUMNS', 'FILTER_OPERATORS', 'find_campaign_database',
+	'ligand_leaderboard', 'LEADERBOARD_ORDERS'
+]
+
+#name, SQL expression and header of the browser columns, id must be first,
+#sorting by energy, le and hits uses the pose indexes of backend.DB_INDEXES
+POSE_COLUMNS = [
+	('id', 'p.id', 'Pose'),
+	('ligand', 'j.ligand', 'Ligand'),
+	('run', 'p.run', 'Run'),
+	('energy', 'p.energy', 'Energy'),
+	('rmsd1', 'p.rmsd1', 'RMSD l.b.'),
+	('rmsd2', 'p.rmsd2', 'RMSD u.b.'),
+	('le', 'p.le', 'LE'),
+	('lle', 'p.lle', 'LLE'),
+	('ki', 'p.ki', 'Ki'),
+	('hits', ACTIVE_HITS, 'Active site hits')
+]
+
+FILTER_OPERATORS = ('<', '<=', '>', '>=', '=', '!=', 'LIKE')
+
+#ligand_summary column and direction of every leaderboard, all indexed
+LEADERBOARD_ORDERS = {
+	'energy': 'min_energy',
+	'le': 'best_le DESC',
+	'hits': 'hits DESC'
+}
+
+def find_campaign_database(directory):
+	"""Return output_N/pandadock.db for output_N or a ligand directory in it"""
+	if not directory:
+		return None
+
+	for folder in (directory, os.path.dirname(os.path.normpath(directory))):
+		db_file = os.path.join(folder, JOB_DB_NAME)
+
+		if os.path.exists(db_file):
+			return db_file
+
+	return None
+
+def ligand_leaderboard(db, order='energy', limit=100, offset=0):
+	"""Return (ligand, best pose id, poses, min energy, best LE, hits) of the top ligands
+
+	Reads the trigger maintained ligand_summary and best tables through
+	their indexes, the cost does not grow with the number of poses.
+	"""
+	sql = ("SELECT j.ligand, b.pid, s.poses, s.min_energy, s.best_le, s.hits FROM ligand_summary AS s "
+		"LEFT JOIN jobs AS j ON j.id=s.jid LEFT JOIN best AS b ON b.jid=s.jid "
+		"WHERE s.{} IS NOT NULL ORDER BY s.{} LIMIT ? OFFSET ?").format(
+		LEADERBOARD_ORDERS[order].split()[0], LEADERBOARD_ORDERS[order])
+	return list(db.query(sql, (limit, offset)))
+
+class PoseQuery:
+	"""Sorted and filtered pose rows fetched with keyset pagination
+
+	A page starts after the sort value and id of the last row of the
+	previous page instead of at an OFFSET, so reading page n costs the
+	same as reading the first one. Rows without a sort value come last.
+	filters is a list of (column, operator, value).
+	"""
+
+	def __init__(self, db, sort='energy', descending=False, filters=(), best_only=False, page_size=500):
+		self.db = db
+		self.expressions = {name: expr for name, expr, _ in POSE_COLUMNS}
+		self.sort = sort
+		self.descending = descending
+		self.filters = list(filters)
+		self.best_only = best_only
+		self.page_size = page_size
+
+	@property
+	def sort_index(self):
+		return [name for name, _, _ in POSE_COLUMNS].index(self.sort)
+
+	def _where(self):
+		conditions = []
+		paras = []
+
+		for column, operator, value in self.filters:
+			if operator.upper() not in FILTER_OPERATORS:
+				raise ValueError("Unsupported filter operator: {}".format(operator))
+
+			conditions.append("{} {} ?".format(self.expressions[column], operator))
+			paras.append(value)
+
+		if self.best_only:
+			conditions.append("p.id IN (SELECT pid FROM best)")
+
+		return conditions, paras
+
+	def _select(self, conditions, order, limit):
+		columns = ','.join(expr for _, expr, _ in POSE_COLUMNS)
+		where = " WHERE " + " AND ".join(conditions) if conditions else ""
+		return "SELECT {} FROM pose AS p LEFT JOIN jobs AS j ON j.id=p.jid{} ORDER BY {} LIMIT {}".format(
+			columns, where, order, limit)
+
+	def count(self):
+		conditions, paras = self._where()
+		where = " WHERE " + " AND ".join(conditions) if conditions else ""
+		sql = "SELECT COUNT(1) FROM pose AS p LEFT JOIN jobs AS j ON j.id=p.jid" + where
+		return self.db.get_one(sql, paras)
+
+	def key(self, row):
+		return (row[self.sort_index], row[0])
+
+	def fetch(self, after=None, limit=None):
+		"""Return up to limit rows following the key after, as tuples"""
+		limit = limit or self.page_size
+		expr = self.expressions[self.sort]
+		direction = 'DESC' if self.descending else 'ASC'
+		conditions, paras = self._where()
+		rows = []
+
+		if after is None or after[0] is not None:
+			keyset = conditions + ["{} IS NOT NULL".format(expr)]
+			keyset_paras = list(paras)
+
+			if after is not None:
+				keyset.append("({}, p.id) {} (?, ?)".format(expr, '<' if self.descending else '>'))
+				keyset_paras.extend(after)
+
+			sql = self._select(keyset, "{0} {1}, p.id {1}".format(expr, direction), limit)
+			rows = list(self.db.query(sql, keyset_paras))
+
+			if len(rows) == limit:
+				return rows
+
+			after = (None, 0)
+
+		nulls = conditions + ["{} IS NULL".format(expr), "p.id > ?"]
+		sql = self._select(nulls, "p.id", limit - len(rows))
+		return rows + list(self.db.query(sql, paras + [after[1]]))
+
+class PoseCursor:
+	"""Random access to the rows of a PoseQuery with bounded memory
+
+	fetch_more extends the rows that can be read by one page. Only the
+	key of the last row of every page and cache_pages pages of rows are
+	kept, a page evicted from the cache is fetched again from the key of
+	the page before it.
+	"""
+
+	def __init__(self, query, cache_pages=20):
+		self.query = query
+		self.cache_pages = cache_pages
+		self.boundaries = []
+		self.pages = collections.OrderedDict()
+		self.loaded = 0
+		self.exhausted = False
+
+	def can_fetch_more(self):
+		return not self.exhausted
+
+	def _cache(self, page, rows):
+		self.pages[page] = rows
+		self.pages.move_to_end(page)
+
+		while len(self.pages) > self.cache_pages:
+			self.pages.popitem(last=False)
+
+	def fetch_more(self):
+		"""Fetch the next page, returns the number of new rows"""
+		if self.exhausted:
+			return 0
+
+		after = self.boundaries[-1] if self.boundaries else None
+		rows = self.query.fetch(after)
+
+		if len(rows) < self.query.page_size:
+			self.exhausted = True
+
+		if rows:
+			self.boundaries.append(self.query.key(rows[-1]))
+			self._cache(len(self.boundaries) - 1, rows)
+			self.loaded += len(rows)
+
+		return len(rows)
+
+	def row(self, index):
+		page, offset = divmod(index, self.query.page_size)
+
+		if page not in self.pages:
+			after = self.boundaries[page - 1] if page else None
+			self._cache(page, self.query.fetch(after))
+
+		self.pages.move_to_end(page)
+		rows = self.pages[page]
+		return rows[offset] if offset < len(rows) else None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pose Browser Test for PandaDOCK
+Verifies keyset pagination, SQL sorting and filtering of the pose table
+"""
+
+import os
+import random
+import tempfile
+
+import pytest
+
+from backend import DataBackend
+from jobstore import JobStore
+from posebrowser import PoseQuery, PoseCursor, find_campaign_database
+
+
+def pose_db(count=1000):
+    r = random.Random(3)
+    db = DataBackend()
+    db.connect()
+    db.insert_rows("INSERT INTO jobs (id, ligand) VALUES (?,?)",
+                   [(i, "lig{}".format(i)) for i in range(1, count // 10 + 1)])
+    db.insert_rows("INSERT INTO pose (jid, run, energy, le, actives) VALUES (?,?,?,?,?)",
+                   [(i // 10 + 1, i % 10 + 1, round(r.uniform(-10, -2), 1) if i % 9 else None, r.random(),
+                     ";".join(["hydrogen_bond:A:SER:1"] * (i % 4))) for i in range(count)])
+    return db
+
+
+def read_all(query):
+    cursor = PoseCursor(query, cache_pages=3)
+    while cursor.can_fetch_more():
+        cursor.fetch_more()
+    return cursor, [cursor.row(i) for i in range(cursor.loaded)]
+
+
+@pytest.mark.parametrize("sort,descending", [("energy", False), ("energy", True), ("hits", True), ("ligand", False)])
+def test_pages_match_sorted_table(sort, descending):
+    """Paging through every row gives the same order as one sorted query"""
+    db = pose_db()
+    query = PoseQuery(db, sort=sort, descending=descending, page_size=64)
+    cursor, rows = read_all(query)
+
+    nulls = [row for row in rows if row[query.sort_index] is None]
+    values = [row for row in rows if row[query.sort_index] is not None]
+    assert len(rows) == 1000 == query.count()
+    assert len({row[0] for row in rows}) == 1000
+    assert values == sorted(values, key=query.key, reverse=descending)
+    assert rows[len(values):] == sorted(nulls)
+    assert len(cursor.pages) == 3
+    db.close()
+
+
+def test_filters_are_applied_in_sql():
+    """Filters and the best pose option limit rows and the count"""
+    db = pose_db()
+    query = PoseQuery(db, filters=[("energy", "<=", -8), ("hits", ">=", 2)], page_size=10)
+    _, rows = read_all(query)
+    assert rows and all(row[3] <= -8 and row[9] >= 2 for row in rows)
+    assert len(rows) == query.count()
+
+    query = PoseQuery(db, best_only=True)
+    assert query.count() == 100
+
+    with pytest.raises(ValueError):
+        PoseQuery(db, filters=[("energy", "; DROP TABLE pose", 1)]).fetch()
+    db.close()
+
+
+def test_find_campaign_database():
+    """The database is found from output_N and from a ligand directory"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        assert find_campaign_database(output_directory) is None
+        JobStore(output_directory).close()
+        ligand_directory = os.path.join(output_directory, "lig1")
+        os.makedirs(ligand_directory)
+        assert find_campaign_database(ligand_directory) == find_campaign_database(output_directory)
+
+
+if __name__ == "__main__":
+    for sort, descending in [("energy", False), ("energy", True), ("hits", True), ("ligand", False)]:
+        test_pages_match_sorted_table(sort, descending)
+    test_filters_are_applied_in_sql()
+    test_find_campaign_database()
+    print("✓ All pose browser tests passed!")
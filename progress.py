@@ -0,0 +1,141 @@
+import re
+import time
+from collections import deque
+
+__all__ = ['PROGRESS_PATTERNS', 'ProgressParser', 'ProgressMeter', 'format_eta']
+
+#counters recognized in pandadock output, outermost first, group 1 is
+#the current and group 2 the total count, e.g. "Ligand 3/120" or
+#"Generation 15 of 100"
+PROGRESS_PATTERNS = [
+	('ligand', r'\bligands?\b\D{0,12}?(\d+)\s*(?:/|of)\s*(\d+)'),
+	('pose', r'\bposes?\b\D{0,12}?(\d+)\s*(?:/|of)\s*(\d+)'),
+	('generation', r'\b(?:generation|gen|iteration)s?\b\D{0,12}?(\d+)\s*(?:/|of)\s*(\d+)'),
+]
+
+def format_eta(seconds):
+	if seconds is None:
+		return "unknown"
+
+	seconds = int(seconds)
+
+	if seconds >= 3600:
+		return "{}h {:02d}m".format(seconds // 3600, seconds % 3600 // 60)
+
+	if seconds >= 60:
+		return "{}m {:02d}s".format(seconds // 60, seconds % 60)
+
+	return "{}s".format(seconds)
+
+class ProgressParser:
+	"""Find progress counters in lines of docking output
+
+	Counters are nested in the order they are registered, so a pattern
+	added with add_pattern() is innermost unless an index is given.
+	"""
+
+	def __init__(self, patterns=None):
+		self.patterns = []
+
+		for name, pattern in patterns or PROGRESS_PATTERNS:
+			self.add_pattern(name, pattern)
+
+	def add_pattern(self, name, pattern, index=None):
+		compiled = (name, re.compile(pattern, re.I))
+
+		if index is None:
+			self.patterns.append(compiled)
+		else:
+			self.patterns.insert(index, compiled)
+
+	@property
+	def levels(self):
+		return [name for name, _ in self.patterns]
+
+	def parse(self, line):
+		"""Return {counter: (current, total)} found in line"""
+		counters = {}
+
+		for name, pattern in self.patterns:
+			m = pattern.search(line)
+
+			if m:
+				current, total = int(m.group(1)), int(m.group(2))
+
+				if 0 < total and 0 <= current <= total:
+					counters[name] = (current, total)
+
+		return counters
+
+class ProgressMeter:
+	"""Track the progress fraction and ETA of one running job
+
+	The fraction combines the nested counters, e.g. generation 50/100 of
+	pose 2/10 is 15%. The ETA comes from the rate over the last window
+	progress samples.
+	"""
+
+	def __init__(self, parser, window=20):
+		self.parser = parser
+		self.counters = {}
+		self.nested = set()
+		self.fraction = 0.0
+		self.samples = deque(maxlen=window)
+
+	def feed(self, lines, now=None):
+		"""Parse lines of output, returns True if the fraction advanced"""
+		levels = self.parser.levels
+		changed = False
+
+		for line in lines:
+			for name, value in self.parser.parse(line).items():
+				if self.counters.get(name) != value:
+					#a new outer item restarts the inner counters
+					for inner in levels[levels.index(name)+1:]:
+						if self.counters.pop(inner, None):
+							self.nested.add(name)
+
+					self.counters[name] = value
+					changed = True
+
+		if not changed:
+			return False
+
+		fraction = self.compute_fraction()
+
+		if fraction <= self.fraction:
+			return False
+
+		self.fraction = fraction
+		self.samples.append((time.time() if now is None else now, fraction))
+		return True
+
+	def compute_fraction(self):
+		present = [name for name in self.parser.levels if name in self.counters]
+		fraction = 0.0
+
+		#the innermost counter counts finished items unless it had inner
+		#counters before, outer ones count the item in progress
+		for i, name in enumerate(reversed(present)):
+			current, total = self.counters[name]
+
+			if i == 0 and name not in self.nested:
+				fraction = current / total
+			else:
+				fraction = (max(current - 1, 0) + fraction) / total
+
+		return min(fraction, 1.0)
+
+	def eta(self, now=None):
+		"""Return the seconds left from the recent rate, or None"""
+		if len(self.samples) < 2:
+			return None
+
+		(t0, f0), (t1, f1) = self.samples[0], self.samples[-1]
+		now = time.time() if now is None else now
+
+		if f1 <= f0 or t1 <= t0:
+			return None
+
+		rate = (f1 - f0) / (t1 - t0)
+		return max((1.0 - f1) / rate - (now - t1), 0.0)
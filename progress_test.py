@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Progress Test for PandaDOCK
+Verifies counter parsing, nested progress, ETA and jobs.progress updates
+"""
+
+import os
+import tempfile
+
+from progress import ProgressParser, ProgressMeter, format_eta
+from scheduler import DockingScheduler
+from jobstore import JobStore
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def test_parse_counters():
+    """Pose, generation and ligand counters are recognized"""
+    parser = ProgressParser()
+    assert parser.parse("Screening ligand 3/120: CHEMBL25") == {"ligand": (3, 120)}
+    assert parser.parse("Generation 15 of 100, best -7.2") == {"generation": (15, 100)}
+    assert parser.parse("Pose 2/10 written") == {"pose": (2, 10)}
+    assert parser.parse("Binding affinity -7.2 kcal/mol") == {}
+
+    parser.add_pattern("step", r"step (\d+)/(\d+)")
+    assert parser.parse("step 4/8") == {"step": (4, 8)}
+
+
+def test_nested_fraction_and_eta():
+    """Generation 50/100 of pose 2/10 is 15%, ETA follows the rate"""
+    meter = ProgressMeter(ProgressParser())
+    assert meter.feed(["Pose 2/10", "Generation 50/100"], now=0.0)
+    assert abs(meter.fraction - 0.15) < 1e-9
+    assert not meter.feed(["nothing to see"], now=5.0)
+
+    meter.feed(["Pose 3/10"], now=10.0)
+    assert abs(meter.fraction - 0.2) < 1e-9
+    assert meter.counters == {"pose": (3, 10)}
+    meter.feed(["Generation 50/100"], now=15.0)
+    assert abs(meter.fraction - 0.25) < 1e-9
+    assert abs(meter.eta(now=15.0) - 112.5) < 1e-6
+    assert format_eta(3725) == "1h 02m"
+    assert format_eta(None) == "unknown"
+
+
+def test_progress_is_stored():
+    """jobs.progress follows the parsed output and the campaign ETA is known"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        store = JobStore(output_directory)
+        scheduler = RecordingScheduler(max_workers=1, store=store)
+        scheduler.submit_many(
+            scheduler.create_job([], "{}.sdf".format(name), "rec.pdb", output_directory)
+            for name in ("a", "b")
+        )
+        scheduler.start()
+        job = scheduler.running[0]
+        scheduler.update_progress(job, ["Pose 5/10"])
+
+        assert store.db.get_one("SELECT progress FROM jobs WHERE id=?", (job.id,)) == 0.5
+        assert abs(scheduler.progress() - 0.25) < 1e-9
+        assert scheduler.eta() is not None
+        store.close()
+
+
+if __name__ == "__main__":
+    test_parse_counters()
+    test_nested_fraction_and_eta()
+    test_progress_is_stored()
+    print("✓ All progress tests passed!")
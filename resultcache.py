@@ -0,0 +1,266 @@
+import os
+import time
+import shutil
+import hashlib
+
+import apsw
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+from backend import BUSY_TIMEOUT
+from jobstore import COMPLETE_MARKER
+from joblog import JOB_LOG_NAME
+
+__all__ = ['ResultCache', 'default_cache_directory']
+
+#arguments whose value is a path, only the file content goes into the key
+PATH_OPTIONS = ('--ligand', '--protein', '--out', '--screen')
+
+#files of a job output that are not docking results
+IGNORED_FILES = (COMPLETE_MARKER, JOB_LOG_NAME)
+
+#written into a cache entry, holds its size in bytes
+SIZE_FILE = '.size'
+
+#sizes and last use of the entries and their running total, in the cache directory
+INDEX_NAME = 'index.db'
+
+INDEX_TABLES = [
+	"CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, size INTEGER, used REAL)",
+	"CREATE INDEX IF NOT EXISTS entry_used ON entry (used)",
+	"CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id=0), size INTEGER)"
+]
+
+#ioctl of copy on write filesystems such as btrfs and XFS, the copy shares extents
+FICLONE = 0x40049409
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+def default_cache_directory():
+	return os.environ.get('PANDADOCK_CACHE_DIR',
+		os.path.join(os.path.expanduser('~'), '.pandadock', 'cache'))
+
+def _clone_file(src, dst):
+	#a reflink where the filesystem has them, else a plain copy
+	if fcntl is not None:
+		try:
+			with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+				fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+			return
+		except OSError:
+			pass
+
+	shutil.copyfile(src, dst)
+
+def _copy_tree(src, dst):
+	"""Copy the results in src to dst, returns their size in bytes
+
+	Files are copied, not hard linked, so rewriting a job output in
+	place does not change the cached entry and evicting frees the space.
+	"""
+	total = 0
+
+	for root, _, files in os.walk(src):
+		target = os.path.join(dst, os.path.relpath(root, src))
+		os.makedirs(target, exist_ok=True)
+
+		for f in files:
+			if f not in IGNORED_FILES and f != SIZE_FILE:
+				_clone_file(os.path.join(root, f), os.path.join(target, f))
+				total += os.path.getsize(os.path.join(target, f))
+
+	return total
+
+class ResultCache:
+	"""Content addressed cache of docking outputs
+
+	The key of a job hashes the protein and ligand file content with its
+	pandadock arguments, which include the box center and size. A hit
+	copies the stored poses and scores into the job output instead of
+	running pandadock. Least recently used entries are evicted once the
+	cache grows over max_bytes.
+
+	Entry sizes, last use and their running total are kept in a small
+	SQLite index, so storing a result does not rescan the cache.
+	"""
+
+	def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+		self.directory = directory or default_cache_directory()
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self._digests = {}
+		os.makedirs(self.directory, exist_ok=True)
+		self.conn = self._open_index()
+
+	def _open_index(self):
+		index_file = os.path.join(self.directory, INDEX_NAME)
+		exists = os.path.exists(index_file)
+		conn = apsw.Connection(index_file)
+		conn.setbusytimeout(BUSY_TIMEOUT)
+		conn.execute("PRAGMA journal_mode=WAL")
+
+		with conn:
+			for sql in INDEX_TABLES:
+				conn.execute(sql)
+
+			conn.execute("INSERT OR IGNORE INTO total VALUES (0, 0)")
+
+		#entries stored before the index existed
+		if not exists:
+			with conn:
+				conn.executemany("INSERT OR IGNORE INTO entry VALUES (?,?,?)",
+					[(os.path.basename(path), size, used) for used, size, path in self.entries()])
+				conn.execute("UPDATE total SET size=(SELECT coalesce(sum(size), 0) FROM entry)")
+
+		return conn
+
+	def close(self):
+		self.conn.close()
+
+	def file_digest(self, path):
+		#the protein is the same for every ligand, hash it once
+		stat = os.stat(path)
+		memo = (path, stat.st_size, stat.st_mtime)
+
+		if memo not in self._digests:
+			h = hashlib.sha256()
+			with open(path, 'rb') as fh:
+				for chunk in iter(lambda: fh.read(1 << 20), b''):
+					h.update(chunk)
+			self._digests[memo] = h.hexdigest()
+
+		return self._digests[memo]
+
+	def folder_digest(self, path):
+		h = hashlib.sha256()
+
+		for name in sorted(os.listdir(path)):
+			if os.path.isfile(os.path.join(path, name)):
+				h.update(name.encode() + b'\0' + self.file_digest(os.path.join(path, name)).encode() + b'\0')
+
+		return h.hexdigest()
+
+	def key(self, job):
+		"""Return the cache key of job, or None if it cannot be cached"""
+		h = hashlib.sha256()
+		arguments = iter(job.arguments)
+
+		for arg in arguments:
+			h.update(arg.encode() + b'\0')
+
+			if arg in PATH_OPTIONS:
+				path = next(arguments, '')
+
+				if arg == '--out':
+					continue
+
+				#a screened folder, e.g. a shard, is keyed by the ligands it holds when docked
+				if os.path.isdir(path):
+					h.update(self.folder_digest(path).encode() + b'\0')
+				elif os.path.isfile(path):
+					h.update(self.file_digest(path).encode() + b'\0')
+				else:
+					return None
+
+		return h.hexdigest()
+
+	def entry(self, key):
+		return os.path.join(self.directory, key[:2], key)
+
+	def restore(self, job):
+		"""Copy a cached output into job.output, returns True on a hit"""
+		key = self.key(job)
+
+		if key is None:
+			return False
+
+		entry = self.entry(key)
+
+		if not os.path.isdir(entry):
+			self.misses += 1
+			return False
+
+		_copy_tree(entry, job.output)
+		self.conn.execute("UPDATE entry SET used=? WHERE key=?", (time.time(), key))
+		self.hits += 1
+		return True
+
+	def store(self, job):
+		key = self.key(job)
+
+		if key is None or os.path.isdir(self.entry(key)):
+			return
+
+		entry = self.entry(key)
+		partial = "{}.{}.tmp".format(entry, os.getpid())
+
+		if os.path.exists(partial):
+			shutil.rmtree(partial)
+
+		size = _copy_tree(job.output, partial)
+
+		with open(os.path.join(partial, SIZE_FILE), 'w') as fw:
+			fw.write(str(size))
+
+		try:
+			os.rename(partial, entry)
+		except OSError:
+			#stored by a concurrent run meanwhile
+			shutil.rmtree(partial, ignore_errors=True)
+			return
+
+		with self.conn:
+			self.conn.execute("INSERT OR REPLACE INTO entry VALUES (?,?,?)", (key, size, time.time()))
+			self.conn.execute("UPDATE total SET size=size+?", (size,))
+
+		if self.size() > self.max_bytes:
+			self.evict()
+
+	def entries(self):
+		"""Return (last use, size, path) of every complete entry found on disk
+
+		Only used to index a cache written before the index existed.
+		"""
+		entries = []
+
+		for prefix in os.scandir(self.directory):
+			if not prefix.is_dir():
+				continue
+
+			for entry in os.scandir(prefix.path):
+				size_file = os.path.join(entry.path, SIZE_FILE)
+
+				if entry.is_dir() and not entry.name.endswith('.tmp') and os.path.exists(size_file):
+					with open(size_file) as fh:
+						size = int(fh.read() or 0)
+					entries.append((entry.stat().st_mtime, size, entry.path))
+
+		return entries
+
+	def size(self):
+		return self.conn.execute("SELECT size FROM total").fetchone()[0]
+
+	def evict(self):
+		"""Remove least recently used entries over max_bytes, returns their count"""
+		evicted = 0
+
+		while self.size() > self.max_bytes:
+			row = self.conn.execute("SELECT key, size FROM entry ORDER BY used LIMIT 1").fetchone()
+
+			if row is None:
+				break
+
+			key, size = row
+
+			with self.conn:
+				self.conn.execute("DELETE FROM entry WHERE key=?", (key,))
+				self.conn.execute("UPDATE total SET size=max(size-?, 0)", (size,))
+
+			shutil.rmtree(self.entry(key), ignore_errors=True)
+			evicted += 1
+
+		return evicted
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Result Cache Test for PandaDOCK
+Verifies cache hits skip pandadock and the LRU size cap
+"""
+
+import os
+import tempfile
+
+from scheduler import DockingScheduler
+from resultcache import ResultCache
+
+
+class RecordingScheduler(DockingScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.launched = []
+
+    def launch(self, job):
+        self.launched.append(job.name)
+        os.makedirs(os.path.join(job.output, "poses"))
+        with open(os.path.join(job.output, "poses", "pose_1.pdb"), "w") as fw:
+            fw.write("REMARK {}\nEND\n".format(job.name))
+
+
+def write(path, text):
+    with open(path, "w") as fw:
+        fw.write(text)
+    return path
+
+
+def run_campaign(cache, ligands, protein, output_directory):
+    scheduler = RecordingScheduler(max_workers=2, cache=cache)
+    scheduler.submit_many(
+        scheduler.create_job(["--mode", "fast"], ligand, protein, output_directory, (1.0, 2.0, 3.0))
+        for ligand in ligands
+    )
+    scheduler.start()
+    while scheduler.running:
+        scheduler.job_finished(scheduler.running[0], 0)
+    return scheduler
+
+
+def test_unchanged_ligands_are_not_redocked():
+    """Only the edited ligand spawns pandadock on the second run"""
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(os.path.join(workdir, "cache"))
+        protein = write(os.path.join(workdir, "rec.pdb"), "ATOM\n")
+        ligands = [write(os.path.join(workdir, "{}.sdf".format(n)), n) for n in ("a", "b", "c")]
+
+        first = run_campaign(cache, ligands, protein, os.path.join(workdir, "output_1"))
+        assert sorted(first.launched) == ["a", "b", "c"]
+
+        write(ligands[1], "b edited")
+        second = run_campaign(cache, ligands, protein, os.path.join(workdir, "output_2"))
+        assert second.launched == ["b"]
+        assert sorted(job.name for job in second.completed if job.cached) == ["a", "c"]
+        assert os.path.exists(os.path.join(workdir, "output_2", "a", "poses", "pose_1.pdb"))
+        assert cache.hits == 2
+
+        other_box = RecordingScheduler(max_workers=1, cache=cache)
+        job = other_box.create_job(["--mode", "fast"], ligands[0], protein, workdir, (0.0, 0.0, 0.0))
+        assert not cache.restore(job)
+
+
+def test_lru_eviction():
+    """The least recently used entries go once the cap is exceeded"""
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(os.path.join(workdir, "cache"))
+        protein = write(os.path.join(workdir, "rec.pdb"), "ATOM\n")
+        ligands = [write(os.path.join(workdir, "{}.sdf".format(n)), n) for n in ("a", "b", "c")]
+        run_campaign(cache, ligands, protein, os.path.join(workdir, "output_1"))
+
+        entry_size = cache.size() // 3
+        cache.max_bytes = entry_size * 2
+        assert cache.evict() == 1
+        assert cache.size() <= cache.max_bytes
+        assert sum(os.path.isdir(cache.entry(key)) for key, in cache.conn.execute("SELECT key FROM entry")) == 2
+
+        # a cache reopened later keeps the sizes without rescanning
+        cache.close()
+        assert ResultCache(os.path.join(workdir, "cache")).size() == entry_size * 2
+
+
+def test_entries_are_copies():
+    """Rewriting a job output in place leaves the cached result intact, storing does not rescan"""
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(os.path.join(workdir, "cache"))
+        cache.entries = None  # the index holds the sizes, the entries are never listed
+        protein = write(os.path.join(workdir, "rec.pdb"), "ATOM\n")
+        ligand = write(os.path.join(workdir, "a.sdf"), "a")
+        run_campaign(cache, [ligand], protein, os.path.join(workdir, "output_1"))
+
+        pose = os.path.join(workdir, "output_1", "a", "poses", "pose_1.pdb")
+        assert os.stat(pose).st_nlink == 1
+        write(pose, "rewritten")
+
+        second = run_campaign(cache, [ligand], protein, os.path.join(workdir, "output_2"))
+        assert second.launched == []
+        with open(os.path.join(workdir, "output_2", "a", "poses", "pose_1.pdb")) as fh:
+            assert fh.read() == "REMARK a\nEND\n"
+
+
+if __name__ == "__main__":
+    test_unchanged_ligands_are_not_redocked()
+    test_lru_eviction()
+    test_entries_are_copies()
+    print("✓ All result cache tests passed!")
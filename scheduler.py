@@ -0,0 +1,713 @@
+import os
+import time
+import signal
+import shutil
+import subprocess
+from collections import deque
+
+from joblog import JobLog, JOB_LOG_NAME
+from progress import ProgressParser, ProgressMeter, format_eta
+from sdfindex import write_records
+
+__all__ = ['DOCKING_PRESETS', 'DockingJob', 'DockingScheduler', 'default_worker_count',
+	'build_docking_arguments', 'build_screening_arguments', 'find_report_directory',
+	'next_output_directory', 'is_screening_preset', 'SubprocessScheduler', 'derive_threads_per_job',
+	'job_environment', 'THREAD_VARIABLES', 'remove_partial_output'
+]
+
+REPORT_FILES = ['pandadock_report.html', 'master_publication.png']
+
+#edge of the docking box in angstrom when the arguments give no --size
+DEFAULT_BOX_SIZE = 20
+
+#docking templates shared by the GUI dialog and the batch runner
+DOCKING_PRESETS = {
+	"Fast Mode - PandaCore": "--mode fast --scoring pandacore --num-poses 9 --exhaustiveness 8",
+	"Balanced Mode - PandaML": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --ml-rescoring",
+	"Precise Mode - PandaPhysics": "--mode precise --scoring pandaphysics --num-poses 50 --exhaustiveness 32 --side-chain-flexibility",
+	"Virtual Screening - Fast": "--mode fast --scoring pandacore --num-poses 5 --exhaustiveness 4 --save-poses",
+	"Virtual Screening - Balanced": "--mode balanced --scoring pandaml --num-poses 10 --exhaustiveness 8 --ml-rescoring --save-poses",
+	"High-Precision Docking": "--mode precise --scoring pandaphysics --num-poses 100 --exhaustiveness 64 --side-chain-flexibility --save-complex",
+	"Flexible Residue Docking": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --side-chain-flexibility --ml-rescoring",
+	"GPU-Accelerated Docking": "--mode fast --scoring pandacore --num-poses 20 --exhaustiveness 16 --gpu",
+	"Complete Analysis Suite": "--mode balanced --scoring pandaml --num-poses 20 --exhaustiveness 16 --ml-rescoring --pandamap --pandamap-3d --all-outputs --plots --interaction-maps",
+	"Metal Complex Docking": "--mode precise --scoring pandaphysics --num-poses 50 --exhaustiveness 32 --side-chain-flexibility --save-complex --pandamap",
+}
+
+def is_screening_preset(name):
+	return "Virtual Screening" in name
+
+def next_output_directory(main_directory):
+	#output, output_1, output_2, ... as created by previous runs
+	if not os.path.exists(os.path.join(main_directory, 'output')):
+		return os.path.join(main_directory, 'output')
+
+	num = 0
+	for file in os.listdir(main_directory):
+		if file.startswith("output"):
+			num += 1
+
+	return os.path.join(main_directory, 'output_{}'.format(num))
+
+#thread pool sizes honoured by the numeric libraries pandadock uses
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+def default_worker_count(threads_per_job=1):
+	cores = os.cpu_count() or 1
+	threads_per_job = max(1, int(threads_per_job))
+	return max(1, cores // threads_per_job)
+
+def derive_threads_per_job(max_workers):
+	#the cores are shared evenly by the concurrent processes
+	cores = os.cpu_count() or 1
+	return max(1, cores // max(1, int(max_workers)))
+
+def job_environment(threads, environ=None):
+	"""Return a copy of environ that caps the thread pools of a job at threads"""
+	env = dict(os.environ if environ is None else environ)
+
+	for name in THREAD_VARIABLES:
+		env[name] = str(threads)
+
+	return env
+
+def _site_arguments(args, center):
+	if center is None:
+		return []
+
+	x, y, z = center
+	site = ["--center", str(x), str(y), str(z)]
+
+	#a --size in args, e.g. from the batch --size or --radius, replaces the default box
+	if '--size' not in args:
+		site.extend(["--size"] + [str(DEFAULT_BOX_SIZE)] * 3)
+
+	return site
+
+def build_docking_arguments(args, ligand_path, protein_file, output_directory, center=None):
+	arguments = list(args) + ["--ligand", ligand_path, "--protein", protein_file]
+	arguments.extend(_site_arguments(args, center))
+	arguments.extend(["--out", output_directory])
+	return arguments
+
+def build_screening_arguments(args, ligand_path, protein_file, output_directory, center=None):
+	arguments = list(args) + ["--protein", protein_file, "--screen", ligand_path]
+	arguments.extend(_site_arguments(args, center))
+	arguments.extend(["--out", output_directory])
+	return arguments
+
+def find_report_directory(output_directory):
+	#concurrent runs write every ligand to its own sub-directory,
+	#so fall back to the most recently finished one for the report
+	if any(os.path.exists(os.path.join(output_directory, f)) for f in REPORT_FILES):
+		return output_directory
+
+	candidates = []
+	for entry in os.scandir(output_directory):
+		if not entry.is_dir():
+			continue
+
+		if any(os.path.exists(os.path.join(entry.path, f)) for f in REPORT_FILES):
+			candidates.append((entry.stat().st_mtime, entry.path))
+
+	if candidates:
+		return max(candidates)[1]
+
+	return output_directory
+
+def remove_partial_output(job):
+	"""Remove what a cancelled job wrote
+
+	The output folder goes only if the job created it, a screen started
+	in the campaign folder loses just the files that appeared since, so
+	pandadock.db and the outputs of other jobs are kept.
+	"""
+	if job.created_output:
+		shutil.rmtree(job.output, ignore_errors=True)
+		return
+
+	#a job cancelled before it started wrote nothing
+	if job.existing_files is None or not os.path.isdir(job.output):
+		return
+
+	for name in set(os.listdir(job.output)) - job.existing_files:
+		path = os.path.join(job.output, name)
+
+		if os.path.isdir(path) and not os.path.islink(path):
+			shutil.rmtree(path, ignore_errors=True)
+		elif os.path.exists(path):
+			os.remove(path)
+
+class DockingJob:
+	def __init__(self, ligand, output, arguments):
+		self.ligand = ligand
+		self.output = output
+		self.arguments = arguments
+		self.name = os.path.splitext(os.path.basename(ligand))[0]
+		self.id = None
+		self.descriptors = None
+		self.started = None
+		self.finished = None
+		self.exit_code = None
+		self.process = None
+		self.progress = 0.0
+		self.stored_progress = 0.0
+		self.meter = None
+		self.cached = False
+		self.priority = 0
+		self.cancelled = False
+		self.paused = False
+		self.throttled = False
+		self.paused_at = None
+		self.paused_for = 0.0
+
+		#(library, offset, length, target) ranges written when the job starts
+		self.records = None
+
+		#a screen writes into the campaign folder, only its new files are its own
+		self.created_output = False
+		self.existing_files = None
+
+	@property
+	def elapsed(self):
+		if self.started is None:
+			return 0
+
+		#time spent stopped is not docking time
+		end = self.finished or time.time()
+		paused = self.paused_for + (end - self.paused_at if self.paused_at else 0)
+		return end - self.started - paused
+
+	@property
+	def succeeded(self):
+		return self.exit_code == 0
+
+	@property
+	def state(self):
+		if self.cancelled:
+			return 'cancelled'
+
+		if self.exit_code is not None:
+			if self.cached:
+				return 'cached'
+
+			return 'done' if self.succeeded else 'failed'
+
+		if self.throttled:
+			return 'throttled'
+
+		if self.paused:
+			return 'paused'
+
+		return 'queued' if self.started is None else 'running'
+
+class DockingScheduler:
+	"""Keep up to max_workers pandadock processes in flight.
+
+	Subclasses implement launch() to start the process for a job and
+	must call job_finished() once it exits, which refills the free slot.
+	An optional store (see jobstore.JobStore) records every job before
+	it starts and tracks its status. With a cost model (see
+	costmodel.CostModel) the pending queue is ordered longest first and
+	reordered whenever the model is refit on finished jobs.
+
+	With a result cache (see resultcache.ResultCache) a job whose inputs
+	were docked before is finished from the cache without a process, and
+	every successful job is stored in it.
+
+	A job with records has its ligand files written from byte ranges of
+	a library (see sdfindex.LibraryIndex) only when it starts.
+
+	Running jobs can be paused, cancelled or throttled when max_workers
+	is lowered with set_max_workers(), subclasses implement process_id()
+	and terminate() for that. Paused and throttled jobs are stopped with
+	SIGSTOP and continued with SIGCONT, throttled ones are continued as
+	soon as a slot is free again.
+
+	Every job gets threads_per_job threads through THREAD_VARIABLES,
+	by default the cores divided by max_workers when it starts, so the
+	concurrent processes do not oversubscribe the machine.
+
+	Subclasses pass the output of a job to update_progress(), which
+	tracks its progress with a progress.ProgressParser and estimates the
+	campaign ETA from a moving average of the recent job wall times.
+	"""
+
+	program = 'pandadock'
+
+	#the store is only updated when a job advanced by this fraction
+	store_progress_step = 0.05
+
+	def __init__(self, max_workers=None, threads_per_job=None, store=None, cost_model=None,
+		progress_parser=None, eta_window=20, cache=None):
+		self.max_workers = max_workers or default_worker_count(threads_per_job or 1)
+
+		#None derives it from the cores and max_workers when a job starts
+		self.threads_per_job = threads_per_job
+		self.store = store
+		self.cost_model = cost_model
+		self.cache = cache
+		self.progress_parser = progress_parser or ProgressParser()
+		self.pending = deque()
+		self.running = []
+		self.completed = []
+		self.durations = deque(maxlen=eta_window)
+		self.started = None
+
+		#set while a producer such as ligprep.LigandPreparation still submits jobs
+		self.feeding = False
+
+		#set by cancel(), jobs submitted afterwards are dropped
+		self.cancelled = False
+
+		#no new job is started while the campaign is paused
+		self.paused = False
+
+		#callbacks, each receives the job
+		self.on_started = None
+		self.on_finished = None
+		self.on_progress = None
+
+		#called without arguments once the queue is drained
+		self.on_complete = None
+
+	def create_job(self, args, ligand_path, protein_file, output_directory, center=None):
+		name = os.path.splitext(os.path.basename(ligand_path))[0]
+		job_output = os.path.join(output_directory, name)
+		arguments = build_docking_arguments(args, ligand_path,
+			protein_file, job_output, center)
+		return DockingJob(ligand_path, job_output, arguments)
+
+	def create_screening_job(self, args, ligand_path, protein_file, output_directory, center=None):
+		arguments = build_screening_arguments(args, ligand_path,
+			protein_file, output_directory, center)
+		return DockingJob(ligand_path, output_directory, arguments)
+
+	def submit(self, job):
+		self.submit_many([job])
+
+	def submit_many(self, jobs):
+		if self.cancelled:
+			return
+
+		jobs = list(jobs)
+
+		if self.cost_model:
+			for job in jobs:
+				job.descriptors = self.cost_model.describe(job.ligand)
+
+		if self.store:
+			self.store.add_many(jobs)
+
+		self.pending.extend(jobs)
+		self.order_pending()
+
+		#jobs fed to a started scheduler run as soon as a slot is free
+		if self.started is not None:
+			self._fill_slots()
+
+	def order_pending(self):
+		#jobs moved to the front keep their place, the rest run longest first
+		predict = self.cost_model.predict if self.cost_model else lambda descriptors: 0
+		self.pending = deque(sorted(self.pending,
+			key=lambda job: (job.priority, predict(job.descriptors)), reverse=True))
+
+	@property
+	def total(self):
+		return len(self.pending) + len(self.running) + len(self.completed)
+
+	def idle(self):
+		return not self.pending and not self.running and not self.feeding
+
+	def open_feed(self):
+		self.feeding = True
+
+	def close_feed(self):
+		#a feed closed by cancel() has already completed the queue
+		if not self.feeding:
+			return
+
+		self.feeding = False
+
+		if self.idle() and self.on_complete:
+			self.on_complete()
+
+	def start(self):
+		if self.started is None:
+			self.started = time.time()
+
+		self._fill_slots()
+
+	def slots_used(self):
+		return sum(1 for job in self.running if not job.throttled)
+
+	def _fill_slots(self):
+		for job in list(self.running):
+			if job.throttled and self.slots_used() < self.max_workers:
+				job.throttled = False
+
+				if not self.paused:
+					self.continue_job(job)
+
+		while self.pending and not self.paused and self.slots_used() < self.max_workers:
+			job = self.pending.popleft()
+			job.created_output = not os.path.exists(job.output)
+			job.existing_files = None if job.created_output else set(os.listdir(job.output))
+			os.makedirs(job.output, exist_ok=True)
+
+			if job.records:
+				write_records(job.records)
+				job.records = None
+			job.started = time.time()
+			job.progress = job.stored_progress = 0.0
+			job.meter = ProgressMeter(self.progress_parser)
+			self.running.append(job)
+
+			if self.store:
+				self.store.job_started(job)
+
+			if self.cache and self.cache.restore(job):
+				job.cached = True
+				self._complete(job, 0)
+				continue
+
+			self.launch(job)
+
+			if self.on_started:
+				self.on_started(job)
+
+	def job_threads(self):
+		return self.threads_per_job or derive_threads_per_job(self.max_workers)
+
+	def spare_cores(self):
+		#cores left when every docking slot runs, at least one for side work such as ligand preparation
+		cores = os.cpu_count() or 1
+		return max(1, cores - self.max_workers * self.job_threads())
+
+	def launch(self, job):
+		raise NotImplementedError
+
+	def process_id(self, job):
+		raise NotImplementedError
+
+	def terminate(self, job):
+		raise NotImplementedError
+
+	def signal_job(self, job, sig):
+		if sig is None or job.process is None:
+			return False
+
+		try:
+			os.kill(self.process_id(job), sig)
+		except (OSError, TypeError):
+			return False
+
+		return True
+
+	def stop_job(self, job):
+		if job.paused:
+			return True
+
+		if not self.signal_job(job, getattr(signal, 'SIGSTOP', None)):
+			return False
+
+		job.paused = True
+		job.paused_at = time.time()
+		return True
+
+	def continue_job(self, job):
+		if not job.paused:
+			return True
+
+		if not self.signal_job(job, getattr(signal, 'SIGCONT', None)):
+			return False
+
+		job.paused = False
+		job.paused_for += time.time() - job.paused_at
+		job.paused_at = None
+		return True
+
+	def pause(self, job=None):
+		"""Stop a running job, or the whole campaign when job is None
+
+		Returns False if the platform cannot stop processes.
+		"""
+		if job is not None:
+			return self.stop_job(job)
+
+		self.paused = True
+		return all([self.stop_job(job) for job in self.running])
+
+	def resume(self, job=None):
+		"""Continue a paused job, or the whole campaign when job is None"""
+		if job is not None:
+			return job.throttled or self.continue_job(job)
+
+		self.paused = False
+		resumed = all([self.continue_job(job) for job in self.running if not job.throttled])
+		self._fill_slots()
+		return resumed
+
+	def cancel(self, job=None):
+		"""Cancel a job, or every unfinished job when job is None
+
+		Queued jobs are dropped, running ones are killed. The partial
+		output of a cancelled job is removed. Cancelling every job also
+		closes the feed and refuses jobs submitted afterwards.
+		"""
+		if job is None:
+			self.cancelled = True
+			self.feeding = False
+
+			for job in list(self.pending) + list(self.running):
+				self.cancel(job)
+			return
+
+		if job in self.pending:
+			self.pending.remove(job)
+			job.cancelled = True
+			job.finished = time.time()
+			self.completed.append(job)
+
+			if self.store:
+				self.store.job_finished(job)
+
+			if self.on_finished:
+				self.on_finished(job)
+
+			if self.idle() and self.on_complete:
+				self.on_complete()
+
+		elif job in self.running:
+			job.cancelled = True
+			self.terminate(job)
+
+	def move_to_front(self, jobs):
+		"""Start the given queued jobs before all others"""
+		top = max([job.priority for job in self.pending], default=0)
+
+		for job in reversed(list(jobs)):
+			top += 1
+			job.priority = top
+
+		self.order_pending()
+
+	def set_max_workers(self, max_workers):
+		"""Change the concurrency of a running campaign
+
+		Jobs over the new limit are stopped, not killed, and continue
+		once others finish.
+		"""
+		self.max_workers = max(1, max_workers)
+
+		for job in sorted(self.running, key=lambda job: job.started, reverse=True):
+			if self.slots_used() <= self.max_workers:
+				break
+
+			if not job.throttled and self.stop_job(job):
+				job.throttled = True
+
+		self._fill_slots()
+
+	def update_progress(self, job, lines):
+		if job.meter is None or not job.meter.feed(lines):
+			return
+
+		job.progress = job.meter.fraction
+
+		if self.store and job.progress - job.stored_progress >= self.store_progress_step:
+			self.store.job_progress(job)
+			job.stored_progress = job.progress
+
+		if self.on_progress:
+			self.on_progress(job)
+
+	def job_finished(self, job, exit_code):
+		if job not in self.running:
+			return
+
+		self._complete(job, exit_code)
+		self._fill_slots()
+
+		if self.idle() and self.on_complete:
+			self.on_complete()
+
+	def _complete(self, job, exit_code):
+		job.finished = time.time()
+		job.exit_code = exit_code
+		job.process = None
+		job.meter = None
+		job.throttled = False
+		self.running.remove(job)
+		self.completed.append(job)
+
+		if job.cancelled:
+			job.exit_code = None
+			remove_partial_output(job)
+
+		if job.succeeded:
+			job.progress = 1.0
+
+		#wall times of cache hits say nothing about docking cost
+		if job.succeeded and not job.cached:
+			self.durations.append(job.elapsed)
+
+			if self.cache:
+				self.cache.store(job)
+
+			if self.cost_model:
+				self.cost_model.observe(job.descriptors, job.elapsed)
+
+				if self.cost_model.needs_refit() and self.cost_model.fit():
+					self.order_pending()
+
+		if self.store:
+			self.store.job_finished(job)
+
+		if self.on_finished:
+			self.on_finished(job)
+
+	def throughput(self):
+		"""Return the aggregate throughput in ligands per hour"""
+		if self.started is None or not self.completed:
+			return 0.0
+
+		elapsed = time.time() - self.started
+
+		if elapsed <= 0:
+			return 0.0
+
+		return len(self.completed) * 3600.0 / elapsed
+
+	def progress(self):
+		"""Return the finished fraction of the whole campaign"""
+		if not self.total:
+			return 0.0
+
+		done = len(self.completed) + sum(job.progress for job in self.running)
+		return done / self.total
+
+	def job_eta(self, job):
+		if job.meter is None:
+			return None
+
+		return job.meter.eta()
+
+	def average_duration(self):
+		"""Moving average of recent job wall times in seconds, or None"""
+		durations = list(self.durations)
+
+		#before the first job finishes, project the running ones
+		if not durations:
+			durations = [job.elapsed / job.progress for job in self.running if job.progress > 0]
+
+		if not durations:
+			return None
+
+		return sum(durations) / len(durations)
+
+	def eta(self):
+		"""Return the seconds left for the whole campaign, or None"""
+		if self.idle():
+			return 0.0
+
+		average = self.average_duration()
+
+		if average is None:
+			return None
+
+		work = len(self.pending) * average
+
+		for job in self.running:
+			remaining = self.job_eta(job)
+			work += average * (1.0 - job.progress) if remaining is None else remaining
+
+		return work / self.max_workers
+
+	def summary(self):
+		failed = sum(1 for job in self.completed if job.state == 'failed')
+		summary = "Docked {}/{} ligands ({} failed, {} running) - {:.1f} ligands/hour".format(
+			len(self.completed), self.total, failed, len(self.running), self.throughput())
+
+		cached = sum(1 for job in self.completed if job.cached)
+
+		if cached:
+			summary += " - {} from cache".format(cached)
+
+		cancelled = sum(1 for job in self.completed if job.cancelled)
+
+		if cancelled:
+			summary += " - {} cancelled".format(cancelled)
+
+		if self.paused:
+			summary += " - paused"
+
+		if not self.idle():
+			summary += " - ETA {}".format(format_eta(self.eta()))
+
+		return summary
+
+class SubprocessScheduler(DockingScheduler):
+	"""Scheduler for headless use, each job output goes to JOB_LOG_NAME"""
+
+	poll_interval = 0.5
+
+	#called without arguments on every poll, e.g. to feed new jobs
+	on_poll = None
+
+	def launch(self, job):
+		log = open(os.path.join(job.output, JOB_LOG_NAME), 'w')
+
+		try:
+			job.process = subprocess.Popen([self.program] + job.arguments,
+				stdout=log, stderr=subprocess.STDOUT, env=job_environment(self.job_threads()))
+		except OSError as e:
+			log.write("Process error: {}\n".format(e))
+			job.process = None
+		finally:
+			log.close()
+
+		job.log = JobLog(job.name, line_cap=1)
+		job.log_offset = 0
+
+	def process_id(self, job):
+		return job.process.pid
+
+	def terminate(self, job):
+		if job.process is not None:
+			job.process.kill()
+
+	def read_output(self, job):
+		#feed the new part of the job log to the progress parser
+		with open(os.path.join(job.output, JOB_LOG_NAME), 'rb') as fh:
+			fh.seek(job.log_offset)
+			data = fh.read()
+
+		job.log_offset += len(data)
+
+		if data:
+			self.update_progress(job, job.log.write(data.decode(errors='replace')))
+
+	def poll(self):
+		for job in list(self.running):
+			if job.process is None:
+				self.job_finished(job, -1)
+				continue
+
+			exit_code = job.process.poll()
+			self.read_output(job)
+
+			if exit_code is not None:
+				self.job_finished(job, exit_code)
+
+		if self.on_poll:
+			self.on_poll()
+
+	def run(self):
+		self.start()
+
+		while not self.idle():
+			self.poll()
+
+			if not self.idle():
+				time.sleep(self.poll_interval)
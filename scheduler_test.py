@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Scheduler Test for PandaDOCK GUI
+Verifies that the docking scheduler keeps the worker slots filled
+"""
+
+import os
+import tempfile
+
+from scheduler import (DockingScheduler, build_docking_arguments, default_worker_count,
+    derive_threads_per_job, job_environment, THREAD_VARIABLES)
+
+
+class RecordingScheduler(DockingScheduler):
+    """Scheduler that records launches instead of spawning pandadock"""
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers)
+        self.launched = []
+        self.peak = 0
+
+    def launch(self, job):
+        self.launched.append(job)
+        self.peak = max(self.peak, len(self.running))
+
+
+def make_jobs(scheduler, directory, count):
+    return [
+        scheduler.create_job(["--mode", "fast"], "lig{}.sdf".format(i), "rec.pdb", directory, (1, 2, 3))
+        for i in range(count)
+    ]
+
+
+def test_worker_slots_are_refilled():
+    """N jobs are kept in flight and freed slots are filled immediately"""
+    with tempfile.TemporaryDirectory() as directory:
+        scheduler = RecordingScheduler(max_workers=3)
+        scheduler.submit_many(make_jobs(scheduler, directory, 7))
+        done = []
+        scheduler.on_complete = lambda: done.append(True)
+        scheduler.start()
+
+        assert len(scheduler.running) == 3
+        assert len(scheduler.pending) == 4
+
+        while scheduler.running:
+            scheduler.job_finished(scheduler.running[0], 0)
+
+        assert scheduler.peak == 3
+        assert len(scheduler.completed) == 7
+        assert done == [True]
+        assert scheduler.throughput() > 0
+        assert all(os.path.isdir(job.output) for job in scheduler.completed)
+
+
+def test_docking_arguments():
+    """Pocket detection runs omit the box arguments"""
+    args = build_docking_arguments(["--gpu"], "a.sdf", "p.pdb", "out", (1.0, 2.0, 3.0))
+    assert args == ["--gpu", "--ligand", "a.sdf", "--protein", "p.pdb",
+        "--center", "1.0", "2.0", "3.0", "--size", "20", "20", "20", "--out", "out"]
+
+    args = build_docking_arguments([], "a.sdf", "p.pdb", "out")
+    assert args == ["--ligand", "a.sdf", "--protein", "p.pdb", "--out", "out"]
+
+    #a box size given with the arguments replaces the default box
+    args = build_docking_arguments(["--size", "28", "28", "28"], "a.sdf", "p.pdb", "out", (1, 2, 3))
+    assert args.count("--size") == 1 and args[args.index("--size") + 1] == "28"
+
+
+def test_default_worker_count():
+    """Default workers divide the cores by the per-job threads"""
+    cores = os.cpu_count() or 1
+    assert default_worker_count() == cores
+    assert default_worker_count(cores * 2) == 1
+
+
+def test_threads_per_job_follow_workers():
+    """Jobs share the cores, an explicit thread count wins"""
+    cores = os.cpu_count() or 1
+    assert derive_threads_per_job(1) == cores
+    assert derive_threads_per_job(cores * 2) == 1
+
+    scheduler = RecordingScheduler(max_workers=1)
+    assert scheduler.job_threads() == cores
+    assert scheduler.spare_cores() == 1
+    scheduler.threads_per_job = 3
+    assert scheduler.job_threads() == 3
+    scheduler.threads_per_job = 1
+    assert scheduler.spare_cores() == max(1, cores - 1)
+
+    env = job_environment(2, {"PATH": "/bin"})
+    assert env["PATH"] == "/bin" and all(env[name] == "2" for name in THREAD_VARIABLES)
+
+
+if __name__ == "__main__":
+    test_worker_slots_are_refilled()
+    test_docking_arguments()
+    test_default_worker_count()
+    test_threads_per_job_follow_workers()
+    print("✓ All scheduler tests passed!")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Import a multi-record SDF library into the molecular table.
+
+The file, plain or gzipped, is read in chunks of records, descriptors are
+computed in a process pool and the molecules are written in bulk:
+
+	python sdfimport.py library.sdf.gz --db session/library.db --workers 8
+"""
+
+import os
+import sys
+import gzip
+import time
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+from backend import DataBackend, compress_text
+from costmodel import molecule_information, molfile_descriptors
+from jobstore import MOLECULE_LIGAND
+from scheduler import default_worker_count
+
+__all__ = ['open_library', 'read_sdf_records', 'read_sdf_chunks', 'describe_records',
+	'import_sdf_library', 'SDF_CHUNK_SIZE'
+]
+
+#records per process pool task
+SDF_CHUNK_SIZE = 500
+
+#bytes read from the library at a time
+READ_BLOCK_SIZE = 1 << 20
+
+#chunks read ahead of the writer for every worker, bounds the memory used
+IN_FLIGHT_PER_WORKER = 2
+
+MOLECULAR_FIELDS = ['name', 'type', 'content', 'format', 'atoms', 'bonds', 'hvyatoms',
+	'residues', 'rotors', 'formula', 'energy', 'weight', 'logp'
+]
+
+INSERT_MOLECULE = "INSERT INTO molecular ({}) VALUES ({})".format(
+	','.join(MOLECULAR_FIELDS), ','.join('?' * len(MOLECULAR_FIELDS)))
+
+def open_library(sdf_file):
+	"""Return the raw file and a binary stream of its, maybe gzipped, content
+
+	The position of the raw file is the progress of reading the stream.
+	"""
+	raw = open(sdf_file, 'rb')
+	gzipped = raw.read(2) == b'\x1f\x8b'
+	raw.seek(0)
+	return raw, gzip.GzipFile(fileobj=raw) if gzipped else raw
+
+def read_sdf_records(stream, block_size=READ_BLOCK_SIZE):
+	"""Yield the records of a binary SDF stream as bytes, ending with $$$$"""
+	buf = b''
+
+	#searching blocks for the terminator is much faster than reading lines
+	while True:
+		block = stream.read(block_size)
+
+		if not block:
+			break
+
+		buf += block
+		start = 0
+
+		while True:
+			end = buf.find(b'\n$$$$', start)
+			eol = buf.find(b'\n', end + 5) if end >= 0 else -1
+
+			if eol < 0:
+				break
+
+			yield buf[start:eol + 1]
+			start = eol + 1
+
+		buf = buf[start:]
+
+	#a last record without a terminator
+	if buf.strip():
+		yield buf
+
+def read_sdf_chunks(sdf_file, chunk_size=SDF_CHUNK_SIZE):
+	"""Yield (records, fraction of the file read) chunks of an SDF file"""
+	size = max(1, os.path.getsize(sdf_file))
+	raw, stream = open_library(sdf_file)
+	chunk = []
+
+	try:
+		for record in read_sdf_records(stream):
+			chunk.append(record)
+
+			if len(chunk) == chunk_size:
+				yield chunk, min(1.0, raw.tell() / size)
+				chunk = []
+
+		if chunk:
+			yield chunk, 1.0
+	finally:
+		stream.close()
+		raw.close()
+
+def _record_name(lines, name_prop):
+	if name_prop:
+		tag = '<{}>'.format(name_prop)
+
+		for i, line in enumerate(lines[:-1]):
+			if line.startswith('>') and tag in line:
+				return lines[i + 1].strip()
+
+	return lines[0].strip()
+
+def _describe(text):
+	info = molecule_information(text, 'sdf', from_string=True)
+
+	if info is None:
+		d = molfile_descriptors(text.splitlines())
+		return (d['atoms'], None, d['hvyatoms'], None, d['rotors'], None, None, None, None)
+
+	return (info['atoms'], info['bonds'], info['hvyatoms'], info['residues'], info['rotors'],
+		info['formula'], info['energy'], info['weight'], info['logp'])
+
+def describe_records(records, name_prop=None):
+	"""Return molecular rows of SDF records and the number that failed
+
+	Runs in the worker processes, the content is compressed there too.
+	"""
+	rows = []
+	errors = 0
+
+	for record in records:
+		text = record.decode('utf-8', 'replace')
+
+		try:
+			name = _record_name(text.splitlines(), name_prop)
+			rows.append((name, MOLECULE_LIGAND, compress_text(text), 'sdf') + _describe(text))
+		except Exception:
+			errors += 1
+
+	return rows, errors
+
+def import_sdf_library(sdf_file, db, workers=None, chunk_size=SDF_CHUNK_SIZE, max_in_flight=None,
+	name_prop=None, progress=None):
+	"""Insert the molecules of sdf_file into molecular, returns (imported, failed)
+
+	At most max_in_flight chunks, default two per worker, are read ahead
+	of the database writes, so the memory used does not depend on the
+	size of the library. Chunks are written in file order, one
+	transaction each. progress(imported, fraction) is called after every
+	chunk. With workers=0 the records are described in this process.
+	"""
+	workers = default_worker_count() if workers is None else workers
+	max_in_flight = max_in_flight or max(1, workers) * IN_FLIGHT_PER_WORKER
+	imported = 0
+	failed = 0
+	pending = collections.deque()
+
+	def write_oldest():
+		nonlocal imported, failed
+		future, fraction = pending.popleft()
+		rows, errors = future.result() if workers else future
+		db.insert_rows(INSERT_MOLECULE, rows)
+		imported += len(rows)
+		failed += errors
+
+		if progress:
+			progress(imported, fraction)
+
+	executor = ProcessPoolExecutor(workers) if workers else None
+
+	try:
+		for records, fraction in read_sdf_chunks(sdf_file, chunk_size):
+			if executor:
+				pending.append((executor.submit(describe_records, records, name_prop), fraction))
+			else:
+				pending.append((describe_records(records, name_prop), fraction))
+
+			if len(pending) >= max_in_flight:
+				write_oldest()
+
+		while pending:
+			write_oldest()
+	finally:
+		if executor:
+			executor.shutdown(cancel_futures=True)
+
+	return imported, failed
+
+def get_parser():
+	parser = argparse.ArgumentParser(prog='sdfimport',
+		description="Import an SDF library into the molecular table of a PandaDock database")
+	parser.add_argument('library', help="SDF file, may be gzipped")
+	parser.add_argument('--db', required=True, help="database file to import into")
+	parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+	parser.add_argument('--chunk-size', type=int, default=SDF_CHUNK_SIZE, help="records per task")
+	parser.add_argument('--name-prop', default=None, help="SDF property with the molecule name (default: title line)")
+	return parser
+
+def main(argv=None):
+	opts = get_parser().parse_args(argv)
+	db = DataBackend()
+	db.connect(opts.db)
+	start = time.time()
+
+	def report(imported, fraction):
+		sys.stdout.write("\r{:,d} molecules, {:.1%} of the file".format(imported, fraction))
+		sys.stdout.flush()
+
+	try:
+		imported, failed = import_sdf_library(opts.library, db, opts.workers, opts.chunk_size,
+			name_prop=opts.name_prop, progress=report)
+	finally:
+		db.close()
+
+	print("\nimported {:,d} molecules in {:.1f}s, {:,d} records failed".format(imported, time.time() - start, failed))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
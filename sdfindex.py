@@ -0,0 +1,368 @@
+import os
+import re
+import mmap
+import hashlib
+import itertools
+
+import apsw
+
+__all__ = ['LibraryIndex', 'index_file_of', 'is_library', 'write_records', 'safe_record_name',
+	'INDEX_SUFFIX', 'LIBRARY_FORMATS', 'default_index_directory'
+]
+
+#index files are named after the library, e.g. library.sdf-<path digest>.idx
+INDEX_SUFFIX = '.idx'
+
+#bump when the schema or the record splitting changes, old indexes are rebuilt
+INDEX_VERSION = 1
+
+#values of the first property names seen are cached, if they are short
+CACHED_PROPERTIES = 8
+CACHED_VALUE_LENGTH = 64
+
+#records inserted at a time while building
+INDEX_BATCH_SIZE = 10000
+
+#a data item header line, >  <NAME> (1), and the first line of its value
+DATA_ITEM = re.compile(rb'^>[^<\n]*<([^>\n]*)>[^\n]*\n([^\n]*)', re.M)
+
+INDEX_TABLES = [
+	"CREATE TABLE meta (name TEXT PRIMARY KEY, value)",
+	"CREATE TABLE record (id INTEGER PRIMARY KEY, offset INTEGER, length INTEGER, name TEXT)",
+	"CREATE TABLE property (id INTEGER PRIMARY KEY, name TEXT UNIQUE)",
+	"CREATE TABLE value (rid INTEGER, pid INTEGER, value TEXT, PRIMARY KEY (rid, pid)) WITHOUT ROWID"
+]
+
+INDEX_INDEXES = [
+	"CREATE INDEX record_name ON record (name)"
+]
+
+def _line_end(mm, start):
+	eol = mm.find(b'\n', start)
+	return len(mm) if eol < 0 else eol + 1
+
+def _first_line(mm, start):
+	return mm[start:_line_end(mm, start)].decode('utf-8', 'replace').strip()
+
+def _sdf_records(mm, stem):
+	#records end with a $$$$ line, searched in the map instead of read by line
+	size = len(mm)
+	start = 0
+
+	while start < size:
+		end = mm.find(b'\n$$$$', start)
+
+		if end < 0:
+			#a last record without a terminator
+			if mm[start:size].strip():
+				yield start, size - start, _first_line(mm, start)
+			return
+
+		eol = _line_end(mm, end + 5)
+		yield start, eol - start, _first_line(mm, start)
+		start = eol
+
+def _line_starts(mm, tag):
+	#offsets of the lines starting with tag
+	pos = 0 if mm[:len(tag)] == tag else mm.find(b'\n' + tag)
+
+	while pos >= 0:
+		start = pos if mm[pos:pos + 1] != b'\n' else pos + 1
+		yield start
+		pos = mm.find(b'\n' + tag, start)
+
+def _mol2_records(mm, stem):
+	#a record runs from its @<TRIPOS>MOLECULE line to the next one
+	starts = list(_line_starts(mm, b'@<TRIPOS>MOLECULE'))
+
+	for start, end in zip(starts, starts[1:] + [len(mm)]):
+		yield start, end - start, _first_line(mm, _line_end(mm, start))
+
+def _pdb_records(mm, stem):
+	#MODEL ... ENDMDL blocks, a file without MODEL lines is a single record
+	starts = list(_line_starts(mm, b'MODEL'))
+
+	if not starts:
+		if mm[:].strip():
+			yield 0, len(mm), stem
+		return
+
+	for i, start in enumerate(starts):
+		end = mm.find(b'ENDMDL', start)
+		end = len(mm) if end < 0 else _line_end(mm, end)
+
+		if i + 1 < len(starts):
+			end = min(end, starts[i + 1])
+
+		serial = _first_line(mm, start)[5:].strip() or str(i + 1)
+		yield start, end - start, "{}_{}".format(stem, serial)
+
+LIBRARY_FORMATS = {
+	'.sdf': _sdf_records,
+	'.mol': _sdf_records,
+	'.mol2': _mol2_records,
+	'.pdb': _pdb_records,
+	'.pdbqt': _pdb_records
+}
+
+def _splitter(library):
+	ext = os.path.splitext(library)[1].lower()
+
+	if ext not in LIBRARY_FORMATS:
+		raise ValueError("cannot index {} files".format(ext or 'extensionless'))
+
+	return LIBRARY_FORMATS[ext]
+
+def _map_library(fh):
+	if fh.read(2) == b'\x1f\x8b':
+		raise ValueError("cannot index a gzipped library, offsets need the plain file")
+
+	if os.fstat(fh.fileno()).st_size == 0:
+		return b''
+
+	return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _sdf_properties(block):
+	#(name, value) of the data items after M  END, value is its first line
+	items = DATA_ITEM.findall(block, max(0, block.find(b'M  END')))
+	return [(name.decode('utf-8', 'replace'), value.rstrip(b'\r').decode('utf-8', 'replace')) for name, value in items]
+
+def _insert_records(conn, records, mm=None):
+	#with the map of an SDF library its data items are indexed too
+	properties = {}
+	rows = []
+	values = []
+
+	for rid, (offset, length, name) in enumerate(records, 1):
+		rows.append((rid, offset, length, name))
+
+		if mm is not None:
+			for prop, value in _sdf_properties(mm[offset:offset + length]):
+				pid = properties.setdefault(prop, len(properties) + 1)
+
+				if pid <= CACHED_PROPERTIES and len(value) <= CACHED_VALUE_LENGTH:
+					values.append((rid, pid, value))
+
+		if len(rows) >= INDEX_BATCH_SIZE:
+			conn.executemany("INSERT INTO record VALUES (?,?,?,?)", rows)
+			conn.executemany("INSERT OR IGNORE INTO value VALUES (?,?,?)", values)
+			rows = []
+			values = []
+
+	conn.executemany("INSERT INTO record VALUES (?,?,?,?)", rows)
+	conn.executemany("INSERT OR IGNORE INTO value VALUES (?,?,?)", values)
+	conn.executemany("INSERT INTO property VALUES (?,?)", [(pid, prop) for prop, pid in properties.items()])
+
+def default_index_directory():
+	#kept out of the ligand folders, which are handed to pandadock --screen
+	return os.environ.get('PANDADOCK_INDEX_DIR',
+		os.path.join(os.path.expanduser('~'), '.pandadock', 'index'))
+
+def index_file_of(library, directory=None):
+	path = os.path.abspath(library)
+	digest = hashlib.sha1(path.encode()).hexdigest()[:16]
+	return os.path.join(directory or default_index_directory(),
+		"{}-{}{}".format(os.path.basename(path), digest, INDEX_SUFFIX))
+
+def is_library(library):
+	"""Return True if library holds more than one record
+
+	Only the start of the file is searched, so a folder of single
+	ligand files can be checked without indexing each of them.
+	"""
+	with open(library, 'rb') as fh:
+		mm = _map_library(fh)
+
+		try:
+			stem = os.path.splitext(os.path.basename(library))[0]
+			return next(itertools.islice(_splitter(library)(mm, stem), 1, None), None) is not None
+		finally:
+			if mm:
+				mm.close()
+
+def safe_record_name(name):
+	return "".join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+def write_records(records):
+	"""Write (library, offset, length, target) byte ranges to their target files
+
+	Used to materialize the ligands of a job from offsets just before it
+	starts, a library is opened once for all its records.
+	"""
+	records = sorted(records, key=lambda r: (r[0], r[1]))
+
+	for library, group in itertools.groupby(records, key=lambda r: r[0]):
+		with open(library, 'rb') as fh:
+			for _, offset, length, target in group:
+				fh.seek(offset)
+
+				with open(target, 'wb') as fw:
+					fw.write(fh.read(length))
+
+class LibraryIndex:
+	"""Byte offsets, names and properties of the records of a library file
+
+	The index is a small SQLite file in default_index_directory(), built
+	in one pass over the memory mapped library. Records are SDF/MOL blocks
+	ending with $$$$, mol2 molecules or PDB/PDBQT models. Any record is
+	read by index or name with one lookup and one slice of the map, so
+	the GUI can list and open the members of a library of millions of
+	molecules without parsing it, and the scheduler hands out offsets
+	instead of split files.
+
+	For SDF files the names of all data items are kept, and the values of
+	the first CACHED_PROPERTIES names if shorter than CACHED_VALUE_LENGTH.
+	open() rebuilds the index when the library changed size or mtime.
+	Gzipped libraries cannot be indexed, ValueError is raised.
+	"""
+
+	def __init__(self, library, index_file=None):
+		self.library = library
+		self.index_file = index_file or index_file_of(library)
+		self.conn = None
+		self.fh = None
+		self.mm = None
+
+	@classmethod
+	def open(cls, library, index_file=None):
+		index = cls(library, index_file)
+
+		if index.stale():
+			index.build()
+
+		index.connect()
+		return index
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def __len__(self):
+		return self.conn.execute("SELECT COUNT(1) FROM record").fetchone()[0]
+
+	def _signature(self):
+		st = os.stat(self.library)
+		return {'version': INDEX_VERSION, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+	def stale(self):
+		if not os.path.exists(self.index_file):
+			return True
+
+		try:
+			conn = apsw.Connection(self.index_file, flags=apsw.SQLITE_OPEN_READONLY)
+
+			try:
+				meta = dict(conn.execute("SELECT name, value FROM meta"))
+			finally:
+				conn.close()
+		except apsw.Error:
+			return True
+
+		return any(meta.get(k) != v for k, v in self._signature().items())
+
+	def build(self):
+		"""Index the library, written to a temporary file and renamed when done"""
+		splitter = _splitter(self.library)
+		stem = os.path.splitext(os.path.basename(self.library))[0]
+		signature = self._signature()
+		temp_file = self.index_file + '.tmp'
+
+		with open(self.library, 'rb') as fh:
+			mm = _map_library(fh)
+
+			if os.path.exists(temp_file):
+				os.remove(temp_file)
+
+			os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+
+			conn = apsw.Connection(temp_file)
+
+			try:
+				conn.execute("PRAGMA journal_mode=OFF")
+				conn.execute("PRAGMA synchronous=OFF")
+
+				for sql in INDEX_TABLES:
+					conn.execute(sql)
+
+				with conn:
+					_insert_records(conn, splitter(mm, stem), mm if splitter is _sdf_records else None)
+					conn.executemany("INSERT INTO meta VALUES (?,?)", signature.items())
+
+				for sql in INDEX_INDEXES:
+					conn.execute(sql)
+			finally:
+				conn.close()
+
+				if mm:
+					mm.close()
+
+		os.replace(temp_file, self.index_file)
+
+	def connect(self):
+		self.conn = apsw.Connection(self.index_file, flags=apsw.SQLITE_OPEN_READONLY)
+		self.fh = open(self.library, 'rb')
+		self.mm = _map_library(self.fh)
+
+	def close(self):
+		if self.mm:
+			self.mm.close()
+
+		if self.fh:
+			self.fh.close()
+
+		if self.conn:
+			self.conn.close()
+
+		self.conn = self.fh = self.mm = None
+
+	def span(self, i):
+		"""Return (offset, length) of record i"""
+		row = self.conn.execute("SELECT offset, length FROM record WHERE id=?", (i + 1,)).fetchone()
+
+		if row is None:
+			raise IndexError("record {} not in {}".format(i, self.library))
+
+		return row
+
+	def spans(self):
+		"""Yield (index, offset, length, name) of all records in file order"""
+		for rid, offset, length, name in self.conn.execute("SELECT id, offset, length, name FROM record ORDER BY id"):
+			yield rid - 1, offset, length, name
+
+	def names(self, start=0, count=-1):
+		return [row[0] for row in self.conn.execute(
+			"SELECT name FROM record WHERE id>? ORDER BY id LIMIT ?", (start, count))]
+
+	def find(self, name):
+		"""Return the index of the first record named name or None"""
+		row = self.conn.execute("SELECT id FROM record WHERE name=? ORDER BY id LIMIT 1", (name,)).fetchone()
+		return None if row is None else row[0] - 1
+
+	def read_bytes(self, i):
+		offset, length = self.span(i)
+		return self.mm[offset:offset + length]
+
+	def read(self, i):
+		return self.read_bytes(i).decode('utf-8', 'replace')
+
+	def read_name(self, name):
+		i = self.find(name)
+
+		if i is None:
+			raise KeyError(name)
+
+		return self.read(i)
+
+	def property_names(self):
+		return [row[0] for row in self.conn.execute("SELECT name FROM property ORDER BY id")]
+
+	def properties(self, i):
+		"""Return {name: first line of value} of the data items of record i"""
+		return dict(_sdf_properties(self.read_bytes(i)))
+
+	def cached_properties(self, i):
+		"""Return the cached property values of record i without reading it"""
+		return dict(self.conn.execute("SELECT p.name, v.value FROM value AS v "
+			"JOIN property AS p ON p.id=v.pid WHERE v.rid=? ORDER BY v.pid", (i + 1,)))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Library Index Test for PandaDOCK
+Verifies records of SDF, mol2 and PDB libraries are read by offset from a library index
+"""
+
+import os
+import gzip
+import tempfile
+
+from costmodel import CostModel
+from scheduler import DockingScheduler
+from sdfindex import LibraryIndex, is_library, index_file_of, INDEX_SUFFIX
+from sharding import create_shard_jobs, expand_libraries, item_costs, LibraryRecord
+
+# indexes of the test libraries are not kept in the user index directory
+INDEX_DIRECTORY = tempfile.TemporaryDirectory()
+os.environ["PANDADOCK_INDEX_DIR"] = INDEX_DIRECTORY.name
+
+RECORD = """{name}
+  PandaDock
+
+  1  0  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+M  END
+>  <ID>
+ID-{index}
+
+>  <SMILES>
+C
+
+$$$$
+"""
+
+PROPANE = """propane
+  PandaDock
+
+  3  2  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    1.5000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    3.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0
+  2  3  1  0
+M  END
+$$$$
+"""
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def write_library(path, count):
+    text = "".join(RECORD.format(name="lig{}".format(i), index=i) for i in range(count))
+    with open(path, "w") as fw:
+        fw.write(text)
+    return text
+
+
+def test_records_by_index_and_name():
+    """Any record is read by index or name without parsing the library"""
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "library.sdf")
+        write_library(path, 50)
+
+        with LibraryIndex.open(path) as index:
+            assert len(index) == 50
+            assert os.path.exists(index_file_of(path))
+            assert not any(f.endswith(INDEX_SUFFIX) for f in os.listdir(workdir))
+            assert index.read(37) == RECORD.format(name="lig37", index=37)
+            assert index.read_name("lig12") == RECORD.format(name="lig12", index=12)
+            assert index.find("missing") is None
+            assert index.names(48) == ["lig48", "lig49"] and index.names(0, 2) == ["lig0", "lig1"]
+            assert index.property_names() == ["ID", "SMILES"]
+            assert index.properties(5) == {"ID": "ID-5", "SMILES": "C"}
+            assert index.cached_properties(5) == {"ID": "ID-5", "SMILES": "C"}
+
+        assert is_library(path)
+        single = os.path.join(workdir, "single.sdf")
+        write_library(single, 1)
+        assert not is_library(single)
+
+
+def test_index_is_rebuilt_when_library_changes():
+    """A stale index is rebuilt, a gzipped library cannot be indexed"""
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "library.sdf")
+        write_library(path, 3)
+        LibraryIndex.open(path).close()
+
+        with open(path, "a") as fw:
+            fw.write("last\n\n\n  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n")
+
+        with LibraryIndex.open(path) as index:
+            assert len(index) == 4
+            assert index.read(3).startswith("last\n")
+
+        packed = os.path.join(workdir, "packed.sdf")
+        with gzip.open(packed, "wt") as fw:
+            fw.write(RECORD.format(name="a", index=0))
+        try:
+            LibraryIndex.open(packed)
+            assert False, "gzipped libraries are not indexed"
+        except ValueError:
+            pass
+
+
+def test_mol2_and_pdb_models():
+    """mol2 molecules and PDB models are records too"""
+    with tempfile.TemporaryDirectory() as workdir:
+        mol2 = os.path.join(workdir, "library.mol2")
+        with open(mol2, "w") as fw:
+            fw.write("# header\n@<TRIPOS>MOLECULE\nfirst\n 1 0\n@<TRIPOS>MOLECULE\nsecond\n 1 0\n")
+        with LibraryIndex.open(mol2) as index:
+            assert index.names() == ["first", "second"]
+            assert index.read(1) == "@<TRIPOS>MOLECULE\nsecond\n 1 0\n"
+
+        pdb = os.path.join(workdir, "poses.pdbqt")
+        with open(pdb, "w") as fw:
+            fw.write("MODEL 1\nATOM\nENDMDL\nMODEL 2\nATOM\nENDMDL\n")
+        with LibraryIndex.open(pdb) as index:
+            assert index.names() == ["poses_1", "poses_2"]
+            assert index.read(1) == "MODEL 2\nATOM\nENDMDL\n"
+
+
+def test_shards_get_offsets_instead_of_split_files():
+    """Library records are balanced over shards and written when a shard starts"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        ligands = os.path.join(output_directory, "Ligand")
+        os.makedirs(ligands)
+        library = os.path.join(ligands, "library.sdf")
+        write_library(library, 10)
+        write_library(os.path.join(ligands, "single.sdf"), 1)
+
+        items = expand_libraries([library, os.path.join(ligands, "single.sdf")])
+        assert len(items) == 11 and isinstance(items[0], LibraryRecord)
+
+        scheduler = RecordingScheduler(max_workers=2)
+        jobs = create_shard_jobs(scheduler, ["--mode", "fast"], ligands, "rec.pdb", output_directory, None, 2)
+        assert len(jobs) == 2
+        assert sum(len(job.records) for job in jobs) == 10
+
+        targets = [target for job in jobs for _, _, _, target in job.records]
+        assert not any(os.path.exists(target) for target in targets)
+
+        scheduler.submit_many(jobs)
+        scheduler.start()
+        assert all(os.path.exists(target) for target in targets)
+        assert all(job.records is None for job in jobs)
+
+        lig3 = [target for target in targets if os.path.basename(target) == "lig3.sdf"]
+        with open(lig3[0]) as fh:
+            assert fh.read() == RECORD.format(name="lig3", index=3)
+
+
+def test_record_cost_uses_the_cost_model():
+    """Records are costed in predicted seconds like ligand files, not in bytes"""
+    with tempfile.TemporaryDirectory() as workdir:
+        library = os.path.join(workdir, "library.sdf")
+        methane = RECORD.format(name="methane", index=0).replace("$$$$", ">  <PADDING>\n" + "x" * 500 + "\n\n$$$$")
+        with open(library, "w") as fw:
+            fw.write(methane + PROPANE)
+        single = os.path.join(workdir, "propane.sdf")
+        with open(single, "w") as fw:
+            fw.write(PROPANE)
+
+        items = expand_libraries([library, single])
+        assert item_costs(items)[items[0]] > item_costs(items)[items[1]]
+
+        cost_model = CostModel()
+        costs = item_costs(items, cost_model)
+        assert costs[items[0]] < costs[items[1]]
+        assert costs[items[1]] == cost_model.predict_molfile(PROPANE)
+        assert costs[single] == cost_model.predict_file(single) == costs[items[1]]
+
+
+if __name__ == "__main__":
+    test_records_by_index_and_name()
+    test_index_is_rebuilt_when_library_changes()
+    test_mol2_and_pdb_models()
+    test_shards_get_offsets_instead_of_split_files()
+    test_record_cost_uses_the_cost_model()
+    print("✓ All library index tests passed!")
@@ -23,6 +23,13 @@ setup(
     long_description_content_type='text/markdown',
     url='https://github.com/pritampanda15/PandaDockGUI',
     packages=find_packages(),
+    # The application is a set of top-level modules, not a package
+    py_modules=[
+        'PandaDOCK', 'MolKit_mock', 'backend', 'batch', 'catalog', 'costmodel', 'db_benchmark',
+        'db_compress', 'gridbox', 'ingest', 'interactions', 'joblog', 'jobstore', 'ligprep',
+        'molcache', 'plugins', 'posebrowser', 'progress', 'resultcache', 'scheduler', 'sdfimport',
+        'sdfindex', 'sharding', 'snapshot', 'styles', 'utils', 'view',
+    ],
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Science/Research',
@@ -40,6 +47,7 @@ setup(
     entry_points={
         'console_scripts': [
             'pandadock=PandaDOCK:main',
+            'pandadock-gui-batch=batch:main',
         ],
     },
     include_package_data=True,
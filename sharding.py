@@ -0,0 +1,294 @@
+import os
+import csv
+import shutil
+import collections
+
+from sdfindex import LibraryIndex, is_library, safe_record_name
+from joblog import JOB_LOG_NAME
+
+__all__ = ['split_library', 'create_shard_jobs', 'merge_shards', 'list_ligand_files',
+	'expand_libraries', 'item_costs', 'LibraryRecord', 'read_shard_records', 'list_shard_outputs', 'ShardOutput'
+]
+
+LIGAND_EXTENSIONS = ('.sdf', '.mol')
+
+SHARD_FOLDER = 'shards'
+
+#per-shard reports and plots, pandadock renders them from the rows of one shard only
+SHARD_REPORTS_FOLDER = 'shard_reports'
+
+#library byte ranges of a shard, kept next to its ligands folder for resume
+RECORDS_NAME = 'records.csv'
+
+#score columns pandadock writes, lower is better
+SCORE_COLUMNS = ['score', 'energy', 'affinity', 'binding_affinity', 'docking_score']
+
+#rank columns, renumbered after the shard rows are sorted together
+RANK_COLUMNS = ['rank', 'ranking', 'ligand_rank']
+
+#a record of a multi-record library, read by offset when its shard starts
+LibraryRecord = collections.namedtuple('LibraryRecord', ['library', 'offset', 'length', 'name'])
+
+#what merge_shards needs of a shard job, also for shards finished before a resume
+ShardOutput = collections.namedtuple('ShardOutput', ['name', 'output'])
+
+def list_ligand_files(ligand_folder):
+	return [
+		os.path.join(ligand_folder, f) for f in sorted(os.listdir(ligand_folder))
+		if f.lower().endswith(LIGAND_EXTENSIONS)
+	]
+
+def split_library(ligand_files, shards, cost=os.path.getsize):
+	"""Split ligands into balanced shards, longest processing time first
+
+	Each ligand goes to the shard with the smallest accumulated cost,
+	cost defaults to the file size.
+	"""
+	shards = max(1, min(shards, len(ligand_files)))
+	buckets = [[] for _ in range(shards)]
+	loads = [0] * shards
+
+	for ligand in sorted(ligand_files, key=cost, reverse=True):
+		i = loads.index(min(loads))
+		buckets[i].append(ligand)
+		loads[i] += cost(ligand)
+
+	return [bucket for bucket in buckets if bucket]
+
+def expand_libraries(ligand_files):
+	"""Replace multi-record SDF libraries by LibraryRecord items of their records
+
+	The records come from the index of the library, which is
+	built on first use. Single ligand and gzipped files are kept as is.
+	"""
+	items = []
+
+	for ligand in ligand_files:
+		try:
+			library = ligand.lower().endswith('.sdf') and is_library(ligand)
+		except ValueError:
+			library = False
+
+		if not library:
+			items.append(ligand)
+			continue
+
+		with LibraryIndex.open(ligand) as index:
+			items.extend(LibraryRecord(ligand, offset, length, name)
+				for _, offset, length, name in index.spans())
+
+	return items
+
+def link_or_copy(src, dst):
+	try:
+		os.link(src, dst)
+	except OSError:
+		shutil.copy(src, dst)
+
+def item_costs(items, cost_model=None):
+	"""Return {item: cost} of ligand files and LibraryRecord items
+
+	With a costmodel.CostModel the cost is the predicted docking time,
+	records are read by offset and described from their text. Without
+	one it is the size in bytes.
+	"""
+	costs = {}
+	libraries = {}
+
+	try:
+		for item in items:
+			if not isinstance(item, LibraryRecord):
+				costs[item] = cost_model.predict_file(item) if cost_model else os.path.getsize(item)
+			elif cost_model is None:
+				costs[item] = item.length
+			else:
+				if item.library not in libraries:
+					libraries[item.library] = open(item.library, 'rb')
+
+				fh = libraries[item.library]
+				fh.seek(item.offset)
+				costs[item] = cost_model.predict_molfile(fh.read(item.length).decode('utf-8', 'replace'))
+	finally:
+		for fh in libraries.values():
+			fh.close()
+
+	return costs
+
+def create_shard_jobs(scheduler, args, ligand_folder, protein_file, output_directory, center=None, shards=2, cost_model=None):
+	"""Create one --screen job per shard under output_N/shards/shard_K
+
+	Ligand files are linked into the shard folders. Libraries are not
+	split here, their records are balanced with the ligand files by
+	item_costs and each job gets the offsets of its records, written to
+	its folder when it starts.
+	"""
+	jobs = []
+	items = expand_libraries(list_ligand_files(ligand_folder))
+	buckets = split_library(items, shards, item_costs(items, cost_model).__getitem__)
+
+	for i, bucket in enumerate(buckets, 1):
+		shard_dir = os.path.join(output_directory, SHARD_FOLDER, 'shard_{}'.format(i))
+		shard_ligands = os.path.join(shard_dir, 'ligands')
+
+		if os.path.exists(shard_dir):
+			shutil.rmtree(shard_dir)
+
+		os.makedirs(shard_ligands)
+		used = set()
+		records = []
+
+		for ligand in bucket:
+			if not isinstance(ligand, LibraryRecord):
+				used.add(os.path.basename(ligand))
+				link_or_copy(ligand, os.path.join(shard_ligands, os.path.basename(ligand)))
+
+		for n, record in enumerate(r for r in bucket if isinstance(r, LibraryRecord)):
+			#same file names as batch.split_sdf, duplicates get the position
+			name = safe_record_name(record.name) or 'record'
+			ext = os.path.splitext(record.library)[1]
+
+			if name + ext in used:
+				name = '{}_{}'.format(name, n + 1)
+
+			used.add(name + ext)
+			records.append((record.library, record.offset, record.length, os.path.join(shard_ligands, name + ext)))
+
+		if records:
+			with open(os.path.join(shard_dir, RECORDS_NAME), 'w', newline='') as fw:
+				csv.writer(fw).writerows(records)
+
+		job = scheduler.create_screening_job(args, shard_ligands, protein_file,
+			os.path.join(shard_dir, 'output'), center)
+		job.name = 'shard_{}'.format(i)
+		job.records = records
+		jobs.append(job)
+
+	return jobs
+
+def read_shard_records(shard_ligands):
+	"""Return the library records of a shard created by create_shard_jobs"""
+	records_file = os.path.join(os.path.dirname(shard_ligands), RECORDS_NAME)
+
+	if not os.path.exists(records_file):
+		return []
+
+	with open(records_file, newline='') as fh:
+		return [(library, int(offset), int(length), target) for library, offset, length, target in csv.reader(fh)]
+
+def list_shard_outputs(output_directory):
+	"""Return a ShardOutput of every shard folder of a sharded run"""
+	shard_root = os.path.join(output_directory, SHARD_FOLDER)
+
+	if not os.path.isdir(shard_root):
+		return []
+
+	return [
+		ShardOutput(entry.name, os.path.join(entry.path, 'output'))
+		for entry in sorted(os.scandir(shard_root), key=lambda e: e.name) if entry.is_dir()
+	]
+
+def get_score_column(fields):
+	lowered = [f.lower() for f in fields]
+
+	for name in SCORE_COLUMNS:
+		if name in lowered:
+			return fields[lowered.index(name)]
+
+	for field in fields:
+		if 'score' in field.lower() or 'energy' in field.lower():
+			return field
+
+def get_rank_column(fields):
+	lowered = [f.lower() for f in fields]
+
+	for name in RANK_COLUMNS:
+		if name in lowered:
+			return fields[lowered.index(name)]
+
+def to_float(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return float('inf')
+
+def merge_tables(output_directory, shard_outputs, name):
+	rows = []
+	fields = None
+
+	for shard_output in shard_outputs:
+		table = os.path.join(shard_output, name)
+
+		if not os.path.exists(table):
+			continue
+
+		with open(table, newline='') as fh:
+			reader = csv.DictReader(fh)
+
+			if fields is None:
+				fields = reader.fieldnames
+			else:
+				fields = fields + [f for f in reader.fieldnames if f not in fields]
+
+			rows.extend(reader)
+
+	if fields is None:
+		return
+
+	score = get_score_column(fields)
+
+	if score:
+		rows.sort(key=lambda r: to_float(r.get(score)))
+		rank = get_rank_column(fields)
+
+		#every shard ranked its own rows from 1
+		if rank:
+			for i, row in enumerate(rows, 1):
+				row[rank] = str(i)
+
+	with open(os.path.join(output_directory, name), 'w', newline='') as fw:
+		writer = csv.DictWriter(fw, fieldnames=fields, restval='')
+		writer.writeheader()
+
+		writer.writerows(rows)
+
+def merge_shards(output_directory, jobs):
+	"""Merge the complete shard outputs into output_directory, return the skipped shards
+
+	Score tables (CSV) are concatenated and re-ranked, pose folders and
+	other sub-directories are merged file by file. Summary plots and the
+	HTML report only cover the rows of their shard, they are kept under
+	SHARD_REPORTS_FOLDER/shard_K instead of passing for the whole run.
+	Failed, cancelled and unfinished shards have no COMPLETE_MARKER and
+	are left out.
+	"""
+	#jobstore imports this module for read_shard_records
+	from jobstore import COMPLETE_MARKER, is_output_complete
+
+	complete = [job for job in jobs if os.path.isdir(job.output) and is_output_complete(job.output)]
+	skipped = [job.name for job in jobs if job not in complete]
+	shard_outputs = [job.output for job in complete]
+	ignored = (COMPLETE_MARKER, JOB_LOG_NAME)
+	tables = set()
+
+	for shard_output in shard_outputs:
+		for entry in os.scandir(shard_output):
+			if entry.is_file() and entry.name.lower().endswith('.csv'):
+				tables.add(entry.name)
+
+	for name in sorted(tables):
+		merge_tables(output_directory, shard_outputs, name)
+
+	for job in complete:
+		for entry in os.scandir(job.output):
+			if entry.name in ignored or entry.name in tables:
+				continue
+
+			if entry.is_dir():
+				shutil.copytree(entry.path, os.path.join(output_directory, entry.name),
+					ignore=shutil.ignore_patterns(*ignored), dirs_exist_ok=True)
+			else:
+				reports = os.path.join(output_directory, SHARD_REPORTS_FOLDER, job.name)
+				os.makedirs(reports, exist_ok=True)
+				shutil.copy(entry.path, os.path.join(reports, entry.name))
+
+	return skipped
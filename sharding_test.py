@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Sharding Test for PandaDOCK
+Verifies library splitting and merging of parallel --screen outputs
+"""
+
+import os
+import csv
+import tempfile
+
+from scheduler import DockingScheduler
+from jobstore import COMPLETE_MARKER, mark_output_complete
+from joblog import JOB_LOG_NAME
+from sharding import split_library, create_shard_jobs, merge_shards, SHARD_REPORTS_FOLDER
+
+
+class RecordingScheduler(DockingScheduler):
+    def launch(self, job):
+        pass
+
+
+def test_split_library_is_balanced():
+    """Shards get a similar total cost"""
+    costs = {"l{}".format(i): c for i, c in enumerate([9, 8, 7, 6, 5, 4, 3, 2, 1])}
+    shards = split_library(list(costs), 3, cost=costs.get)
+
+    assert len(shards) == 3
+    loads = [sum(costs[l] for l in shard) for shard in shards]
+    assert sum(loads) == 45
+    assert max(loads) - min(loads) <= 2
+    assert split_library(["a"], 4, cost=len) == [["a"]]
+
+
+def test_merge_shards():
+    """Score tables are merged and re-ranked, poses folders are combined, incomplete shards are skipped"""
+    with tempfile.TemporaryDirectory() as output_directory:
+        ligands = os.path.join(output_directory, "Ligand")
+        os.makedirs(ligands)
+        for i in range(6):
+            with open(os.path.join(ligands, "lig{}.sdf".format(i)), "w") as fw:
+                fw.write("x" * (i + 1))
+
+        scheduler = RecordingScheduler(max_workers=3)
+        jobs = create_shard_jobs(scheduler, ["--mode", "fast"], ligands, "rec.pdb", output_directory, None, 3)
+        assert len(jobs) == 3
+        assert jobs[0].arguments[jobs[0].arguments.index("--screen") + 1].endswith("ligands")
+
+        for n, job in enumerate(jobs):
+            os.makedirs(os.path.join(job.output, "poses"))
+            with open(os.path.join(job.output, "poses", "{}.pdb".format(job.name)), "w") as fw:
+                fw.write("END\n")
+            with open(os.path.join(job.output, "results.csv"), "w") as fw:
+                fw.write("Rank,ligand,score\n1,{0}a,{1}\n2,{0}b,{2}\n".format(job.name, -5 - n, -1 - n))
+            with open(os.path.join(job.output, "master_publication.png"), "w") as fw:
+                fw.write(job.name)
+            with open(os.path.join(job.output, JOB_LOG_NAME), "w") as fw:
+                fw.write("log\n")
+            if n < 2:
+                mark_output_complete(job.output)
+
+        skipped = merge_shards(output_directory, jobs)
+
+        with open(os.path.join(output_directory, "results.csv")) as fh:
+            rows = list(csv.DictReader(fh))
+
+        assert [r["score"] for r in rows] == ["-6", "-5", "-2", "-1"]
+        assert [r["Rank"] for r in rows] == ["1", "2", "3", "4"]
+        assert skipped == ["shard_3"]
+        assert sorted(os.listdir(os.path.join(output_directory, "poses"))) == ["shard_1.pdb", "shard_2.pdb"]
+        assert not os.path.exists(os.path.join(output_directory, "master_publication.png"))
+        assert not os.path.exists(os.path.join(output_directory, COMPLETE_MARKER))
+        assert not os.path.exists(os.path.join(output_directory, JOB_LOG_NAME))
+        reports = os.path.join(output_directory, SHARD_REPORTS_FOLDER)
+        assert sorted(os.listdir(reports)) == ["shard_1", "shard_2"]
+        with open(os.path.join(reports, "shard_2", "master_publication.png")) as fh:
+            assert fh.read() == "shard_2"
+        assert os.listdir(os.path.join(reports, "shard_1")) == ["master_publication.png"]
+
+
+if __name__ == "__main__":
+    test_split_library_is_balanced()
+    test_merge_shards()
+    print("✓ All sharding tests passed!")
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+
+import apsw
+
+__all__ = ['SnapshotService', 'SNAPSHOT_STEP_PAGES']
+
+#pages copied per backup step, 1024 pages of 4 KB take a few milliseconds
+SNAPSHOT_STEP_PAGES = 1024
+
+class SnapshotService:
+	"""Copy a DataBackend to a snapshot file in a background thread
+
+	The backup is stepped step_pages at a time and the thread sleeps
+	pause seconds between steps, so the GUI thread and writers get the
+	database in between instead of waiting for the whole copy. The copy
+	is written next to target and renamed when it is complete, a reader
+	never sees a half written snapshot.
+
+	With interval the service keeps running and takes a snapshot every
+	interval seconds, skipped while the database is unchanged, and a
+	pooled database gets a passive WAL checkpoint every round, so the
+	connections that write never pay for checkpoints. target may be None
+	to only checkpoint. progress is a fraction read by the caller, e.g.
+	from a timer of the GUI thread, and on_done(error) is called from
+	the service thread after every snapshot.
+	"""
+
+	def __init__(self, db, target=None, interval=None, step_pages=SNAPSHOT_STEP_PAGES, pause=0.005, on_done=None):
+		self.db = db
+		self.target = target
+		self.interval = interval
+		self.step_pages = step_pages
+		self.pause = pause
+		self.on_done = on_done
+		self.progress = 0.0
+		self.snapshots = 0
+		self.checkpoints = 0
+		self.error = None
+		self.version = None
+		self.wakeup = threading.Event()
+		self.stopping = False
+		self.thread = None
+
+	@property
+	def running(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def start(self):
+		self.stopping = False
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def stop(self, wait=True):
+		self.stopping = True
+		self.wakeup.set()
+
+		if wait and self.thread is not None:
+			self.thread.join()
+
+	def snapshot_now(self):
+		"""Take the next periodic snapshot without waiting for the interval"""
+		self.version = None
+		self.wakeup.set()
+
+	def data_version(self):
+		#data_version changes on commits of other connections, total_changes on our own
+		conn = self.db.conn
+		return (self.db.get_one("PRAGMA data_version"), conn.total_changes())
+
+	def snapshot(self):
+		"""Copy the database to target, returns False if stopped halfway"""
+		partial = self.target + '.partial'
+		connection = apsw.Connection(partial)
+
+		#a read transaction pins the WAL snapshot, commits of other
+		#connections would otherwise restart the backup
+		pinned = self.db.pool
+
+		if pinned:
+			self.db.query("BEGIN")
+			self.db.get_one("SELECT COUNT(1) FROM sqlite_master")
+
+		try:
+			with connection.backup('main', self.db.conn, 'main') as backup:
+				while not backup.done:
+					if self.stopping:
+						return False
+
+					backup.step(self.step_pages)
+
+					if backup.pagecount:
+						self.progress = 1 - backup.remaining / backup.pagecount
+
+					time.sleep(self.pause)
+		finally:
+			connection.close()
+
+			if pinned:
+				self.db.query("COMMIT")
+
+		os.replace(partial, self.target)
+		self.progress = 1.0
+		self.snapshots += 1
+		return True
+
+	def checkpoint(self):
+		if self.db.pool:
+			self.db.query("PRAGMA wal_checkpoint(PASSIVE)")
+			self.checkpoints += 1
+
+	def run_once(self):
+		version = self.data_version()
+		self.error = None
+
+		try:
+			if self.target and version != self.version:
+				self.progress = 0.0
+
+				if self.snapshot():
+					self.version = version
+
+			self.checkpoint()
+		except (apsw.Error, OSError) as e:
+			self.error = e
+
+		if self.on_done and not self.stopping:
+			self.on_done(self.error)
+
+	def run(self):
+		while not self.stopping:
+			self.run_once()
+
+			if self.interval is None:
+				break
+
+			self.wakeup.wait(self.interval)
+			self.wakeup.clear()
+
+		self.db.release()
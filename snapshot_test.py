@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Snapshot Test for PandaDOCK
+Verifies databases are saved in steps and checkpointed in the background
+"""
+
+import os
+import time
+import tempfile
+
+from backend import DataBackend
+from snapshot import SnapshotService
+
+INSERT_POSE = "INSERT INTO pose (jid, run, complex) VALUES (?,?,?)"
+
+
+def filled_db(path, count=2000, pool=False):
+    db = DataBackend()
+    db.connect(path, pool=pool)
+    db.insert_rows(INSERT_POSE, [(i, 1, "x" * 500) for i in range(count)])
+    return db
+
+
+def pose_count(db_file):
+    db = DataBackend()
+    db.connect(db_file)
+    count = db.get_count("pose")
+    db.close()
+    return count
+
+
+def test_save_in_steps():
+    """save reports progress after every step of the copy"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db = filled_db(":memory:")
+        fractions = []
+        db.save(os.path.join(workdir, "copy.db"), step_pages=50, progress=fractions.append)
+        assert len(fractions) > 3 and fractions == sorted(fractions) and fractions[-1] == 1.0
+        assert pose_count(os.path.join(workdir, "copy.db")) == 2000
+        db.close()
+
+
+def test_snapshot_while_writing():
+    """The snapshot thread copies a pooled database while it is written"""
+    with tempfile.TemporaryDirectory() as workdir:
+        target = os.path.join(workdir, "snapshot.db")
+        db = filled_db(os.path.join(workdir, "pandadock.db"), pool=True)
+        done = []
+        service = SnapshotService(db, target, step_pages=20, on_done=done.append)
+        service.start()
+        run = 2
+        while service.running:
+            db.query(INSERT_POSE, (0, run, "y"))
+            run += 1
+        service.thread.join()
+
+        assert done == [None]
+        assert service.progress == 1.0 and service.checkpoints == 1
+        assert pose_count(target) >= 2000
+        assert not os.path.exists(target + ".partial")
+        assert len(db.connections) == 1
+        db.close()
+
+
+def test_periodic_snapshots_skip_unchanged():
+    """A new snapshot is only taken after the database changed"""
+    with tempfile.TemporaryDirectory() as workdir:
+        target = os.path.join(workdir, "snapshot.db")
+        db = filled_db(os.path.join(workdir, "pandadock.db"), count=10, pool=True)
+        service = SnapshotService(db, target, interval=0.05)
+        service.start()
+        time.sleep(0.3)
+        assert service.snapshots == 1 and service.checkpoints > 1
+
+        db.query(INSERT_POSE, (0, 2, "y"))
+        deadline = time.time() + 5
+        while pose_count(target) < 11 and time.time() < deadline:
+            time.sleep(0.02)
+        service.stop()
+
+        assert not service.running
+        assert pose_count(target) == 11 and service.snapshots >= 2
+        db.close()
+
+
+if __name__ == "__main__":
+    test_save_in_steps()
+    test_snapshot_while_writing()
+    test_periodic_snapshots_skip_unchanged()
+    print("✓ All snapshot tests passed!")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Ligand Summary Test for PandaDOCK
+Verifies triggers keep the best pose and per-ligand summary current
+"""
+
+import random
+
+from backend import DataBackend
+from posebrowser import ligand_leaderboard
+
+INSERT_POSE = "INSERT INTO pose (jid, run, energy, le, actives) VALUES (?,?,?,?,?)"
+
+
+def summaries(db):
+    best = {jid: run for jid, run in db.query("SELECT b.jid, p.run FROM best AS b JOIN pose AS p ON p.id=b.pid")}
+    summary = {row[0]: row[1:] for row in db.query(
+        "SELECT jid, poses, min_energy, best_le, hits FROM ligand_summary")}
+    return best, summary
+
+
+def expected(db):
+    check = DataBackend()
+    check.connect()
+    check.insert_rows(INSERT_POSE, list(db.query("SELECT jid, run, energy, le, actives FROM pose")))
+    check.rebuild_summaries()
+    result = summaries(check)
+    check.close()
+    return result
+
+
+def test_insert_maintains_summary():
+    """Poses streamed in keep best and ligand_summary current"""
+    db = DataBackend()
+    db.connect()
+    db.insert_rows("INSERT INTO jobs (id, ligand) VALUES (?,?)", [(1, "lig1"), (2, "lig2")])
+    db.insert_rows(INSERT_POSE, [
+        (1, 1, -7.0, 0.3, "hydrogen_bond:A:ASP:189"),
+        (1, 2, -8.5, 0.2, None),
+        (1, 3, None, 0.4, "hydrogen_bond:A:ASP:189;pi_stacking:A:PHE:41"),
+        (2, 1, None, None, None),
+    ])
+
+    best, summary = summaries(db)
+    assert best == {1: 2}
+    assert summary == {1: (3, -8.5, 0.4, 2), 2: (1, None, None, 0)}
+
+    db.query(INSERT_POSE, (2, 2, -9.0, 0.1, None))
+    assert ligand_leaderboard(db) == [("lig2", 5, 2, -9.0, 0.1, 0), ("lig1", 2, 3, -8.5, 0.4, 2)]
+    assert [row[0] for row in ligand_leaderboard(db, "le")] == ["lig1", "lig2"]
+    assert [row[0] for row in ligand_leaderboard(db, "hits", limit=1)] == ["lig1"]
+    db.close()
+
+
+def test_updates_and_deletes_match_rebuild():
+    """Random inserts, upserts and deletes give the same tables as a rebuild"""
+    r = random.Random(5)
+    db = DataBackend()
+    db.connect()
+
+    for _ in range(300):
+        action = r.random()
+        jid, run = r.randint(1, 8), r.randint(1, 6)
+        energy = r.choice([None, round(r.uniform(-10, -2), 1), -5.0])
+
+        if action < 0.6:
+            db.query(INSERT_POSE + " ON CONFLICT(jid, run) DO UPDATE SET energy=excluded.energy, le=excluded.le",
+                     (jid, run, energy, r.random(), "x" * r.randint(0, 1)))
+        elif action < 0.8:
+            db.query("UPDATE OR IGNORE pose SET jid=? WHERE jid=? AND run=?", (r.randint(1, 8), jid, run))
+        else:
+            db.query("DELETE FROM pose WHERE jid=? AND run=?", (jid, run))
+
+    assert summaries(db) == expected(db)
+    db.close()
+
+
+def test_existing_poses_are_summarized():
+    """Opening a database written before the triggers fills the tables"""
+    db = DataBackend()
+    db.connect()
+    db.query("DROP TRIGGER pose_insert_summary")
+    db.insert_rows(INSERT_POSE, [(1, 1, -6.0, 0.2, None), (1, 2, -7.0, 0.1, None)])
+    assert db.get_count("best") == 0
+
+    db._create_triggers()
+    assert summaries(db) == ({1: 2}, {1: (2, -7.0, 0.2, 0)})
+    db.close()
+
+
+def test_ties_keep_the_pose_a_rebuild_picks():
+    """On an energy and run tie the trigger keeps the lowest pose id like rebuild_summaries"""
+    db = DataBackend()
+    db.connect()
+    db.insert_rows(INSERT_POSE, [(1, None, -7.0, 0.1, None), (1, None, -7.0, 0.2, None), (1, 1, -7.0, 0.3, None)])
+    assert db.get_one("SELECT pid FROM best WHERE jid=1") == 1
+    assert summaries(db) == expected(db)
+
+    # a trigger of an older version is replaced and the summaries rebuilt
+    db.query("DROP TRIGGER pose_insert_summary")
+    db.query("CREATE TRIGGER pose_insert_summary AFTER INSERT ON pose BEGIN SELECT 1; END")
+    db.query("DELETE FROM best")
+    db._create_triggers()
+    assert db.get_one("SELECT pid FROM best WHERE jid=1") == 1
+    db.close()
+
+
+if __name__ == "__main__":
+    test_insert_maintains_summary()
+    test_updates_and_deletes_match_rebuild()
+    test_existing_poses_are_summarized()
+    test_ties_keep_the_pose_a_rebuild_picks()
+    print("✓ All ligand summary tests passed!")
@@ -13,6 +13,10 @@ from plip.basic import config
 from plip.structure.preparation import PDBComplex
 from plip.visualization.pymol import PyMOLVisualizer
 
+from ligprep import prepare_ligand
+from molcache import MoleculeCache
+from sdfindex import LibraryIndex
+
 __all__ = ['AttrDict', 'draw_gridbox', 'convert_dimension_to_coordinates',
 	'convert_coordinates_to_dimension', 'get_atom_types_from_pdbqt',
 	'get_molecule_center_from_pdbqt', 'time_format', 'convert_pdbqt_to_pdb',
@@ -21,9 +25,12 @@ __all__ = ['AttrDict', 'draw_gridbox', 'convert_dimension_to_coordinates',
 	'interaction_visualize', 'get_dimension_from_pdb', 'load_molecule_from_file',
 	'convert_string_to_pdb', 'memory_format', 'get_molecule_residues', 'sdf_file_parser',
 	'get_sdf_props', 'get_residue_bonds', 'convert_pdbqt_to_pdb_by_adt',
-	'clean_pdb_for_protein', 'compare_versions'
+	'clean_pdb_for_protein', 'compare_versions', 'parse_molecule', 'MOLECULE_CACHE'
 ]
 
+#OBMol objects of the structures the helpers below read, see parse_molecule
+MOLECULE_CACHE = MoleculeCache()
+
 class NewPdbWriter(PdbWriter):
 	def write_string(self, atoms):
 		try:
@@ -117,11 +124,28 @@ def convert_coordinates_to_dimension(points, spacing):
 
 	return (x, y, z, cx, cy, cz)
 
-def get_dimension_from_pdb(pdb_str, spacing):
+def _read_molecule(mol_str, mol_fmt):
 	obc = openbabel.OBConversion()
-	obc.SetInFormat('pdb')
+	obc.SetInFormat(mol_fmt)
 	mol = openbabel.OBMol()
-	obc.ReadString(mol, pdb_str)
+	obc.ReadString(mol, mol_str)
+	return mol
+
+def _write_molecule(mol, mol_fmt):
+	obc = openbabel.OBConversion()
+	obc.SetOutFormat(mol_fmt)
+	return obc.WriteString(mol)
+
+def parse_molecule(mol_str, mol_fmt):
+	"""Return the OBMol of mol_str, parsed once and shared by later calls
+
+	The molecule is cached, it must only be read. Helpers that change a
+	molecule, e.g. load_molecule_from_file callers, parse their own.
+	"""
+	return MOLECULE_CACHE.get(mol_str, mol_fmt, _read_molecule)
+
+def get_dimension_from_pdb(pdb_str, spacing):
+	mol = parse_molecule(pdb_str, 'pdb')
 	atoms = openbabel.OBMolAtomIter(mol)
 
 	x_coords = []
@@ -293,51 +317,11 @@ def convert_pdbqt_to_pdb(pdbqt, as_string=True):
 	return obc.WriteString(mol)
 
 def convert_string_to_pdb(mol_str, mol_fmt):
-	obc = openbabel.OBConversion()
-	obc.SetInAndOutFormats(mol_fmt, 'pdb')
-	mol = openbabel.OBMol()
-	obc.ReadString(mol, mol_str)
-	return obc.WriteString(mol)
+	return _write_molecule(parse_molecule(mol_str, mol_fmt), 'pdb')
 
 def convert_other_to_pdbqt(infile, informat, outfile):
-	obc = openbabel.OBConversion()
-	obc.SetInAndOutFormats(informat, "pdbqt")
-	mol = openbabel.OBMol()
-	obc.ReadFile(mol, infile)
-
-	non_bond = 0
-
-	for atom in openbabel.OBMolAtomIter(mol):
-		flag = 0
-		for bond in openbabel.OBAtomBondIter(atom):
-			flag = 1
-			break
-
-		if flag == 0:
-			non_bond += 1
-			
-
-	print(non_bond)
-
-
-	#correct for ph
-	mol.CorrectForPH()
-
-	#add hydrogens
-	mol.AddHydrogens()
-	#mol.AddPolarHydrogens()
-
-	cmodel = openbabel.OBChargeModel.FindType('gasteiger')
-	cmodel.ComputeCharges(mol)
-
-	#set to be rigid
-	obc.AddOption('r')
-	obc.AddOption('x')
-	#obc.AddOption('h')
-	obc.AddOption('b')
-	obc.AddOption('p')
-
-	obc.WriteFile(mol, outfile)
+	info = prepare_ligand(infile, outfile, informat, 'pdbqt')
+	print(info['non_bonded'])
 
 def load_molecule_from_file(mol_file, mol_format):
 	obc = openbabel.OBConversion()
@@ -470,17 +454,15 @@ def get_molecule_information(mol_file, from_string=False, mol_name=None, mol_for
 		out_format = 'pdb'
 		mol_content = None
 
-	obc = openbabel.OBConversion()
-	obc.SetInAndOutFormats(mol_format, out_format)
-	mol = openbabel.OBMol()
-
 	if from_string:
-		obc.ReadString(mol, mol_file)
+		mol = parse_molecule(mol_file, mol_format)
+	elif mol_content is not None:
+		mol = parse_molecule(mol_content, mol_format)
 	else:
-		obc.ReadFile(mol, mol_file)
+		mol = load_molecule_from_file(mol_file, mol_format)
 
 	if mol_content is None:
-		mol_content = obc.WriteString(mol)
+		mol_content = _write_molecule(mol, out_format)
 	
 	descriptor = openbabel.OBDescriptor.FindType('logP')
 	log_p = descriptor.Predict(mol)
@@ -501,20 +483,14 @@ def get_molecule_information(mol_file, from_string=False, mol_name=None, mol_for
 	)
 
 def get_molecule_residues(mol_str, mol_fmt):
-	obc = openbabel.OBConversion()
-	obc.SetInFormat(mol_fmt)
-	mol = openbabel.OBMol()
-	obc.ReadString(mol, mol_str)
+	mol = parse_molecule(mol_str, mol_fmt)
 
 	for res in openbabel.OBResidueIter(mol):
 		yield (str(res.GetIdx()), res.GetChain(), res.GetName(),
 			str(res.GetNum()), str(res.GetNumAtoms()))
 
 def get_residue_bonds(mol_str, mol_fmt, res_idx):
-	obc = openbabel.OBConversion()
-	obc.SetInFormat(mol_fmt)
-	mol = openbabel.OBMol()
-	obc.ReadString(mol, mol_str)
+	mol = parse_molecule(mol_str, mol_fmt)
 
 	for bond in openbabel.OBMolBondIter(mol):
 		begin_atom = bond.GetBeginAtom()
@@ -541,10 +517,7 @@ def ligand_efficiency_assessment(pdb_str, energy, ki=None):
 		logki = convert_ki_to_log(ki)
 
 	if pdb_str:
-		obc = openbabel.OBConversion()
-		obc.SetInFormat("pdb")
-		mol = openbabel.OBMol()
-		obc.ReadString(mol, pdb_str)
+		mol = parse_molecule(pdb_str, 'pdb')
 		ha = mol.NumHvyAtoms()
 		mw = mol.GetMolWt()
 
@@ -575,7 +548,19 @@ def ligand_efficiency_assessment(pdb_str, energy, ki=None):
 	else:
 		return (logki, None, None, None, None, None, ki)
 
+def _interaction_atoms(atoms):
+	return ','.join(str(x) for x in atoms)
+
 def get_complex_interactions(poses, work_dir, active_sites):
+	"""Analyze the complex of every pose with PLIP
+
+	The last item of every pose is the complex text, the semicolon joined
+	active site interactions found in it are appended to the pose. Returns
+	rows for the tables of backend.INTERACTION_TABLES with numbers stored
+	as numbers and flags as 0/1. binding_site rows are [None, i, site] for
+	poses[i] and the second item of an interaction row is the index of its
+	binding site row, interactions.save_interactions turns both into ids.
+	"""
 	interactions = {
 		'binding_site': [],
 		'hydrogen_bond': [],
@@ -601,21 +586,19 @@ def get_complex_interactions(poses, work_dir, active_sites):
 		mol.analyze()
 
 		for site in mol.interaction_sets:
+			bid = len(interactions['binding_site'])
 			interactions['binding_site'].append([None, i, site])
 			s = mol.interaction_sets[site]
 
-			site = "{}:{}".format(i, site)
-
-			#hydrogen bonds
-			for hb in s.hbonds_pdon + s.hbonds_ldon:
-				residue = "{}:{}:{}".format(hb.reschain, hb.restype, hb.resnr)
+			def add(table, obj, values):
+				residue = "{}:{}:{}".format(obj.reschain, obj.restype, obj.resnr)
 
 				if residue in active_sites:
 					is_active_site = 1
-					interact = "hydrogen_bond:{}".format(residue)
+					interact = "{}:{}".format(table, residue)
 
 					if poses[i][-1]:
-						if interact not in poses[i][-1]:
+						if interact not in poses[i][-1].split(';'):
 							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
 
 					else:
@@ -624,232 +607,102 @@ def get_complex_interactions(poses, work_dir, active_sites):
 				else:
 					is_active_site = 0
 
-				interactions['hydrogen_bond'].append([None, site,
-					hb.reschain, hb.resnr, hb.restype,
-					"{:.2}".format(hb.distance_ah),
-					"{:.2}".format(hb.distance_ad),
-					"{:.2}".format(hb.angle),
-					'Yes' if hb.protisdon else 'No',
-					'Yes' if hb.sidechain else 'No',
-					"{} [{}]".format(hb.d_orig_idx, hb.dtype),
-					"{} [{}]".format(hb.a_orig_idx, hb.atype),
-					is_active_site
+				interactions[table].append([None, bid, obj.reschain, obj.resnr, obj.restype]
+					+ values + [is_active_site])
+
+			#hydrogen bonds
+			for hb in s.hbonds_pdon + s.hbonds_ldon:
+				add('hydrogen_bond', hb, [
+					hb.distance_ah,
+					hb.distance_ad,
+					hb.angle,
+					int(hb.protisdon),
+					int(hb.sidechain),
+					hb.d_orig_idx, hb.dtype,
+					hb.a_orig_idx, hb.atype
 				])
 
 			#hydrophobic interactions
 			for hc in s.hydrophobic_contacts:
-				residue = "{}:{}:{}".format(hc.reschain, hc.restype, hc.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "hydrophobic_interaction:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
-				interactions['hydrophobic_interaction'].append([None, site,
-					hc.reschain, hc.resnr, hc.restype,
-					"{:.2}".format(hc.distance),
+				add('hydrophobic_interaction', hc, [
+					hc.distance,
 					hc.ligatom_orig_idx,
-					hc.bsatom_orig_idx,
-					is_active_site
+					hc.bsatom_orig_idx
 				])
 
 			#water bridges
 			for wb in s.water_bridges:
-				residue = "{}:{}:{}".format(wb.reschain, wb.restype, wb.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "water_bridge:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
-				interactions['water_bridge'].append([None, site,
-					wb.reschain, wb.resnr, wb.restype,
-					"{:.2}".format(wb.distance_aw),
-					"{:.2}".format(wb.distance_dw),
-					"{:.2}".format(wb.d_angle),
-					"{:.2}".format(wb.w_angle),
-					'Yes' if wb.protisdon else 'No',
-					"{} [{}]".format(wb.d_orig_idx, wb.dtype),
-					"{} [{}]".format(wb.a_orig_idx, wb.atype),
-					wb.water_orig_idx,
-					is_active_site
+				add('water_bridge', wb, [
+					wb.distance_aw,
+					wb.distance_dw,
+					wb.d_angle,
+					wb.w_angle,
+					int(wb.protisdon),
+					wb.d_orig_idx, wb.dtype,
+					wb.a_orig_idx, wb.atype,
+					wb.water_orig_idx
 				])
 
 			#salt bridges
 			for sb in s.saltbridge_lneg + s.saltbridge_pneg:
-				residue = "{}:{}:{}".format(sb.reschain, sb.restype, sb.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "salt_bridge:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
 				if sb.protispos:
 					group = sb.negative.fgroup
-					ligand_atom_ids = ','.join(str(x) for x in sb.negative.atoms_orig_idx)
-					protein_atom_ids = ','.join(str(x) for x in sb.positive.atoms_orig_idx)
+					ligand_atom_ids = _interaction_atoms(sb.negative.atoms_orig_idx)
 				else:
 					group = sb.positive.fgroup
-					ligand_atom_ids = ','.join(str(x) for x in sb.positive.atoms_orig_idx)
-					protein_atom_ids = ','.join(str(x) for x in sb.negative.atoms_orig_idx)
+					ligand_atom_ids = _interaction_atoms(sb.positive.atoms_orig_idx)
 
-				interactions['salt_bridge'].append([None, site,
-					sb.reschain, sb.resnr, sb.restype,
-					"{:.2}".format(sb.distance),
-					'Yes' if sb.protispos else 'No',
+				add('salt_bridge', sb, [
+					sb.distance,
+					int(sb.protispos),
 					group.capitalize(),
-					ligand_atom_ids,
-					is_active_site
-					#protein_atom_ids
+					ligand_atom_ids
 				])
 
 			#pi-stacking
 			for ps in s.pistacking:
-				residue = "{}:{}:{}".format(ps.reschain, ps.restype, ps.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "pi_stacking:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
-				interactions['pi_stacking'].append([None, site,
-					ps.reschain, ps.resnr, ps.restype,
-					"{:.2}".format(ps.distance),
-					"{:.2}".format(ps.angle),
-					"{:.2}".format(ps.offset),
+				add('pi_stacking', ps, [
+					ps.distance,
+					ps.angle,
+					ps.offset,
 					ps.type,
-					','.join(str(x) for x in ps.ligandring.atoms_orig_idx),
-					is_active_site
-					#','.join(str(x) for x in ps.proteinring.atoms_orig_idx)
+					_interaction_atoms(ps.ligandring.atoms_orig_idx)
 				])
 
 			#pi-cation
 			for pc in s.pication_laro + s.pication_paro:
-				residue = "{}:{}:{}".format(pc.reschain, pc.restype, pc.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "pi_cation:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
 				if pc.protcharged:
-					ligand_atom_ids = ','.join(str(x) for x in pc.ring.atoms_orig_idx)
-					protein_atom_ids = ','.join(str(x) for x in pc.charge.atoms_orig_idx)
+					ligand_atom_ids = _interaction_atoms(pc.ring.atoms_orig_idx)
 					group = 'Aromatic'
 				else:
-					ligand_atom_ids = ','.join(str(x) for x in pc.charge.atoms_orig_idx)
-					protein_atom_ids = ','.join(str(x) for x in pc.ring.atoms_orig_idx)
+					ligand_atom_ids = _interaction_atoms(pc.charge.atoms_orig_idx)
 					group = pc.charge.fgroup
 
-				interactions['pi_cation'].append([None, site,
-					pc.reschain, pc.resnr, pc.restype,
-					"{:.2}".format(pc.distance),
-					"{:.2}".format(pc.offset),
-					'Yes' if pc.protcharged else 'No',
+				add('pi_cation', pc, [
+					pc.distance,
+					pc.offset,
+					int(pc.protcharged),
 					group.capitalize(),
-					ligand_atom_ids,
-					is_active_site
-					#protein_atom_ids
+					ligand_atom_ids
 				])
 
 			#halogen bonds
 			for ha in s.halogen_bonds:
-				residue = "{}:{}:{}".format(ha.reschain, ha.restype, ha.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "halogen_bond:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
-				interactions['halogen_bond'].append([None, site,
-					ha.reschain, ha.resnr, ha.restype,
-					"{:.2}".format(ha.distance),
-					"{:.2}".format(ha.don_angle),
-					"{:.2}".format(ha.acc_angle),
-					"{} [{}]".format(ha.don_orig_idx, ha.donortype),
-					"{} [{}]".format(ha.acc_orig_idx, ha.acctype),
-					is_active_site
+				add('halogen_bond', ha, [
+					ha.distance,
+					ha.don_angle,
+					ha.acc_angle,
+					ha.don_orig_idx, ha.donortype,
+					ha.acc_orig_idx, ha.acctype
 				])
 
 			#metal complexes
 			for mc in s.metal_complexes:
-				residue = "{}:{}:{}".format(mc.reschain, mc.restype, mc.resnr)
-
-				if residue in active_sites:
-					is_active_site = 1
-					interact = "metal_complex:{}".format(residue)
-
-					if poses[i][-1]:
-						if interact not in poses[i][-1]:
-							poses[i][-1] = "{};{}".format(poses[i][-1], interact)
-
-					else:
-						poses[i][-1] = interact
-
-				else:
-					is_active_site = 0
-
-				interactions['metal_complex'].append([None, site,
-					mc.reschain, mc.resnr, mc.restype,
-					"{} [{}]".format(mc.metal_orig_idx, mc.metal_type),
-					"{} [{}]".format(mc.target_orig_idx, mc.target_type),
-					"{:.2}".format(mc.distance),
-					mc.location,
-					is_active_site
+				add('metal_complex', mc, [
+					mc.metal_orig_idx, mc.metal_type,
+					mc.target_orig_idx, mc.target_type,
+					mc.distance,
+					mc.location
 				])
 
 	return interactions
@@ -951,12 +804,9 @@ def sdf_file_parser(sdf_file, name_prop):
 		yield (name, content)
 
 def get_sdf_props(sdf_file):
-	suppl = Chem.SDMolSupplier(sdf_file, sanitize=False,
-		removeHs=False, strictParsing=False)
-
-	for mol in suppl:
-		if mol:
-			return mol.GetPropNames()
+	#data item names of all records, read from the library index
+	with LibraryIndex.open(sdf_file) as index:
+		return index.property_names()
 
 def clean_pdb_for_protein(pdb_file):
 	std_residues = [